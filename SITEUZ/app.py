@@ -1,10 +1,50 @@
 import streamlit as st
+import numpy as np
 import os
 import shutil
 import json
+import logging
 import base64
+import functools
+import threading
+import tempfile
+import contextlib
+import atexit
+import hashlib
+import hmac
+import stat
+import sqlite3
+import math
+import collections
+import re
+import random
+import bisect
+import uuid
+import queue
+import time
+import glob
+import gzip
+import mmap
+import zipfile
+import email.utils
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timedelta, timezone
 
+import content_extract
+import storage
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog bo'lmasa papkalar vaqti-vaqti bilan tekshiriladi
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger('siteuz')
+
 # 1. Konfiguratsiya va Papka yaratish
 # Fayllar saqlanadigan papka nomi
 UPLOAD_FOLDER = 'yuklangan_fayllar'
@@ -13,59 +53,468 @@ UPLOAD_FOLDER = 'yuklangan_fayllar'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
-# Reklama ma'lumotlarini saqlash uchun fayl
+# Fayllar tarkibi (SHA-256) bo'yicha bir martadan saqlanadigan ombor.
+# Papkalardagi fayllar shu yerdagi nusxaga hardlink bo'ladi.
+BLOB_FOLDER = 'blob_ombori'
+
+# Izohlar, statistika va reklama saqlanadigan SQLite baza
+DB_FILE = 'baza.sqlite3'
+
+# Eski JSON fayllar (birinchi ishga tushishda bazaga ko'chiriladi)
 AD_FILE = 'reklama.json'
 SECRETS_FILE = 'admin_secrets.json'
 METADATA_FILE = 'file_metadata.json'
 STATS_FILE = 'download_stats.json'
+VIEWS_FILE = 'view_stats.json'
+
+# Yuklashlar hisoblagichi diskka shu oraliqda (soniya) yoki shuncha
+# yuklash yig'ilganda yoziladi
+STATS_FLUSH_INTERVAL = 5
+STATS_FLUSH_THRESHOLD = 50
+
+# Qidiruv: natijalar soni, trigram o'xshashlik chegarasi (xatoliklarga
+# chidamlilik) va yuklashlar sonining reytingdagi ulushi
+SEARCH_LIMIT = 50
+SEARCH_MIN_SIMILARITY = 0.4
+SEARCH_DOWNLOAD_WEIGHT = 0.15
+
+# Ko'rish va yuklash voqealari jurnali: qatorlar faylga qo'shiladi, fon
+# jarayoni ularni EVENT_ROLLUP_INTERVAL da soatlik/kunlik yig'indilarga
+# aylantiradi. Jurnal EVENT_LOG_MAX_BYTES dan oshsa aylantiriladi, qayta
+# ishlangan qismlar kunlik arxivga (ixtiyoriy gzip) qo'shiladi.
+EVENT_LOG_FOLDER = 'voqealar_jurnali'
+EVENT_LOG_MAX_BYTES = 4 * 1024 * 1024
+EVENT_LOG_COMPRESS = True
+EVENT_LOG_KEEP_DAYS = 30
+EVENT_ROLLUP_INTERVAL = 60
+# Aylantirilgan qism boshqa jarayonlar yozib bo'lishi uchun shuncha soniya kutadi
+EVENT_ROTATE_GRACE = 5
+# Soatlik yig'indilar shuncha kun saqlanadi (kunliklari doimiy)
+ROLLUP_HOURLY_DAYS = 14
+
+# Fayl ichidagi matnni indekslovchi fon jarayonlari soni
+CONTENT_INDEX_WORKERS = 2
+
+# Fayl ko'rinishlari (birinchi sahifa rasmi va matndan parcha) fon
+# jarayonlarida tayyorlanadi va tarkib xeshi bo'yicha diskda saqlanadi
+PREVIEW_FOLDER = 'korinish_keshi'
+PREVIEW_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PREVIEW_WORKERS = 2
+PREVIEW_IMAGE_WIDTH = 320
+PREVIEW_EXCERPT_CHARS = 500
+
+# Ro'yxatlarni sahifalash va saralash
+PAGE_SIZES = (20, 50, 100)
+LISTING_SORTS = ('name', 'size', 'mtime', 'downloads')
+# Xotirada saqlanadigan saralangan papka ro'yxatlari soni
+LISTING_CACHE_SIZE = 256
+
+# Xotirada doimiy yangilanib turadigan "eng ko'p yuklanganlar" ro'yxati hajmi
+TOP_K = 50
+
+# Ko'p yuklanadigan fayllar baytlari xotirada (LRU/LFU) saqlanadi. Kesh
+# HOT_CACHE_MAX_BYTES dan oshmaydi, HOT_CACHE_MAX_FILE dan katta fayllar
+# keshlanmaydi, HOT_CACHE_MMAP_MIN dan kattalari nusxalanmay mmap qilinadi.
+# Ishga tushganda eng ko'p yuklangan HOT_CACHE_SEED ta fayl oldindan olinadi.
+HOT_CACHE_MAX_BYTES = int(os.environ.get('SITEUZ_HOT_CACHE_MB', '256')) * 1024 * 1024
+HOT_CACHE_MAX_FILE = 64 * 1024 * 1024
+HOT_CACHE_MMAP_MIN = 4 * 1024 * 1024
+HOT_CACHE_SEED = 20
+# So'rovlar soni shuncha fayl uchun kuzatiladi (oshsa hammasi yarmiga tushadi)
+HOT_CACHE_MAX_TRACKED = 4096
+
+# Sozlamalar (reklama, admin ma'lumotlari) xotirada saqlanadi; boshqa
+# jarayonlardagi o'zgarishlar ko'pi bilan shuncha soniyada ko'rinadi
+SETTINGS_REFRESH_INTERVAL = 2
+# Reklama muddati rejalashtiruvchisi boshqa jarayonlar saqlagan reklamani
+# shu oraliqda qayta tekshiradi
+AD_CHECK_INTERVAL = 60
+
+# Tashqaridan (rsync/scp) qo'shilgan fayllarni kuzatish: hodisalar shuncha
+# soniya tinchlikdan keyin (lekin ko'pi bilan WATCH_MAX_DELAY da) qayta
+# ishlanadi; inotify bo'lmasa papkalar WATCH_POLL_INTERVAL da tekshiriladi
+WATCH_DEBOUNCE = 1.0
+WATCH_MAX_DELAY = 10
+WATCH_POLL_INTERVAL = 30
+
+# Yuklash: diskka bo'laklab yoziladi, bir nechta fayl parallel saqlanadi
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_WORKERS = 4
+# Yozilayotgan fayllar shu qo'shimcha bilan vaqtinchalik saqlanadi
+PARTIAL_SUFFIX = '.part'
+
+# Papkani ZIP qilib yuklash: tayyor arxivlar diskda saqlanadi va umumiy
+# hajmi ZIP_CACHE_MAX_BYTES dan oshsa eng uzoq ishlatilmaganlari o'chiriladi
+ZIP_CACHE_FOLDER = 'zip_keshi'
+ZIP_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Yuklab olish serveri bo'lmasa arxiv st.download_button orqali butunlay
+# xotiraga o'qib beriladi - shundan katta papkalar uchun tugma chiqmaydi
+ZIP_INLINE_MAX_BYTES = int(os.environ.get('SITEUZ_ZIP_INLINE_MB', '200')) * 1024 * 1024
+# Allaqachon siqilgan formatlar arxivga qayta siqilmasdan (stored) qo'shiladi
+ZIP_STORED_EXTS = {
+    '.docx', '.pptx', '.xlsx', '.pdf', '.zip', '.rar', '.7z', '.gz',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp3', '.mp4', '.avi', '.mkv'
+}
+
+# Fayllar Streamlit websocket i o'rniga shu HTTP server orqali beriladi
+# (ETag, 304, Range, sendfile). Server faqat SITEUZ_DOWNLOAD_URL berilganda
+# ishlaydi: bu brauzer ko'radigan manzil (odatda teskari proksi ortidagi yo'l).
+# Aks holda fayllar odatdagidek st.download_button orqali beriladi.
+DOWNLOAD_BASE_URL = os.environ.get('SITEUZ_DOWNLOAD_URL', '')
+DOWNLOAD_SERVER_ENABLED = bool(DOWNLOAD_BASE_URL) and os.environ.get('SITEUZ_DOWNLOAD_SERVER', '1') != '0'
+DOWNLOAD_SERVER_HOST = os.environ.get('SITEUZ_DOWNLOAD_HOST', '127.0.0.1')
+DOWNLOAD_SERVER_PORT = int(os.environ.get('SITEUZ_DOWNLOAD_PORT', '8502'))
+DOWNLOAD_CACHE_MAX_AGE = 3600
+# Fayl shu hajmdagi bo'laklab yuboriladi (uzilganda nechta bayt yetganini bilish uchun)
+DOWNLOAD_SEND_CHUNK = 8 * 1024 * 1024
+# Qismlab yuklanayotgan (hali to'liq yetkazilmagan) fayllar soni chegarasi
+DOWNLOAD_TRACK_MAX = 4096
+# Server teskari proksi ortida bo'lsa '1': mijoz manzili proksi X-Forwarded-For
+# ga qo'shgan oxirgi yozuvdan olinadi (aks holda sarlavhaga ishonilmaydi)
+DOWNLOAD_TRUST_PROXY = os.environ.get('SITEUZ_TRUST_PROXY', '0') == '1'
+
+# Kutubxona ombori: 'local' (standart) yoki 's3' (AWS S3, MinIO va boshqa
+# S3 ga mos omborlar). S3 rejimida UPLOAD_FOLDER ombordan o'qish keshi bo'lib
+# qoladi va bir nechta server bitta kutubxonani bo'lishadi: boshqa serverlardagi
+# o'zgarishlar har STORAGE_SYNC_INTERVAL soniyada olinadi. Kirish kalitlari
+# boto3 ning odatiy manbalaridan (AWS_ACCESS_KEY_ID va h.k.) o'qiladi.
+STORAGE_BACKEND = os.environ.get('SITEUZ_STORAGE', 'local')
+STORAGE_S3_BUCKET = os.environ.get('SITEUZ_S3_BUCKET', '')
+STORAGE_S3_PREFIX = os.environ.get('SITEUZ_S3_PREFIX', '')
+# MinIO uchun masalan: http://minio:9000
+STORAGE_S3_ENDPOINT = os.environ.get('SITEUZ_S3_ENDPOINT', '')
+STORAGE_S3_REGION = os.environ.get('SITEUZ_S3_REGION', '')
+STORAGE_SYNC_INTERVAL = 30
+
+# Izoh, statistika va indeks jadvallaridagi yetim yozuvlar shu oraliqda
+# (soniya) tozalanadi; admin panelidan istalgan paytda ham ishga tushiriladi
+COMPACT_INTERVAL = 24 * 3600
+# Tarkibi bir xil bo'lmagan bir nechta nomzodli (qaysi biriga ko'chgani noma'lum)
+# yetim yozuvlar shuncha kun saqlanadi, keyin o'chiriladi
+ORPHAN_HOLD_DAYS = 30
+
+# Profil: har bir rerun shu ehtimol bilan o'lchanadi (0 - o'chiq, 1 - hammasi).
+# O'lchanmagan rerun da yordamchi funksiyalar qo'shimcha ish qilmaydi.
+METRICS_SAMPLE_RATE = float(os.environ.get('SITEUZ_METRICS_SAMPLE', '1.0'))
+# Prometheus matn formatidagi metrikalar shu faylga yoziladi. Yuklab olish
+# serverining /metrics yo'li faqat SITEUZ_METRICS_TOKEN berilganda ochiq
+# ("Authorization: Bearer <token>" sarlavhasi bilan).
+METRICS_FILE = 'metrics.prom'
+METRICS_TOKEN = os.environ.get('SITEUZ_METRICS_TOKEN', '')
+METRICS_EXPORT_INTERVAL = 15
+# Vaqt gistogrammasi chegaralari (soniya)
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+# Rerun soni kuzatiladigan sessiyalar soni
+METRICS_MAX_SESSIONS = 1000
+
+# Soat va reklama fragmenti shu oraliqda (soniya) o'zi yangilanadi
+HEADER_REFRESH_INTERVAL = 60
 
 # Sahifa sozlamalari
 st.set_page_config(page_title="Toshmi Baza Websayt", layout="wide", initial_sidebar_state="auto")
 
 # 2. Yordamchi funksiyalar
-def save_uploaded_file(uploaded_file, path):
+
+# --- O'lchovlar: vaqt oraliqlari, hisoblagichlar, Prometheus eksporti ---
+# Joriy rerun o'lchanayotgani (oqim bo'yicha): on, active, state, section, started
+_sampling = threading.local()
+
+@st.cache_resource
+def _metrics():
+    """Metrikalar ombori (barcha sessiyalar uchun umumiy)"""
+    state = {
+        "lock": threading.Lock(), "spans": {}, "counters": collections.Counter(),
+        "sessions": collections.OrderedDict(), "sample_rate": METRICS_SAMPLE_RATE
+    }
+    threading.Thread(target=_metrics_export_loop, args=(state,), daemon=True).start()
+    return state
+
+def _record_span(state, name, seconds):
+    """Bitta o'lchovni gistogrammaga qo'shish"""
+    with state["lock"]:
+        span = state["spans"].get(name)
+        if span is None:
+            span = state["spans"][name] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(METRICS_BUCKETS)}
+        span["count"] += 1
+        span["sum"] += seconds
+        span["max"] = max(span["max"], seconds)
+        index = bisect.bisect_left(METRICS_BUCKETS, seconds)
+        if index < len(METRICS_BUCKETS):
+            span["buckets"][index] += 1
+
+def timed(fn):
+    """Yordamchi funksiya vaqtini o'lchash (faqat o'lchanayotgan rerun da)"""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not getattr(_sampling, 'on', False):
+            return fn(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _record_span(_sampling.state, name, time.perf_counter() - started)
+    return wrapper
+
+def section(name):
+    """Sahifaning navbatdagi qismi boshlandi (oldingi qism vaqti yoziladi)"""
+    if not getattr(_sampling, 'on', False):
+        return
+    now = time.perf_counter()
+    if _sampling.section:
+        _record_span(_sampling.state, _sampling.section, now - _sampling.section_started)
+    _sampling.section, _sampling.section_started = name, now
+
+def count(name, value=1):
+    """Hisoblagichni oshirish (fayl ochish, o'qilgan baytlar va h.k.)"""
+    state = _metrics()
+    with state["lock"]:
+        state["counters"][name] += value
+
+@contextlib.contextmanager
+def profile_rerun(span='rerun', counter='reruns_total'):
+    """Butun rerun (yoki bitta fragment): sessiya hisoblagichi va (tanlansa) qismlar vaqti"""
+    state = _metrics()
+    session_id = st.session_state.setdefault('metrics_session', uuid.uuid4().hex)
+    with state["lock"]:
+        state["counters"][counter] += 1
+        sessions = state["sessions"]
+        sessions[session_id] = sessions.get(session_id, 0) + 1
+        sessions.move_to_end(session_id)
+        while len(sessions) > METRICS_MAX_SESSIONS:
+            sessions.popitem(last=False)
+    _sampling.on = random.random() < state["sample_rate"]
+    _sampling.state, _sampling.section, _sampling.active = state, None, True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _sampling.on:
+            section(None)
+            _record_span(state, span, time.perf_counter() - started)
+            count('reruns_sampled_total')
+        _sampling.on = _sampling.active = False
+
+def fragment(name, run_every=None):
+    """st.fragment + o'lchov: to'liq rerun da sahifa qismi sifatida, fragmentning
+    o'zi qayta ishlaganda esa alohida 'fragment.<nom>' sifatida yoziladi"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def body(*args, **kwargs):
+            if getattr(_sampling, 'active', False):
+                section(f'render.{name}')
+                return fn(*args, **kwargs)
+            with profile_rerun(f'fragment.{name}', 'fragment_reruns_total'):
+                return fn(*args, **kwargs)
+        return st.fragment(body, run_every=run_every)
+    return decorator
+
+def metrics_snapshot():
+    """Diagnostika paneli uchun: (qismlar, hisoblagichlar, sessiyalar) nusxasi"""
+    state = _metrics()
+    with state["lock"]:
+        spans = {name: dict(span, buckets=list(span["buckets"])) for name, span in state["spans"].items()}
+        return spans, dict(state["counters"]), dict(state["sessions"])
+
+def set_sample_rate(rate):
+    """O'lchash ehtimolini o'zgartirish (barcha sessiyalar uchun)"""
+    _metrics()["sample_rate"] = rate
+
+def reset_metrics():
+    """Vaqt o'lchovlarini tozalash"""
+    state = _metrics()
+    with state["lock"]:
+        state["spans"].clear()
+
+def render_prometheus():
+    """Metrikalar Prometheus matn formatida"""
+    spans, counters, sessions = metrics_snapshot()
+    lines = [
+        "# HELP siteuz_span_seconds Yordamchi funksiyalar va sahifa qismlari vaqti",
+        "# TYPE siteuz_span_seconds histogram",
+    ]
+    for name, span in sorted(spans.items()):
+        cumulative = 0
+        for bound, bucket in zip(METRICS_BUCKETS, span["buckets"]):
+            cumulative += bucket
+            lines.append(f'siteuz_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'siteuz_span_seconds_bucket{{span="{name}",le="+Inf"}} {span["count"]}')
+        lines.append(f'siteuz_span_seconds_sum{{span="{name}"}} {span["sum"]:.6f}')
+        lines.append(f'siteuz_span_seconds_count{{span="{name}"}} {span["count"]}')
+    for name, value in sorted(counters.items()):
+        lines.append(f"# TYPE siteuz_{name} counter")
+        lines.append(f"siteuz_{name} {value}")
+    lines += [
+        "# TYPE siteuz_sessions gauge",
+        f"siteuz_sessions {len(sessions)}",
+        "# TYPE siteuz_sample_rate gauge",
+        f"siteuz_sample_rate {_metrics()['sample_rate']}",
+    ]
+    hot_entries, hot_bytes = hot_cache_stats()
+    lines += [
+        "# TYPE siteuz_hot_cache_entries gauge",
+        f"siteuz_hot_cache_entries {hot_entries}",
+        "# TYPE siteuz_hot_cache_bytes gauge",
+        f"siteuz_hot_cache_bytes {hot_bytes}",
+    ]
+    return "\n".join(lines) + "\n"
+
+def render_diagnostics(txt):
+    """Admin uchun diagnostika: qismlar vaqti, hisoblagichlar, sessiyalar"""
+    state = _metrics()
+    rate = st.slider(txt['diag_sample_rate'], 0.0, 1.0, value=float(state["sample_rate"]), step=0.05)
+    if rate != state["sample_rate"]:
+        set_sample_rate(rate)
+    spans, counters, sessions = metrics_snapshot()
+    if spans:
+        rows = sorted(spans.items(), key=lambda item: -item[1]["sum"])
+        st.dataframe([
+            {
+                txt['diag_span']: name, txt['diag_calls']: span["count"],
+                txt['diag_avg_ms']: round(span["sum"] / span["count"] * 1000, 2),
+                txt['diag_max_ms']: round(span["max"] * 1000, 2), txt['diag_total_s']: round(span["sum"], 3)
+            }
+            for name, span in rows
+        ], use_container_width=True, hide_index=True)
+    st.dataframe(
+        [{txt['diag_counter']: name, txt['diag_value']: value} for name, value in sorted(counters.items())],
+        use_container_width=True, hide_index=True
+    )
+    busiest = sorted(sessions.values(), reverse=True)[:5]
+    st.caption(f"{txt['diag_sessions']}: {len(sessions)} · {txt['diag_busiest']}: {busiest}")
+    hot_entries, hot_bytes = hot_cache_stats()
+    hits, misses = counters.get('hot_cache_hits_total', 0), counters.get('hot_cache_misses_total', 0)
+    hit_ratio = hits / (hits + misses) if hits + misses else 0.0
+    st.caption(
+        f"{txt['diag_hot_cache']}: {hot_entries} · {format_size(hot_bytes)} / "
+        f"{format_size(HOT_CACHE_MAX_BYTES)} · {hit_ratio:.0%}"
+    )
+    st.button(txt['diag_reset'], on_click=reset_metrics)
+
+def _metrics_export_loop(state):
+    """Metrikalarni vaqti-vaqti bilan faylga yozish"""
+    while True:
+        time.sleep(METRICS_EXPORT_INTERVAL)
+        try:
+            text = render_prometheus()
+            with open(METRICS_FILE + PARTIAL_SUFFIX, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(METRICS_FILE + PARTIAL_SUFFIX, METRICS_FILE)
+        except Exception:
+            pass
+
+@timed
+def save_uploaded_file(uploaded_file, path, progress=None):
     """Yuklangan faylni papkaga saqlash funksiyasi"""
+    # Fayl bo'laklab vaqtinchalik faylga yoziladi, xesh yozish davomida
+    # hisoblanadi; so'ng tarkib omboriga qo'yilib, asl nomi unga bog'lanadi.
+    # Natija: {"name", "path", "size", "sha256", "duplicates"} yoki None
+    file_path = os.path.join(path, uploaded_file.name)
     try:
-        file_path = os.path.join(path, uploaded_file.name)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        return True
-    except Exception as e:
-        return False
+        fd, tmp_path = tempfile.mkstemp(dir=path, prefix='.' + uploaded_file.name, suffix=PARTIAL_SUFFIX)
+    except OSError:
+        return None
+    digest = hashlib.sha256()
+    total = getattr(uploaded_file, 'size', 0)
+    written = 0
+    try:
+        uploaded_file.seek(0)
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = uploaded_file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+                if progress:
+                    progress(written, total)
+            f.flush()
+            os.fsync(f.fileno())
+        sha256 = digest.hexdigest()
+        duplicates = store_blob(tmp_path, sha256, written, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    _storage_put(file_path)
+    catalog_update(file_path)
+    return {"name": uploaded_file.name, "path": file_path, "size": written, "sha256": sha256, "duplicates": duplicates}
+
+def save_uploaded_files(uploaded_files, path, on_progress=None):
+    """Bir nechta faylni cheklangan oqimlar havzasida parallel saqlash"""
+    # on_progress({nom: 0..1}) asosiy oqimdan chaqiriladi (Streamlit elementlari uchun)
+    progress = {f.name: 0.0 for f in uploaded_files}
+    lock = threading.Lock()
+
+    def report(name, written, total):
+        with lock:
+            progress[name] = written / total if total else 1.0
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+        futures = [
+            pool.submit(save_uploaded_file, f, path, functools.partial(report, f.name))
+            for f in uploaded_files
+        ]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.2)
+            if on_progress:
+                with lock:
+                    snapshot = dict(progress)
+                on_progress(snapshot)
+    return [future.result() for future in futures]
 
+def _is_partial(name):
+    """Yozilayotgan vaqtinchalik yuklash fayli"""
+    return name.startswith('.') and name.endswith(PARTIAL_SUFFIX)
+
+@timed
 def get_content(path):
     """Papkadagi fayl va papkalarni olish"""
     try:
         items = os.listdir(path)
         folders = [f for f in items if os.path.isdir(os.path.join(path, f))]
-        files = [f for f in items if os.path.isfile(os.path.join(path, f))]
+        files = [f for f in items if os.path.isfile(os.path.join(path, f)) and not _is_partial(f)]
         return folders, files
     except:
         return [], []
 
+def format_size(size):
+    """Baytlarni MB ko'rinishida yozish"""
+    return f"{size / (1024 * 1024):.2f} MB"
+
+@timed
 def get_file_size(file_path):
     """Fayl hajmini MB da olish"""
     try:
-        size = os.path.getsize(file_path)
-        return f"{size / (1024 * 1024):.2f} MB"
+        return format_size(os.path.getsize(file_path))
     except:
         return "0.00 MB"
 
 def count_files_in_folder(folder_path):
     """Papkadagi fayllar sonini olish"""
-    try:
-        return len([f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))])
-    except:
-        return 0
+    return get_folder_stats(folder_path)["files"]
 
 def delete_item(path, name):
     """Faylni o'chirish funksiyasi"""
     file_path = os.path.join(path, name)
     if os.path.exists(file_path):
-        if os.path.isdir(file_path):
-            shutil.rmtree(file_path)
-        else:
-            os.remove(file_path)
+        key = _path_key(file_path)
+        try:
+            _storage().delete(key)
+        except Exception:
+            return False
+        # Buferdagi yuklashlar o'chirilgan kalit ostida qayta yozilmasin
+        flush_download_stats()
+        try:
+            with _transaction() as conn:
+                _forget_paths(conn, key)
+        except Exception:
+            logger.exception("O'chirilgan element yozuvlari tozalanmadi: %s", key)
+        release_blobs(key)
+        catalog_update(file_path)
         return True
     return False
 
@@ -74,80 +523,2162 @@ def create_folder(path, name):
     try:
         new_path = os.path.join(path, name)
         if not os.path.exists(new_path):
-            os.makedirs(new_path)
+            _storage().make_folder(_path_key(new_path))
+            catalog_update(new_path)
             return True
     except:
         pass
     return False
 
-def load_metadata():
-    """Fayl ma'lumotlarini (izohlarni) o'qish"""
-    if os.path.exists(METADATA_FILE):
+def _path_key(file_path):
+    """Fayl yo'lidan statistika/izoh kalitini olish (ajratgich doim '/')"""
+    key = os.path.relpath(file_path, UPLOAD_FOLDER).replace(os.sep, '/')
+    return '' if key == '.' else key
+
+def _normalize_key(key):
+    """Eski (Windows) kalitlardagi '\\' ni '/' ga almashtirish"""
+    return key.replace('\\', '/')
+
+def _prefix_range(key):
+    """Papka ichidagi kalitlar oralig'i: key/ <= path < key0"""
+    # '0' belgisi '/' dan keyingi belgi, shuning uchun bu oraliq indeks
+    # bo'yicha ishlaydi va LIKE dan farqli katta-kichik harfni farqlaydi
+    return key + '/', key + '0'
+
+def _atomic_write_json(path, data):
+    """JSON faylni vaqtinchalik fayl + fsync + rename orqali yozish"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if os.name == 'posix':
+        # Rename ning o'zi ham diskka tushishi uchun papkani sinxronlash
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def _read_json(path, default):
+    """JSON faylni o'qish (bo'lmasa yoki buzilgan bo'lsa default)"""
+    if os.path.exists(path):
         try:
-            with open(METADATA_FILE, 'r') as f:
+            with open(path, 'r') as f:
                 return json.load(f)
         except:
             pass
-    return {}
+    return default
+
+# SQLite baza sxemasi. Barcha yo'l kalitlari UPLOAD_FOLDER ga nisbatan
+# va '/' ajratgichli; PRIMARY KEY ularni indekslaydi.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    path TEXT PRIMARY KEY,
+    comment TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS downloads (
+    path TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS downloads_count ON downloads (count DESC);
+CREATE TABLE IF NOT EXISTS downloads_daily (
+    day TEXT NOT NULL,
+    path TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, path)
+);
+CREATE TABLE IF NOT EXISTS views (
+    path TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS catalog (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    folder TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS catalog_ext ON catalog (ext);
+CREATE INDEX IF NOT EXISTS catalog_folder ON catalog (folder, name);
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS content_docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_blobs (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS file_blobs_sha ON file_blobs (sha256);
+CREATE TABLE IF NOT EXISTS stats_buckets (
+    kind TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    grain TEXT NOT NULL,
+    path TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, scope, grain, path, bucket)
+);
+CREATE TABLE IF NOT EXISTS rollup_segments (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS preview_index (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS removed_files (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    removed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS storage_objects (
+    path TEXT PRIMARY KEY,
+    etag TEXT
+);
+CREATE TABLE IF NOT EXISTS preview_cache (
+    sha256 TEXT PRIMARY KEY,
+    has_image INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS preview_cache_used ON preview_cache (used);
+CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5 (
+    body, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Yo'l bilan kalitlangan jadvallar (nomini o'zgartirishda ko'chiriladi)
+_PATH_TABLES = ('comments', 'downloads', 'downloads_daily', 'views', 'content_docs', 'file_blobs', 'stats_buckets', 'preview_index', 'storage_objects')
+
+@st.cache_resource
+def _db_state():
+    """Har bir oqim uchun alohida SQLite ulanishi (jarayon bo'yicha umumiy)"""
+    return {"local": threading.local(), "lock": threading.Lock(), "ready": False, "catalog_ready": False}
+
+def _db():
+    """Joriy oqimning SQLite ulanishini olish (kerak bo'lsa ochish)"""
+    state = _db_state()
+    conn = getattr(state["local"], "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+        # WAL: o'quvchilar yozuvchini to'sib qo'ymaydi (bir nechta jarayon)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        state["local"].conn = conn
+        with state["lock"]:
+            if not state["ready"]:
+                conn.executescript(_SCHEMA)
+                import_json_stores(conn)
+                state["ready"] = True
+    return conn
+
+@contextlib.contextmanager
+def _transaction(conn=None):
+    """Yozish tranzaksiyasi (xatolikda ROLLBACK)"""
+    conn = conn or _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def _bump_version(conn, name):
+    """Jadval versiyasini oshirish (keshlarni bekor qilish uchun)"""
+    conn.execute(
+        "INSERT INTO versions (name, version) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+        (name,)
+    )
+
+def get_version(name):
+    """Jadvalning joriy versiyasi"""
+    row = _db().execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+def import_json_stores(conn=None, force=False):
+    """Eski JSON fayllarni SQLite bazaga bir martalik ko'chirish"""
+    conn = conn or _db()
+    with _transaction(conn):
+        done = conn.execute("SELECT 1 FROM settings WHERE name = 'json_imported'").fetchone()
+        if done and not force:
+            return False
+
+        metadata = _read_json(METADATA_FILE, {})
+        conn.executemany(
+            "INSERT INTO comments (path, comment) VALUES (?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET comment = excluded.comment",
+            [(_normalize_key(k), v) for k, v in metadata.items() if v]
+        )
+        # Qayta import hisoblarni ikki marta qo'shmasligi uchun MAX olinadi
+        for table, json_file in (('downloads', STATS_FILE), ('views', VIEWS_FILE)):
+            counts = _read_json(json_file, {})
+            conn.executemany(
+                f"INSERT INTO {table} (path, count) VALUES (?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET count = MAX(count, excluded.count)",
+                [(_normalize_key(k), int(v)) for k, v in counts.items()]
+            )
+        ad = _read_json(AD_FILE, None)
+        if ad is not None:
+            conn.execute(
+                "INSERT INTO settings (name, value) VALUES ('ad', ?) ON CONFLICT(name) DO NOTHING",
+                (json.dumps(ad),)
+            )
+
+        conn.execute(
+            "INSERT OR REPLACE INTO settings (name, value) VALUES ('json_imported', ?)",
+            (datetime.now().isoformat(),)
+        )
+        for name in ('comments', 'downloads', 'views', 'settings'):
+            _bump_version(conn, name)
+    return True
+
+def _rekey_paths(conn, old_key, new_key, bump=True):
+    """Barcha jadvallarda eski kalitni (va papka ichidagilarni) yangisiga ko'chirish
+    (bump=False: ko'p kalit ko'chirilganda versiyalar oxirida bir marta oshiriladi)"""
+    old_low, old_high = _prefix_range(old_key)
+    new_low, new_high = _prefix_range(new_key)
+    for table in _PATH_TABLES:
+        # Yangi nom ostida qolib ketgan eski yozuvlar o'chiriladi
+        conn.execute(
+            f"DELETE FROM {table} WHERE path = ? OR (path >= ? AND path < ?)",
+            (new_key, new_low, new_high)
+        )
+        conn.execute(
+            f"UPDATE {table} SET path = ? || substr(path, ?) "
+            "WHERE path = ? OR (path >= ? AND path < ?)",
+            (new_key, len(old_key) + 1, old_key, old_low, old_high)
+        )
+        if bump:
+            _bump_version(conn, table)
+
+@st.cache_resource
+def _metadata_cache():
+    """Barcha sessiyalar uchun umumiy izohlar keshi"""
+    return {"lock": threading.Lock(), "version": None, "data": {}}
+
+def _metadata_snapshot():
+    """Izohlarni keshdan olish (baza versiyasi o'zgargandagina qayta o'qiladi)"""
+    cache = _metadata_cache()
+    version = get_version('comments')
+    with cache["lock"]:
+        if cache["version"] != version:
+            cache["data"] = dict(_db().execute("SELECT path, comment FROM comments"))
+            cache["version"] = version
+        return cache["data"]
+
+def load_metadata():
+    """Fayl ma'lumotlarini (izohlarni) o'qish"""
+    # Nusxa qaytariladi, chunki chaqiruvchilar lug'atni o'zgartirishi mumkin
+    return dict(_metadata_snapshot())
 
 def save_metadata_to_file(data):
-    """Fayl ma'lumotlarini saqlash"""
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(data, f)
+    """Fayl ma'lumotlarini saqlash (barcha izohlarni almashtirish)"""
+    with _transaction() as conn:
+        conn.execute("DELETE FROM comments")
+        conn.executemany(
+            "INSERT INTO comments (path, comment) VALUES (?, ?)",
+            [(_normalize_key(k), v) for k, v in data.items() if v]
+        )
+        _bump_version(conn, 'comments')
 
+@timed
 def get_comment(file_path):
     """Fayl izohini olish"""
-    data = load_metadata()
+    data = _metadata_snapshot()
     try:
-        key = os.path.relpath(file_path, UPLOAD_FOLDER)
-        return data.get(key, "")
+        return data.get(_path_key(file_path), "")
     except:
         return ""
 
+@timed
+def get_comments(file_paths):
+    """Bir nechta fayl izohlarini bitta chaqiruvda olish"""
+    data = _metadata_snapshot()
+    comments = {}
+    for file_path in file_paths:
+        try:
+            comments[file_path] = data.get(_path_key(file_path), "")
+        except ValueError:
+            comments[file_path] = ""
+    return comments
+
+def get_folder_comments(path):
+    """Papkadagi barcha fayllar izohlarini olish"""
+    _, files = get_content(path)
+    return get_comments([os.path.join(path, f) for f in files])
+
 def save_comment(file_path, comment):
     """Fayl izohini saqlash"""
-    data = load_metadata()
     try:
-        key = os.path.relpath(file_path, UPLOAD_FOLDER)
-        if comment:
-            data[key] = comment
-        else:
-            if key in data:
-                del data[key]
-        save_metadata_to_file(data)
+        key = _path_key(file_path)
+        with _transaction() as conn:
+            if comment:
+                conn.execute(
+                    "INSERT INTO comments (path, comment) VALUES (?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET comment = excluded.comment",
+                    (key, comment)
+                )
+            else:
+                conn.execute("DELETE FROM comments WHERE path = ?", (key,))
+            _bump_version(conn, 'comments')
     except:
         pass
 
-def load_stats():
-    """Yuklashlar statistikasini o'qish"""
-    if os.path.exists(STATS_FILE):
+@st.cache_resource
+def _download_buffer():
+    """Hali bazaga yozilmagan yuklashlar buferi (jarayon bo'yicha umumiy)"""
+    buffer = {"lock": threading.Lock(), "pending": {}, "size": 0, "wake": threading.Event()}
+    threading.Thread(target=_stats_flush_loop, args=(buffer,), daemon=True).start()
+    atexit.register(flush_download_stats)
+    return buffer
+
+def _stats_flush_loop(buffer):
+    """Buferni vaqti-vaqti bilan (yoki chegaraga yetganda) bazaga yozish"""
+    while True:
+        buffer["wake"].wait(STATS_FLUSH_INTERVAL)
+        buffer["wake"].clear()
         try:
-            with open(STATS_FILE, 'r') as f:
-                return json.load(f)
-        except:
+            flush_download_stats()
+        except Exception:
             pass
-    return {}
+
+def flush_download_stats():
+    """Buferdagi yuklashlarni bitta tranzaksiya bilan bazaga tushirish"""
+    buffer = _download_buffer()
+    with buffer["lock"]:
+        pending = buffer["pending"]
+        if not pending:
+            return
+        buffer["pending"] = {}
+        buffer["size"] = 0
+
+    try:
+        day = datetime.now().strftime('%Y-%m-%d')
+        with _transaction() as conn:
+            totals = {}
+            for key, count in pending.items():
+                totals[key] = conn.execute(
+                    "INSERT INTO downloads (path, count) VALUES (?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET count = count + excluded.count RETURNING count",
+                    (key, count)
+                ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO downloads_daily (day, path, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(day, path) DO UPDATE SET count = count + excluded.count",
+                [(day, key, count) for key, count in pending.items()]
+            )
+            _bump_version(conn, 'downloads')
+            _leaderboard_apply(conn, totals)
+            _tree_apply_downloads(conn, pending)
+    except:
+        # Yozib bo'lmasa, hisoblar yo'qolmasligi uchun buferga qaytaramiz
+        with buffer["lock"]:
+            for key, count in pending.items():
+                buffer["pending"][key] = buffer["pending"].get(key, 0) + count
+                buffer["size"] += count
+        raise
+
+def load_stats():
+    """Yuklashlar statistikasini o'qish"""
+    stats = dict(_db().execute("SELECT path, count FROM downloads"))
+    buffer = _download_buffer()
+    with buffer["lock"]:
+        for key, count in buffer["pending"].items():
+            stats[key] = stats.get(key, 0) + count
+    return stats
 
 def save_stats(data):
-    """Yuklashlar statistikasini saqlash"""
-    with open(STATS_FILE, 'w') as f:
-        json.dump(data, f)
+    """Yuklashlar statistikasini saqlash (barcha hisoblarni almashtirish)"""
+    with _transaction() as conn:
+        conn.execute("DELETE FROM downloads")
+        conn.executemany(
+            "INSERT INTO downloads (path, count) VALUES (?, ?)",
+            [(_normalize_key(k), v) for k, v in data.items()]
+        )
+        _bump_version(conn, 'downloads')
 
 def register_download(file_path):
     """Yuklashlar sonini oshirish"""
-    stats = load_stats()
+    # Faqat xotiradagi buferga yoziladi; bazaga flush_download_stats tushiradi
+    try:
+        key = _path_key(file_path)
+    except ValueError:
+        return
+    buffer = _download_buffer()
+    with buffer["lock"]:
+        buffer["pending"][key] = buffer["pending"].get(key, 0) + 1
+        buffer["size"] += 1
+        if buffer["size"] >= STATS_FLUSH_THRESHOLD:
+            buffer["wake"].set()
+    _append_event('d', key)
+
+# --- Voqealar jurnali va vaqt bo'yicha yig'indilar ---
+# stats_buckets: kind ('d' yuklash, 'v' ko'rish), scope ('f' fayl,
+# 'p' papka - ichidagi barcha fayllar), grain ('h' soat, 'd' kun)
+_EVENT_LOG_FILE = os.path.join(EVENT_LOG_FOLDER, 'events.log')
+_SEGMENT_RE = re.compile(r'events-(\d+)\.log$')
+
+@st.cache_resource
+def _event_log():
+    """Jurnal fayli va yig'uvchi fon oqimi (jarayon bo'yicha bitta)"""
+    os.makedirs(EVENT_LOG_FOLDER, exist_ok=True)
+    log = {"lock": threading.Lock(), "file": None, "inode": None, "wake": threading.Event()}
+    threading.Thread(target=_event_rollup_loop, args=(log,), daemon=True).start()
+    return log
+
+def _append_event(kind, key):
+    """Voqeani jurnal oxiriga bitta qator qilib yozish"""
+    if '\n' in key or '\t' in key:
+        return
+    line = f"{int(time.time())}\t{kind}\t{key}\n".encode('utf-8')
+    log = _event_log()
+    with log["lock"]:
+        try:
+            try:
+                inode = os.stat(_EVENT_LOG_FILE).st_ino
+            except OSError:
+                inode = None
+            # Jurnal aylantirilgan bo'lsa (boshqa jarayonda ham) yangisini ochamiz
+            if log["file"] is None or inode != log["inode"]:
+                if log["file"] is not None:
+                    log["file"].close()
+                log["file"] = open(_EVENT_LOG_FILE, 'ab', buffering=0)
+                log["inode"] = os.fstat(log["file"].fileno()).st_ino
+            log["file"].write(line)
+            if log["file"].tell() >= EVENT_LOG_MAX_BYTES:
+                _rotate_event_log(log)
+                log["wake"].set()
+        except OSError:
+            pass
+
+def record_view(file_path):
+    """Fayl ko'rilganini (ko'rinishi ochilganini) qayd etish (har bir sessiyada bir marta)"""
+    seen = st.session_state.setdefault('viewed_files', set())
+    if file_path in seen:
+        return
+    seen.add(file_path)
+    try:
+        _append_event('v', _path_key(file_path))
+    except ValueError:
+        pass
+
+def _rotate_event_log(log):
+    """Joriy jurnalni vaqt belgili qismga aylantirish (log["lock"] ostida)"""
+    if log["file"] is not None:
+        log["file"].close()
+        log["file"] = None
     try:
-        key = os.path.relpath(file_path, UPLOAD_FOLDER)
-        stats[key] = stats.get(key, 0) + 1
-        save_stats(stats)
+        if os.path.getsize(_EVENT_LOG_FILE) == 0:
+            return
+        os.rename(_EVENT_LOG_FILE, os.path.join(EVENT_LOG_FOLDER, f"events-{time.time_ns()}.log"))
+    except OSError:
+        # Boshqa jarayon allaqachon aylantirgan
+        pass
+
+def _event_rollup_loop(log):
+    """Jurnalni vaqti-vaqti bilan yig'indilarga aylantirish"""
+    while True:
+        log["wake"].wait(EVENT_ROLLUP_INTERVAL)
+        log["wake"].clear()
+        try:
+            rollup_events()
+        except Exception:
+            pass
+
+def _read_segment(path):
+    """Jurnal qismidagi voqealarni yig'ish: {(tur, fayl kaliti, vaqt): soni}"""
+    counts = collections.Counter()
+    with open(path, 'rb') as f:
+        for raw in f:
+            try:
+                ts, kind, key = raw.decode('utf-8').rstrip('\n').split('\t', 2)
+                counts[(kind, key, int(ts))] += 1
+            except ValueError:
+                # Chala yozilgan oxirgi qator
+                continue
+    return counts
+
+def _archive_segment(path):
+    """Qayta ishlangan qismni kunlik arxivga qo'shib o'chirish"""
+    day = datetime.now().strftime('%Y-%m-%d')
+    if EVENT_LOG_COMPRESS:
+        # gzip oqimlarini ketma-ket qo'shish mumkin - arxiv bitta fayl bo'lib o'qiladi
+        target = gzip.open(os.path.join(EVENT_LOG_FOLDER, f"archive-{day}.log.gz"), 'ab')
+    else:
+        target = open(os.path.join(EVENT_LOG_FOLDER, f"archive-{day}.log"), 'ab')
+    with target, open(path, 'rb') as source:
+        shutil.copyfileobj(source, target)
+    os.remove(path)
+
+def rollup_events():
+    """Jurnaldagi yangi voqealarni soatlik/kunlik yig'indilarga qo'shish"""
+    log = _event_log()
+    with log["lock"]:
+        _rotate_event_log(log)
+    deadline = time.time_ns() - EVENT_ROTATE_GRACE * 10**9
+    segments = []
+    for path in glob.glob(os.path.join(EVENT_LOG_FOLDER, 'events-*.log')):
+        match = _SEGMENT_RE.search(path)
+        if match and int(match.group(1)) <= deadline:
+            segments.append((int(match.group(1)), path))
+
+    for _, path in sorted(segments):
+        name = os.path.basename(path)
+        buckets = collections.Counter()
+        views = collections.Counter()
+        for (kind, key, ts), count in _read_segment(path).items():
+            moment = datetime.fromtimestamp(ts)
+            hour, day = moment.strftime('%Y-%m-%d %H'), moment.strftime('%Y-%m-%d')
+            if kind == 'v':
+                views[key] += count
+            scopes = [('f', key)]
+            folder = key
+            while folder:
+                folder = _parent_key(folder)
+                scopes.append(('p', folder))
+            for scope, path_key in scopes:
+                buckets[(kind, scope, 'h', path_key, hour)] += count
+                buckets[(kind, scope, 'd', path_key, day)] += count
+
+        with _transaction() as conn:
+            done = conn.execute("SELECT 1 FROM rollup_segments WHERE name = ?", (name,)).fetchone()
+            if not done:
+                conn.executemany(
+                    "INSERT INTO stats_buckets (kind, scope, grain, path, bucket, count) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(kind, scope, grain, path, bucket) DO UPDATE SET count = count + excluded.count",
+                    [key + (count,) for key, count in buckets.items()]
+                )
+                if views:
+                    conn.executemany(
+                        "INSERT INTO views (path, count) VALUES (?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET count = count + excluded.count",
+                        list(views.items())
+                    )
+                    _bump_version(conn, 'views')
+                conn.execute("INSERT INTO rollup_segments (name) VALUES (?)", (name,))
+                _bump_version(conn, 'stats_buckets')
+        _archive_segment(path)
+
+    # Eski soatlik yig'indilar, belgilar va arxivlarni tozalash
+    hour_limit = (datetime.now() - timedelta(days=ROLLUP_HOURLY_DAYS)).strftime('%Y-%m-%d %H')
+    marker_limit = f"events-{time.time_ns() - EVENT_LOG_KEEP_DAYS * 86400 * 10**9}.log"
+    with _transaction() as conn:
+        conn.execute("DELETE FROM stats_buckets WHERE grain = 'h' AND bucket < ?", (hour_limit,))
+        conn.execute("DELETE FROM rollup_segments WHERE name < ?", (marker_limit,))
+    archive_limit = (datetime.now() - timedelta(days=EVENT_LOG_KEEP_DAYS)).strftime('%Y-%m-%d')
+    for path in glob.glob(os.path.join(EVENT_LOG_FOLDER, 'archive-*.log*')):
+        if os.path.basename(path)[len('archive-'):][:10] < archive_limit:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+@timed
+def get_trends(folder='', days=30):
+    """Papka (yoki '' - hammasi) bo'yicha trend: (vaqt belgilari, {'d': [...], 'v': [...]}).
+    Bir kunlik oraliq soatlar bo'yicha, qolganlari kunlar bo'yicha."""
+    now = datetime.now()
+    if days == 1:
+        grain = 'h'
+        labels = [(now - timedelta(hours=i)).strftime('%Y-%m-%d %H') for i in reversed(range(24))]
+    else:
+        grain = 'd'
+        labels = [(now - timedelta(days=i)).strftime('%Y-%m-%d') for i in reversed(range(days))]
+    series = {'d': dict.fromkeys(labels, 0), 'v': dict.fromkeys(labels, 0)}
+    rows = _db().execute(
+        "SELECT kind, bucket, count FROM stats_buckets "
+        "WHERE kind IN ('d', 'v') AND scope = 'p' AND grain = ? AND path = ? AND bucket >= ?",
+        (grain, folder, labels[0])
+    )
+    for kind, bucket, count in rows:
+        if bucket in series[kind]:
+            series[kind][bucket] = count
+    return labels, {kind: list(values.values()) for kind, values in series.items()}
+
+def load_view_stats():
+    """Ko'rishlar statistikasini o'qish"""
+    return dict(_db().execute("SELECT path, count FROM views"))
+
+def save_view_stats(data):
+    """Ko'rishlar statistikasini saqlash"""
+    with _transaction() as conn:
+        conn.execute("DELETE FROM views")
+        conn.executemany(
+            "INSERT INTO views (path, count) VALUES (?, ?)",
+            [(_normalize_key(k), v) for k, v in data.items()]
+        )
+        _bump_version(conn, 'views')
+
+def _scan_tree(abs_path):
+    """Papka daraxtini bir marta aylanib (papkalar, fayllar) qatorlarini olish"""
+    folders, files = [], []
+    stack = [abs_path]
+    while stack:
+        current = stack.pop()
+        try:
+            folder_mtime = os.stat(current).st_mtime
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        folder_key = _path_key(current)
+        parent_key = None if current == UPLOAD_FOLDER else _path_key(os.path.dirname(current))
+        folders.append((folder_key, parent_key, folder_mtime))
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    stack.append(entry.path)
+                elif entry.is_file() and not _is_partial(entry.name):
+                    files.append(_catalog_row(entry.path, entry.stat(), folder_key))
+            except OSError:
+                continue
+    return folders, files
+
+def _catalog_row(file_path, stat_result, folder_key=None):
+    """Katalog jadvali uchun bitta fayl qatori"""
+    name = os.path.basename(file_path)
+    if folder_key is None:
+        folder_key = _path_key(os.path.dirname(file_path))
+    return (
+        _path_key(file_path), name, name.lower(), os.path.splitext(name)[1].lower(),
+        stat_result.st_size, stat_result.st_mtime, folder_key
+    )
+
+def _catalog_insert(conn, folders, files):
+    """Skan natijalarini katalogga yozish"""
+    conn.executemany("INSERT OR REPLACE INTO folders (path, parent, mtime) VALUES (?, ?, ?)", folders)
+    conn.executemany(
+        "INSERT OR REPLACE INTO catalog (path, name, name_lower, ext, size, mtime, folder) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        files
+    )
+
+def _catalog_forget(conn, key, low=None, high=None):
+    """Katalogdan chiqayotgan, izoh yoki statistikasi bor fayllarning hajmi va
+    mtime ini eslab qolish: tashqaridan (mv, rsync -a) ko'chirilgan, xeshi
+    saqlanmagan fayl compact_stores da shular bo'yicha topiladi"""
+    conn.execute(
+        "INSERT OR REPLACE INTO removed_files (path, name, size, mtime, removed) "
+        "SELECT c.path, c.name, c.size, c.mtime, ? FROM catalog c "
+        "WHERE (c.path = ? OR (c.path >= ? AND c.path < ?)) AND ("
+        "EXISTS (SELECT 1 FROM comments WHERE path = c.path) OR "
+        "EXISTS (SELECT 1 FROM downloads WHERE path = c.path) OR "
+        "EXISTS (SELECT 1 FROM views WHERE path = c.path))",
+        (time.time(), key, low or key, high or key)
+    )
+
+def _catalog_remove(conn, key):
+    """Kalitni (papka bo'lsa ichidagilari bilan) katalogdan o'chirish"""
+    low, high = _prefix_range(key)
+    _catalog_forget(conn, key, low, high)
+    for table in ('catalog', 'folders'):
+        conn.execute(f"DELETE FROM {table} WHERE path = ? OR (path >= ? AND path < ?)", (key, low, high))
+
+def rebuild_catalog():
+    """Fayl katalogini noldan qurish (bir martalik to'liq skan)"""
+    folders, files = _scan_tree(UPLOAD_FOLDER)
+    with _transaction() as conn:
+        conn.execute("DELETE FROM catalog")
+        conn.execute("DELETE FROM folders")
+        _catalog_insert(conn, folders, files)
+        conn.execute(
+            "INSERT OR REPLACE INTO settings (name, value) VALUES ('catalog_built', ?)",
+            (datetime.now().isoformat(),)
+        )
+        _bump_version(conn, 'catalog')
+
+def _ensure_catalog():
+    """Katalog hali qurilmagan bo'lsa, uni qurish"""
+    state = _db_state()
+    if state["catalog_ready"]:
+        return
+    built = _db().execute("SELECT 1 FROM settings WHERE name = 'catalog_built'").fetchone()
+    if not built:
+        rebuild_catalog()
+    state["catalog_ready"] = True
+
+# --- Tashqi o'zgarishlarni kuzatish (inotify yoki so'rov rejimi) ---
+# Katalogga bog'liq barcha keshlar (ro'yxatlar, qidiruv, daraxt, reyting)
+# 'catalog' versiyasiga qaraydi, shuning uchun o'zgarishni e'lon qilish
+# uchun versiyani oshirish kifoya.
+def _abs_path(key):
+    """Kalitdan diskdagi yo'lni olish"""
+    return os.path.join(UPLOAD_FOLDER, *key.split('/')) if key else UPLOAD_FOLDER
+
+def _sync_folder(key):
+    """Bitta papkaning bevosita tarkibini katalog bilan solishtirib tuzatish.
+    Qaytaradi: avvaldan ma'lum bo'lgan (ichiga kirish kerak) ichki papkalar"""
+    abs_path = _abs_path(key)
+    try:
+        folder_mtime = os.stat(abs_path).st_mtime
+        folders, files = _scan_directory(abs_path)
+    except OSError:
+        folder_mtime, folders, files = None, [], []
+    prefix = key + '/' if key else ''
+    changed = []
+    if key and folder_mtime is not None and not _db().execute("SELECT 1 FROM folders WHERE path = ?", (key,)).fetchone():
+        # Yangi papka: uni ota-papka orqali to'liq skanerlash
+        _sync_folder(_parent_key(key))
+        return []
+    with _transaction() as conn:
+        if folder_mtime is None:
+            # Papka o'chirilgan
+            exists = conn.execute("SELECT 1 FROM folders WHERE path = ?", (key,)).fetchone()
+            if key and exists:
+                _catalog_remove(conn, key)
+                _bump_version(conn, 'catalog')
+                _tree_refresh(conn, key)
+            return []
+        known_files = {
+            name: (size, mtime)
+            for name, size, mtime in conn.execute("SELECT name, size, mtime FROM catalog WHERE folder = ?", (key,))
+        }
+        known_dirs = {
+            path[len(prefix):]
+            for (path,) in conn.execute("SELECT path FROM folders WHERE parent = ?", (key,))
+        }
+        current_files = {name: (size, mtime) for name, size, mtime in files}
+        current_dirs = set(folders)
+
+        for name in known_files.keys() - current_files.keys():
+            _catalog_forget(conn, prefix + name)
+            conn.execute("DELETE FROM catalog WHERE path = ?", (prefix + name,))
+            changed.append(prefix + name)
+        rows = []
+        for name, (size, mtime) in current_files.items():
+            if known_files.get(name) != (size, mtime):
+                rows.append((prefix + name, name, name.lower(), os.path.splitext(name)[1].lower(), size, mtime, key))
+                changed.append(prefix + name)
+        _catalog_insert(conn, [], rows)
+        for name in known_dirs - current_dirs:
+            _catalog_remove(conn, prefix + name)
+            changed.append(prefix + name)
+        for name in current_dirs - known_dirs:
+            _catalog_insert(conn, *_scan_tree(os.path.join(abs_path, name)))
+            changed.append(prefix + name)
+
+        conn.execute("UPDATE folders SET mtime = ? WHERE path = ?", (folder_mtime, key))
+        if changed:
+            _bump_version(conn, 'catalog')
+            _tree_refresh(conn, key)
+    # Tashqaridan (cp, scp) joyida qayta yozilgan fayl ombordagi nusxani ham o'zgartirgan bo'lishi mumkin
+    verify_blob_links(changed)
+    for changed_key in changed:
+        schedule_content_index(changed_key)
+    return [prefix + name for name in current_dirs & known_dirs]
+
+def reconcile_catalog():
+    """Katalogni disk bilan tez moslashtirish: faqat mtime i o'zgargan
+    papkalar o'qiladi, qolganlari uchun bitta stat() kifoya.
+    (Papkadagi faylni joyida qayta yozish papka mtime ini o'zgartirmaydi -
+    bunday o'zgarishlarni inotify kuzatuvchisi ushlaydi.)"""
+    _ensure_catalog()
+    conn = _db()
+    known = {}
+    children = collections.defaultdict(list)
+    for path, parent, mtime in conn.execute("SELECT path, parent, mtime FROM folders"):
+        known[path] = mtime
+        if parent is not None:
+            children[parent].append(path)
+    stack = ['']
+    while stack:
+        key = stack.pop()
+        try:
+            unchanged = os.stat(_abs_path(key)).st_mtime == known.get(key)
+        except OSError:
+            unchanged = False
+        if unchanged:
+            stack.extend(children[key])
+        else:
+            stack.extend(_sync_folder(key))
+
+class _WatchHandler(FileSystemEventHandler):
+    """watchdog hodisalarini kuzatuvchi navbatiga yig'ish"""
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type in ('opened', 'closed_no_write'):
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        folders = set()
+        for path in paths:
+            if not path:
+                continue
+            path = os.fsdecode(path)
+            if event.is_directory and event.event_type == 'modified':
+                folders.add(path)
+            elif not _is_partial(os.path.basename(path)):
+                folders.add(os.path.dirname(path))
+        if folders:
+            with self.watcher["lock"]:
+                self.watcher["pending"].update(folders)
+                self.watcher["last_event"] = time.monotonic()
+            self.watcher["wake"].set()
+
+@st.cache_resource
+def _fs_watcher():
+    """Papkalar kuzatuvchisi (jarayon bo'yicha bitta fon oqimi)"""
+    watcher = {
+        "lock": threading.Lock(), "pending": set(), "last_event": 0.0,
+        "wake": threading.Event(), "mode": None
+    }
+    threading.Thread(target=_fs_watch_loop, args=(watcher,), daemon=True).start()
+    return watcher
+
+def _start_observer(watcher):
+    """inotify (watchdog) kuzatuvchisini ishga tushirish, bo'lmasa None"""
+    if Observer is None:
+        return None
+    try:
+        observer = Observer()
+        observer.schedule(_WatchHandler(watcher), os.path.abspath(UPLOAD_FOLDER), recursive=True)
+        observer.daemon = True
+        observer.start()
+        return observer
+    except Exception:
+        # Masalan, inotify kuzatuvlari chegarasi tugagan
+        return None
+
+def _fs_watch_loop(watcher):
+    """Hodisalarni kutib, to'xtashini kutib (debounce) katalogga qo'llash"""
+    # Kuzatuvchi moslashtirishdan oldin ishga tushadi - skan paytidagi
+    # o'zgarishlar ham navbatda qoladi
+    observer = _start_observer(watcher)
+    watcher["mode"] = "inotify" if observer else "poll"
+    try:
+        reconcile_catalog()
+    except Exception:
+        pass
+    while True:
+        if observer is None:
+            time.sleep(WATCH_POLL_INTERVAL)
+            try:
+                reconcile_catalog()
+            except Exception:
+                pass
+            continue
+
+        watcher["wake"].wait()
+        started = time.monotonic()
+        while True:
+            watcher["wake"].clear()
+            now = time.monotonic()
+            quiet = now - watcher["last_event"]
+            if quiet >= WATCH_DEBOUNCE or now - started >= WATCH_MAX_DELAY:
+                break
+            watcher["wake"].wait(WATCH_DEBOUNCE - quiet)
+        with watcher["lock"]:
+            folders, watcher["pending"] = watcher["pending"], set()
+        base = os.path.abspath(UPLOAD_FOLDER)
+        keys = {
+            _path_key(folder) for folder in folders
+            if os.path.abspath(folder) == base or os.path.abspath(folder).startswith(base + os.sep)
+        }
+        # Ota-papkalar avval: yangi papkalar ular bilan birga to'liq skanerlanadi
+        for key in sorted(keys, key=_key_depth):
+            try:
+                _sync_folder(key)
+            except Exception:
+                pass
+
+# --- Kutubxona ombori (mahalliy disk yoki S3) ---
+# S3 rejimida fayllar ombordan sinxronlanadi: storage_objects jadvali
+# ombordagi har bir obyektning oxirgi ko'rilgan ETag ini saqlaydi (NULL -
+# hali yuborilmagan mahalliy o'zgarish), shu orqali boshqa serverda
+# o'chirilgan fayl bu yerda yangi qo'shilgan fayldan ajratiladi.
+@st.cache_resource
+def _storage():
+    """Kutubxona ombori (jarayon bo'yicha bitta); S3 da sinxronlash oqimi ham"""
+    if STORAGE_BACKEND != 's3':
+        return storage.LocalStorage(UPLOAD_FOLDER, PARTIAL_SUFFIX)
+    backend = storage.S3Storage(
+        UPLOAD_FOLDER, STORAGE_S3_BUCKET, STORAGE_S3_PREFIX,
+        endpoint_url=STORAGE_S3_ENDPOINT, region=STORAGE_S3_REGION, partial_suffix=PARTIAL_SUFFIX
+    )
+    threading.Thread(target=_storage_sync_loop, daemon=True).start()
+    return backend
+
+def _storage_put(file_path):
+    """Yangi yoki o'zgargan faylni omborga yuborish; xato bo'lsa keyingi
+    sinxronlash qayta urinadi"""
+    backend = _storage()
+    if not backend.shared:
+        return
+    key = _path_key(file_path)
+    with _transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO storage_objects (path, etag) VALUES (?, NULL)", (key,))
+    try:
+        etag = backend.put(key)
+    except Exception:
+        return
+    with _transaction() as conn:
+        conn.execute("UPDATE storage_objects SET etag = ? WHERE path = ?", (etag, key))
+
+def local_copy(file_path):
+    """O'qishdan oldin: diskda hali yo'q fayl ombordan olinadi (S3 rejimi)"""
+    if not os.path.exists(file_path):
+        _storage().fetch(_path_key(file_path))
+    return file_path
+
+@st.cache_resource
+def _storage_sync_lock():
+    """Sinxronlash bir vaqtda bitta oqimda ishlaydi"""
+    return threading.Lock()
+
+def sync_storage():
+    """Mahalliy nusxani ombor bilan moslashtirish.
+    Qaytaradi: (olingan, yuborilgan, o'chirilgan) obyektlar soni"""
+    backend = _storage()
+    if not backend.shared:
+        return 0, 0, 0
+    with _storage_sync_lock():
+        return _sync_storage(backend)
+
+def _sync_storage(backend):
+    _ensure_catalog()
+    conn = _db()
+    # Ro'yxatdan oldin o'qiladi: sinxronlash paytida yuklangan fayl o'chirilmaydi
+    known = dict(conn.execute("SELECT path, etag FROM storage_objects"))
+    remote = {key: etag for key, _, etag in backend.walk()}
+    records, removed = {}, []
+    pulled = pushed = deleted = 0
+
+    for key, etag in remote.items():
+        if known.get(key, '') is None:
+            # Bu serverdagi hali yuborilmagan o'zgarish ustun
+            continue
+        path = _abs_path(key.rstrip('/'))
+        if key.endswith('/'):
+            if not os.path.isdir(path):
+                os.makedirs(path, exist_ok=True)
+                pulled += 1
+        elif known.get(key) != etag or not os.path.isfile(path):
+            try:
+                etag = backend.pull(key)
+            except FileNotFoundError:
+                continue
+            pulled += 1
+        records[key] = etag
+
+    for key in known.keys() - remote.keys():
+        if known[key] is None:
+            continue
+        # Boshqa serverda (yoki shu serverda) o'chirilgan
+        path = _abs_path(key.rstrip('/'))
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+                deleted += 1
+            elif os.path.isfile(path):
+                os.remove(path)
+                deleted += 1
+        except OSError:
+            continue
+        removed.append(key)
+
+    # Faqat shu serverda bor fayl va papkalar (tashqaridan qo'shilgan yoki yuborilmay qolgan)
+    gone = set(removed)
+    local = [(path, False) for (path,) in conn.execute("SELECT path FROM catalog")]
+    local += [(path + '/', True) for (path,) in conn.execute("SELECT path FROM folders WHERE path != ''")]
+    for key, is_folder in local:
+        if key in gone or (key in remote and known.get(key, '') is not None):
+            continue
+        try:
+            records[key] = backend.mark_folder(key.rstrip('/')) if is_folder else backend.put(key)
+        except Exception:
+            # Keyingi sinxronlashda qayta uriniladi
+            continue
+        pushed += 1
+
+    with _transaction() as conn:
+        conn.executemany("DELETE FROM storage_objects WHERE path = ?", [(key,) for key in removed])
+        conn.executemany("INSERT OR REPLACE INTO storage_objects (path, etag) VALUES (?, ?)", records.items())
+    if pulled or deleted:
+        # inotify bo'lmasa ham katalog darhol yangilanadi
+        reconcile_catalog()
+    count('storage_pulled_total', pulled)
+    count('storage_pushed_total', pushed)
+    count('storage_removed_total', deleted)
+    return pulled, pushed, deleted
+
+def _storage_sync_loop():
+    """Ombordagi o'zgarishlarni vaqti-vaqti bilan olish"""
+    while True:
+        try:
+            sync_storage()
+        except Exception:
+            pass
+        time.sleep(STORAGE_SYNC_INTERVAL)
+
+# --- Tarkib bo'yicha manzillanadigan ombor (deduplikatsiya) ---
+def _blob_path(sha256):
+    """Xesh bo'yicha ombordagi fayl yo'li"""
+    return os.path.join(BLOB_FOLDER, sha256[:2], sha256)
+
+def _protect_blob(blob_path):
+    """Ombordagi nusxani faqat o'qish uchun qilish. Hardlink lar bitta inode ni
+    bo'lishadi: papkadagi faylni joyida qayta yozish (cp, scp) shu tarkibli
+    barcha fayllarni buzadi, shuning uchun bunga yo'l qo'yilmaydi. Ilova fayllarni
+    doim yangi inode bilan almashtiradi (os.replace), bu belgi unga xalaqit bermaydi.
+    Windows da faqat o'qish belgisi o'chirishga ham to'sqinlik qiladi - tegilmaydi."""
+    if os.name == 'posix':
+        os.chmod(blob_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+def _link_blob(blob_path, file_path):
+    """Papkadagi faylni ombordagi nusxaga bog'lash (hardlink, bo'lmasa nusxa)"""
+    directory, name = os.path.split(file_path)
+    fd, tmp_link = tempfile.mkstemp(dir=directory, prefix='.' + name, suffix=PARTIAL_SUFFIX)
+    os.close(fd)
+    os.remove(tmp_link)
+    try:
+        _protect_blob(blob_path)
+        try:
+            os.link(blob_path, tmp_link)
+        except OSError:
+            # Boshqa fayl tizimi yoki hardlink qo'llab-quvvatlanmasa
+            shutil.copyfile(blob_path, tmp_link)
+        os.replace(tmp_link, file_path)
+    except:
+        if os.path.exists(tmp_link):
+            os.remove(tmp_link)
+        raise
+
+def _blob_release(conn, key):
+    """Kalit (va papka ichidagilar) havolalarini olib tashlash; bo'shagan xeshlar"""
+    low, high = _prefix_range(key)
+    shas = [row[0] for row in conn.execute(
+        "SELECT sha256 FROM file_blobs WHERE path = ? OR (path >= ? AND path < ?)", (key, low, high)
+    )]
+    if not shas:
+        return []
+    conn.execute("DELETE FROM file_blobs WHERE path = ? OR (path >= ? AND path < ?)", (key, low, high))
+    conn.executemany("UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?", [(sha,) for sha in shas])
+    placeholders = ",".join("?" * len(shas))
+    return [row[0] for row in conn.execute(
+        f"SELECT sha256 FROM blobs WHERE refcount <= 0 AND sha256 IN ({placeholders})", shas
+    )]
+
+def _delete_blobs(shas):
+    """Hech kim havola qilmayotgan nusxalarni ombordan o'chirish"""
+    if not shas:
+        return
+    with _transaction() as conn:
+        for sha in shas:
+            # Fayl tranzaksiya ichida o'chiriladi: shu vaqtda boshqa yuklash
+            # aynan shu xeshni qayta ishlata olmaydi
+            if conn.execute("DELETE FROM blobs WHERE sha256 = ? AND refcount <= 0", (sha,)).rowcount:
+                try:
+                    os.remove(_blob_path(sha))
+                except FileNotFoundError:
+                    pass
+
+def store_blob(tmp_path, sha256, size, file_path):
+    """Yangi yozilgan faylni omborga qo'yib, file_path ni unga bog'lash"""
+    # Natija: shu tarkib bilan allaqachon mavjud bo'lgan boshqa fayllar
+    key = _path_key(file_path)
+    with _transaction() as conn:
+        freed = _blob_release(conn, key)
+        conn.execute(
+            "INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, 1) "
+            "ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1",
+            (sha256, size)
+        )
+        conn.execute("INSERT INTO file_blobs (path, sha256) VALUES (?, ?)", (key, sha256))
+        duplicates = [row[0] for row in conn.execute(
+            "SELECT path FROM file_blobs WHERE sha256 = ? AND path != ?", (sha256, key)
+        )]
+    _delete_blobs([sha for sha in freed if sha != sha256])
+
+    try:
+        blob_path = _blob_path(sha256)
+        if os.path.exists(blob_path):
+            # Bir xil tarkib allaqachon saqlangan: yangi nusxa kerak emas
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                os.replace(tmp_path, blob_path)
+            except OSError:
+                shutil.move(tmp_path, blob_path)
+        _link_blob(blob_path, file_path)
+    except:
+        release_blobs(key)
+        raise
+    return duplicates
+
+def verify_blob_links(keys):
+    """Tashqaridan o'zgargan fayllarning ombor bog'lanishini tekshirish.
+    Yangi inode bilan almashtirilgan fayl (mv, rsync) ombordan ajratiladi;
+    nusxa joyida qayta yozilgan bo'lsa (inode bir xil, xesh boshqa) - _rebind_blob"""
+    conn = _db()
+    for key in keys:
+        row = conn.execute("SELECT sha256 FROM file_blobs WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            continue
+        sha256 = row[0]
+        try:
+            file_stat = os.stat(_abs_path(key))
+        except OSError:
+            continue
+        try:
+            blob_stat = os.stat(_blob_path(sha256))
+        except OSError:
+            blob_stat = None
+        if blob_stat is None or not os.path.samestat(file_stat, blob_stat):
+            # Endi bu alohida fayl: keyingi deduplicate_library uni qayta xeshlaydi
+            release_blobs(key)
+            continue
+        try:
+            current = content_extract.file_hash(_abs_path(key))
+        except OSError:
+            continue
+        if current != sha256:
+            _rebind_blob(sha256, current, blob_stat)
+
+def _rebind_blob(old_sha, new_sha, blob_stat):
+    """Joyida qayta yozilgan nusxani yangi xesh ostiga o'tkazish. Shu inode ga
+    bog'langan fayllar yangi tarkibga ega (ularni tiklab bo'lmaydi); alohida
+    nusxa bo'lib qolgan fayllar bo'lsa, eski xeshli nusxa ulardan tiklanadi"""
+    old_path, new_path = _blob_path(old_sha), _blob_path(new_sha)
+    with _transaction() as conn:
+        linked, intact = [], []
+        for (key,) in conn.execute("SELECT path FROM file_blobs WHERE sha256 = ?", (old_sha,)).fetchall():
+            try:
+                same = os.path.samestat(os.stat(_abs_path(key)), blob_stat)
+            except OSError:
+                same = False
+            (linked if same else intact).append(key)
+        conn.executemany("UPDATE file_blobs SET sha256 = ? WHERE path = ?", [(new_sha, key) for key in linked])
+        conn.execute(
+            "INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, ?) "
+            "ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + excluded.refcount",
+            (new_sha, blob_stat.st_size, len(linked))
+        )
+        conn.execute("UPDATE blobs SET refcount = ? WHERE sha256 = ?", (len(intact), old_sha))
+        if os.path.exists(new_path):
+            os.remove(old_path)
+        else:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(old_path, new_path)
+            _protect_blob(new_path)
+        if intact:
+            source = _abs_path(intact[0])
+            try:
+                os.link(source, old_path)
+            except OSError:
+                shutil.copyfile(source, old_path)
+            _protect_blob(old_path)
+    logger.warning(
+        "Ombordagi nusxa joyida qayta yozilgan (%s -> %s), o'zgargan fayllar: %s",
+        old_sha, new_sha, ', '.join(linked)
+    )
+    if not intact:
+        _delete_blobs([old_sha])
+
+def release_blobs(key):
+    """O'chirilgan fayl/papka havolalarini bo'shatish"""
+    try:
+        with _transaction() as conn:
+            freed = _blob_release(conn, key)
+        _delete_blobs(freed)
     except:
         pass
 
-def get_top_downloads(limit=5):
-    """Eng ko'p yuklangan fayllarni olish"""
-    stats = load_stats()
-    sorted_stats = sorted(stats.items(), key=lambda item: item[1], reverse=True)
-    return sorted_stats[:limit]
+def deduplicate_library():
+    """Omborga kiritilmagan mavjud fayllarni birlashtirish: (fayllar soni, tejalgan baytlar)"""
+    _ensure_catalog()
+    conn = _db()
+    rows = conn.execute(
+        "SELECT c.path, c.size FROM catalog c LEFT JOIN file_blobs b ON b.path = c.path WHERE b.path IS NULL"
+    ).fetchall()
+    merged, saved = 0, 0
+    for key, size in rows:
+        file_path = os.path.join(UPLOAD_FOLDER, key)
+        try:
+            sha256 = content_extract.file_hash(file_path)
+            blob_path = _blob_path(sha256)
+            with _transaction() as conn:
+                conn.execute(
+                    "INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, 1) "
+                    "ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1",
+                    (sha256, size)
+                )
+                conn.execute("INSERT OR REPLACE INTO file_blobs (path, sha256) VALUES (?, ?)", (key, sha256))
+            if os.path.exists(blob_path):
+                # Xuddi shu tarkib omborda bor: fayl o'rniga havola qo'yiladi
+                _link_blob(blob_path, file_path)
+                merged += 1
+                saved += size
+                catalog_update(file_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                try:
+                    os.link(file_path, blob_path)
+                except OSError:
+                    shutil.copyfile(file_path, blob_path)
+                _protect_blob(blob_path)
+        except OSError:
+            release_blobs(key)
+    return merged, saved
+
+# --- Yetim yozuvlarni tozalash va bazani siqish ---
+# Diskda ham, katalogda ham yo'q yo'llarning yozuvlari o'chiriladi. Fayl
+# tashqarida (mv/rsync) ko'chirilgan bo'lsa, eski kalitning tarkib xeshi
+# (file_blobs, content_docs, preview_index) bo'yicha yangi joyi topilib,
+# izoh va statistika unga ko'chiriladi.
+def _merge_paths(conn, old_key, new_key):
+    """Eski kalit yozuvlarini yangisiga qo'shish (yangisida bori saqlanadi,
+    hisoblagichlar qo'shiladi); qaytaradi: bo'shagan blob xeshlari"""
+    conn.execute(
+        "INSERT OR IGNORE INTO comments (path, comment) SELECT ?, comment FROM comments WHERE path = ?",
+        (new_key, old_key)
+    )
+    for table in ('downloads', 'views'):
+        conn.execute(
+            f"INSERT INTO {table} (path, count) SELECT ?, count FROM {table} WHERE path = ? "
+            "ON CONFLICT(path) DO UPDATE SET count = count + excluded.count",
+            (new_key, old_key)
+        )
+    conn.execute(
+        "INSERT INTO downloads_daily (day, path, count) SELECT day, ?, count FROM downloads_daily WHERE path = ? "
+        "ON CONFLICT(day, path) DO UPDATE SET count = count + excluded.count",
+        (new_key, old_key)
+    )
+    conn.execute(
+        "INSERT INTO stats_buckets (kind, scope, grain, path, bucket, count) "
+        "SELECT kind, scope, grain, ?, bucket, count FROM stats_buckets WHERE scope = 'f' AND path = ? "
+        "ON CONFLICT(kind, scope, grain, path, bucket) DO UPDATE SET count = count + excluded.count",
+        (new_key, old_key)
+    )
+    # Blob havolasi yangi kalitda bo'lmasa ko'chadi, aks holda bo'shatiladi
+    conn.execute(
+        "UPDATE OR IGNORE file_blobs SET path = ? WHERE path = ?", (new_key, old_key)
+    )
+    freed = _blob_release(conn, old_key) if conn.execute(
+        "SELECT 1 FROM file_blobs WHERE path = ?", (old_key,)
+    ).fetchone() else []
+    for table in ('comments', 'downloads', 'views', 'downloads_daily', 'content_docs', 'preview_index'):
+        conn.execute(f"DELETE FROM {table} WHERE path = ?", (old_key,))
+    conn.execute("DELETE FROM stats_buckets WHERE scope = 'f' AND path = ?", (old_key,))
+    return freed
+
+def _forget_paths(conn, key):
+    """Ilovada o'chirilgan fayl/papkaning izoh va statistika yozuvlarini
+    o'chirish (tranzaksiya ichida). Ular yetim bo'lib qolsa, compact_stores
+    ularni boshqa faylga bog'lashi mumkin edi"""
+    low, high = _prefix_range(key)
+    for table in ('comments', 'downloads', 'views', 'downloads_daily', 'stats_buckets', 'removed_files'):
+        conn.execute(f"DELETE FROM {table} WHERE path = ? OR (path >= ? AND path < ?)", (key, low, high))
+        _bump_version(conn, table)
+
+def _orphan_hashes(conn, live):
+    """Yo'qolgan fayllarning ma'lum tarkib xeshlari: {kalit: (xesh, hajm)}"""
+    orphans = {}
+    rows = conn.execute(
+        "SELECT b.path, b.sha256, s.size FROM file_blobs b JOIN blobs s ON s.sha256 = b.sha256 "
+        "UNION ALL SELECT path, sha256, size FROM content_docs "
+        "UNION ALL SELECT path, sha256, size FROM preview_index"
+    )
+    for key, sha256, size in rows:
+        if key not in live and key not in orphans and not os.path.exists(_abs_path(key)):
+            orphans[key] = (sha256, size)
+    return orphans
+
+def _rehome_orphans(conn, orphans):
+    """Yetim kalitlarni xuddi shu tarkibli yangi fayllarga moslash: [(eski, yangi)]"""
+    if not orphans:
+        return []
+    by_hash = collections.defaultdict(list)
+    for key, (sha256, _) in sorted(orphans.items()):
+        by_hash[sha256].append(key)
+    sizes = {size for _, size in orphans.values()}
+    known = {}
+    for key, sha256 in conn.execute(
+        "SELECT path, sha256 FROM content_docs UNION ALL SELECT path, sha256 FROM preview_index"
+    ):
+        known.setdefault(key, sha256)
+    linked = {key for (key,) in conn.execute("SELECT path FROM file_blobs")}
+    candidates = collections.defaultdict(list)
+    for key, size in conn.execute("SELECT path, size FROM catalog"):
+        if size not in sizes or key in linked:
+            continue
+        sha256 = known.get(key)
+        if sha256 is None:
+            try:
+                sha256 = content_extract.file_hash(_abs_path(key))
+            except OSError:
+                continue
+        if sha256 in by_hash:
+            candidates[sha256].append(key)
+    moves = []
+    for sha256, old_keys in by_hash.items():
+        free = candidates.get(sha256, [])
+        for old_key in old_keys:
+            if not free:
+                break
+            # Nomi o'zgarmagan (faqat papkasi o'zgargan) fayl birinchi tanlanadi
+            name = old_key.rsplit('/', 1)[-1]
+            new_key = next((key for key in free if key.rsplit('/', 1)[-1] == name), free[0])
+            free.remove(new_key)
+            moves.append((old_key, new_key))
+    return moves
+
+def _rehome_removed(conn, live, orphans, moves):
+    """Xeshi saqlanmagan (hali indekslanmagan) yetim kalitlarni nomi, hajmi va
+    mtime i katalogdan chiqqandagisi bilan bir xil yangi fayllarga moslash.
+    Qaytaradi: ([(eski, yangi)], hali tegilmaydigan kalitlar)"""
+    taken = {new_key for _, new_key in moves}
+    name_moves, held = [], set()
+    hold_until = time.time() - ORPHAN_HOLD_DAYS * 86400
+    removed = conn.execute("SELECT path, name, size, mtime, removed FROM removed_files ORDER BY path").fetchall()
+    for old_key, name, size, mtime, removed_at in removed:
+        if old_key in live or old_key in orphans or os.path.exists(_abs_path(old_key)):
+            continue
+        free = [
+            key for (key,) in conn.execute(
+                "SELECT path FROM catalog WHERE name = ? AND size = ? AND mtime = ? ORDER BY path",
+                (name, size, mtime)
+            )
+            if key not in taken
+        ]
+        if not free:
+            continue
+        # Bir nechta nomzod bo'lsa tarkibi bir xil bo'lishi kerak (bir faylning nusxalari)
+        hashes = set()
+        if len(free) > 1:
+            for key in free:
+                try:
+                    hashes.add(content_extract.file_hash(_abs_path(key)))
+                except OSError:
+                    hashes.add(None)
+        if len(hashes) <= 1:
+            name_moves.append((old_key, free[0]))
+            taken.add(free[0])
+        elif removed_at > hold_until:
+            # Qaysi fayl qaysiga tegishli ekanini aniqlab bo'lmaydi - hozircha o'chirilmaydi
+            held.add(old_key)
+    return name_moves, held
+
+def compact_stores():
+    """Izoh, statistika va indeks jadvallaridan yetim yozuvlarni tozalash,
+    ko'chirilgan fayllarni xesh (xeshi yo'q bo'lsa nom, hajm va mtime) bo'yicha qayta bog'lash, '\\' ajratgichli
+    kalitlarni tuzatish va bazani siqish.
+    Qaytaradi: {"normalized", "rehomed", "pruned": {jadval: soni}, "entries", "bytes"}"""
+    _ensure_catalog()
+    flush_download_stats()
+    conn = _db()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    db_before = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+    live = {key for (key,) in conn.execute("SELECT path FROM catalog UNION ALL SELECT path FROM folders")}
+    # Xeshlash sekin bo'lishi mumkin, shuning uchun yozish tranzaksiyasidan oldin
+    orphans = _orphan_hashes(conn, live)
+    moves = _rehome_orphans(conn, orphans)
+    name_moves, held = _rehome_removed(conn, live, orphans, moves)
+    moves += name_moves
+    pruned = collections.Counter()
+    freed = []
+    with _transaction() as conn:
+        # Eski (Windows) kalitlar
+        backslashed = set()
+        for table in _PATH_TABLES:
+            if table != 'storage_objects':
+                backslashed.update(key for (key,) in conn.execute(f"SELECT path FROM {table} WHERE instr(path, '\\')"))
+        for key in backslashed:
+            freed += _merge_paths(conn, key, _normalize_key(key))
+
+        for old_key, new_key in moves:
+            freed += _merge_paths(conn, old_key, new_key)
+
+        # Mavjud bo'lmagan yo'llar (yangi yuklanib, hali katalogga tushmaganlari tegilmaydi)
+        for table in ('comments', 'downloads', 'views', 'downloads_daily', 'preview_index', 'content_docs', 'file_blobs'):
+            dead = {
+                key for (key,) in conn.execute(f"SELECT DISTINCT path FROM {table}")
+                if key not in live and key not in held and not os.path.exists(_abs_path(key))
+            }
+            if not dead:
+                continue
+            if table == 'file_blobs':
+                for key in dead:
+                    freed += _blob_release(conn, key)
+            else:
+                conn.executemany(f"DELETE FROM {table} WHERE path = ?", [(key,) for key in dead])
+            pruned[table] += len(dead)
+        dead = [
+            (scope, key) for scope, key in conn.execute("SELECT DISTINCT scope, path FROM stats_buckets")
+            if key and key not in live and key not in held and not os.path.exists(_abs_path(key))
+        ]
+        if dead:
+            conn.executemany("DELETE FROM stats_buckets WHERE scope = ? AND path = ?", dead)
+            pruned['stats_buckets'] += len(dead)
+        # Eslab qolingan o'chirilgan fayllar: qayta bog'langan, qaytib kelgan yoki ushlab turilmaganlari
+        conn.executemany(
+            "DELETE FROM removed_files WHERE path = ?",
+            [(key,) for (key,) in conn.execute("SELECT path FROM removed_files") if key not in held]
+        )
+        conn.execute("DELETE FROM content_fts WHERE rowid NOT IN (SELECT id FROM content_docs)")
+        if backslashed or moves or pruned:
+            for table in _PATH_TABLES:
+                _bump_version(conn, table)
+        placeholders = ",".join("?" * len(freed))
+        blob_bytes = conn.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM blobs WHERE sha256 IN ({placeholders})", freed
+        ).fetchone()[0] if freed else 0
+        conn.execute(
+            "INSERT OR REPLACE INTO settings (name, value) VALUES ('last_compaction', ?)",
+            (datetime.now().isoformat(),)
+        )
+    _delete_blobs(freed)
+
+    # Bo'shagan sahifalar bo'lsa baza fayli kichraytiriladi
+    if conn.execute("PRAGMA freelist_count").fetchone()[0]:
+        try:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.OperationalError:
+            # Boshqa jarayon band qilgan - keyingi safar
+            pass
+    db_after = conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+    report = {
+        "normalized": len(backslashed), "rehomed": len(moves), "pruned": dict(pruned),
+        "entries": len(backslashed) + len(moves) + sum(pruned.values()),
+        "bytes": blob_bytes + max(db_before - db_after, 0),
+    }
+    count('compaction_entries_total', report["entries"])
+    return report
+
+@st.cache_resource
+def _compactor():
+    """Rejalashtirilgan tozalash oqimi (jarayon bo'yicha bitta)"""
+    threading.Thread(target=_compaction_loop, daemon=True).start()
+    return True
+
+def _compaction_loop():
+    """Oxirgi tozalashdan COMPACT_INTERVAL o'tganda compact_stores ni ishga tushirish"""
+    wait_seconds = 60
+    while True:
+        time.sleep(max(wait_seconds, 60))
+        try:
+            row = _db().execute("SELECT value FROM settings WHERE name = 'last_compaction'").fetchone()
+            last = datetime.fromisoformat(row[0]) if row else None
+            wait_seconds = 0 if last is None else COMPACT_INTERVAL - (datetime.now() - last).total_seconds()
+            if wait_seconds <= 0:
+                compact_stores()
+                wait_seconds = COMPACT_INTERVAL
+        except Exception:
+            wait_seconds = COMPACT_INTERVAL
+
+def _catalog_apply(conn, abs_path):
+    """Bitta fayl/papka katalog yozuvlarini diskdagi holatga keltirish (tranzaksiya ichida)"""
+    key = _path_key(abs_path)
+    _catalog_remove(conn, key)
+    if os.path.isdir(abs_path):
+        folders, files = _scan_tree(abs_path)
+        _catalog_insert(conn, folders, files)
+    elif os.path.isfile(abs_path):
+        _catalog_insert(conn, [], [_catalog_row(abs_path, os.stat(abs_path))])
+    # Ota-papka mtime i ham o'zgardi
+    parent = os.path.dirname(abs_path)
+    if key and os.path.isdir(parent):
+        conn.execute(
+            "UPDATE folders SET mtime = ? WHERE path = ?",
+            (os.stat(parent).st_mtime, _path_key(parent))
+        )
+    _bump_version(conn, 'catalog')
+    _tree_refresh(conn, key)
+
+def catalog_update(abs_path):
+    """Bitta fayl/papka o'zgargandan keyin katalogni yangilash"""
+    # Nomi o'zgargan, o'chirilgan yoki qayta yuklangan fayl xotiradan ham chiqadi
+    hot_cache_invalidate(_path_key(abs_path))
+    try:
+        _ensure_catalog()
+        with _transaction() as conn:
+            _catalog_apply(conn, abs_path)
+    except:
+        pass
+    schedule_content_index(_path_key(abs_path))
+
+@st.cache_resource
+def _leaderboard():
+    """Eng ko'p yuklangan TOP_K fayl va boshqa reyting so'rovlari keshi"""
+    return {"lock": threading.Lock(), "key": None, "top": {}, "boards": {}}
+
+def _catalog_stats_versions(conn):
+    """Reyting va papka daraxti amal qiladigan (yuklashlar, katalog) versiyalari"""
+    rows = dict(conn.execute("SELECT name, version FROM versions WHERE name IN ('downloads', 'catalog')"))
+    return rows.get('downloads', 0), rows.get('catalog', 0)
+
+def _leaderboard_apply(conn, totals):
+    """Flush paytida yangilangan hisoblarni xotiradagi TOP_K ga qo'shish"""
+    board = _leaderboard()
+    placeholders = ",".join("?" * len(totals))
+    # Faqat katalogda bor (o'chirilmagan) fayllar reytingga kiradi
+    sizes = dict(conn.execute(f"SELECT path, size FROM catalog WHERE path IN ({placeholders})", list(totals)))
+    new_key = _catalog_stats_versions(conn)
+    with board["lock"]:
+        # Boshqa jarayon ham yozgan bo'lsa, keyingi o'qishda to'liq yangilanadi
+        if board["key"] != (new_key[0] - 1, new_key[1]):
+            board["key"] = None
+            return
+        top = board["top"]
+        for key, total in totals.items():
+            if key not in sizes:
+                continue
+            if key in top or len(top) < TOP_K or total > min(c for c, _ in top.values()):
+                top[key] = (total, sizes[key])
+                if len(top) > TOP_K:
+                    del top[min(top, key=lambda k: top[k][0])]
+        board["key"] = new_key
+
+def _leaderboard_top():
+    """Xotiradagi TOP_K (versiya o'zgargan bo'lsa indeks bo'yicha qayta o'qiladi)"""
+    conn = _db()
+    board = _leaderboard()
+    key = _catalog_stats_versions(conn)
+    with board["lock"]:
+        if board["key"] != key:
+            rows = conn.execute(
+                "SELECT d.path, d.count, c.size FROM downloads d JOIN catalog c ON c.path = d.path "
+                "ORDER BY d.count DESC LIMIT ?",
+                (TOP_K,)
+            )
+            board["top"] = {path: (count, size) for path, count, size in rows}
+            board["boards"] = {}
+            board["key"] = key
+        return dict(board["top"]), board
+
+@timed
+def get_top_downloads(limit=5, folder=None, days=None):
+    """Eng ko'p yuklangan fayllar: [(kalit, yuklashlar soni, hajm)]"""
+    _ensure_catalog()
+    top, board = _leaderboard_top()
+    if folder is None and days is None and limit <= TOP_K:
+        # Hali bazaga tushmagan yuklashlar ham hisobga olinadi
+        buffer = _download_buffer()
+        with buffer["lock"]:
+            for key, count in buffer["pending"].items():
+                if key in top:
+                    top[key] = (top[key][0] + count, top[key][1])
+        ranked = sorted(top.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        return [(key, count, size) for key, (count, size) in ranked]
+
+    # Papka yoki vaqt oralig'i bo'yicha reyting: versiya o'zgarmaguncha keshda
+    board_key = (limit, folder, days)
+    with board["lock"]:
+        if board_key in board["boards"]:
+            return board["boards"][board_key]
+    where, params = [], []
+    if folder:
+        low, high = _prefix_range(folder)
+        where.append("c.path >= ? AND c.path < ?")
+        params += [low, high]
+    if days:
+        since = (datetime.now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        source = "(SELECT path, SUM(count) AS count FROM downloads_daily WHERE day >= ? GROUP BY path)"
+        params.insert(0, since)
+    else:
+        source = "downloads"
+    sql = f"SELECT d.path, d.count, c.size FROM {source} d JOIN catalog c ON c.path = d.path"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY d.count DESC, d.path LIMIT ?"
+    rows = _db().execute(sql, params + [limit]).fetchall()
+    with board["lock"]:
+        board["boards"][board_key] = rows
+    return rows
+
+# --- Tez-tez yuklanadigan fayllar keshi (xotirada) ---
+@st.cache_resource
+def _hot_cache():
+    """Eng ko'p yuklanadigan fayllar baytlari (jarayon bo'yicha umumiy)"""
+    # entries: kalit -> (baytlar yoki mmap, os.stat); tartibi - oxirgi ishlatilish
+    # (LRU), freq - so'rovlar soni (LFU)
+    state = {
+        "lock": threading.Lock(), "entries": collections.OrderedDict(), "bytes": 0,
+        "freq": collections.Counter()
+    }
+    threading.Thread(target=_hot_cache_seed, args=(state,), daemon=True).start()
+    return state
+
+def _hot_drop(state, key):
+    """Faylni keshdan chiqarish (lock ostida)"""
+    entry = state["entries"].pop(key, None)
+    if entry is None:
+        return
+    state["bytes"] -= entry[1].st_size
+    if isinstance(entry[0], mmap.mmap):
+        try:
+            entry[0].close()
+        except BufferError:
+            # Hali yuborilayotgan bo'lsa, mmap ni GC yopadi
+            pass
+
+def _hot_touch(state, key, weight=1):
+    """So'rovni hisoblash; jadval kattalashsa hamma sonlar yarmiga tushadi"""
+    freq = state["freq"]
+    freq[key] += weight
+    if len(freq) > HOT_CACHE_MAX_TRACKED:
+        for k, v in list(freq.items()):
+            if v > 1:
+                freq[k] = v // 2
+            else:
+                del freq[k]
+    return freq.get(key, 0)
+
+def _hot_make_room(state, needed, frequency, dry_run=False):
+    """Joy bo'shatish: eng kam so'ralgan (teng bo'lsa eng uzoq ishlatilmagan)
+    fayllar chiqariladi, yangi fayldan ko'p so'ralganlarga tegilmaydi"""
+    free = HOT_CACHE_MAX_BYTES - state["bytes"]
+    if free >= needed:
+        return True
+    entries, freq = state["entries"], state["freq"]
+    victims = []
+    # sorted barqaror: teng chastotalarda OrderedDict (LRU) tartibi saqlanadi
+    for key in sorted(entries, key=lambda k: freq.get(k, 0)):
+        if freq.get(key, 0) > frequency:
+            break
+        victims.append(key)
+        free += entries[key][1].st_size
+        if free >= needed:
+            break
+    if free < needed:
+        return False
+    if not dry_run:
+        for key in victims:
+            _hot_drop(state, key)
+        count('hot_cache_evictions_total', len(victims))
+    return True
+
+def _hot_load(file_path):
+    """Faylni o'qish: katta fayllar mmap (sahifa keshi), kichiklari bytes"""
+    with open(file_path, 'rb') as f:
+        stat_result = os.fstat(f.fileno())
+        if stat_result.st_size >= HOT_CACHE_MMAP_MIN:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, 'MADV_WILLNEED'):
+                buffer.madvise(mmap.MADV_WILLNEED)
+        else:
+            buffer = f.read()
+    count('file_opens_total')
+    count('file_bytes_read_total', stat_result.st_size)
+    return buffer, stat_result
+
+def _hot_admit(state, file_path, key, frequency):
+    """Faylni o'qib keshga qo'yish; sig'masa (None, None)"""
+    with state["lock"]:
+        if not _hot_make_room(state, os.path.getsize(file_path), frequency, dry_run=True):
+            return None, None
+    buffer, stat_result = _hot_load(file_path)
+    with state["lock"]:
+        _hot_drop(state, key)
+        if _hot_make_room(state, stat_result.st_size, frequency):
+            state["entries"][key] = (buffer, stat_result)
+            state["bytes"] += stat_result.st_size
+    return buffer, stat_result
+
+def hot_file(file_path):
+    """Fayl baytlari keshdan: (baytlar yoki mmap, stat); keshga sig'masa (None, stat)"""
+    # Har so'rovda faqat stat (disk o'qilmaydi): mtime yoki hajm o'zgargan
+    # bo'lsa (qayta yuklash, tashqi o'zgarish) eski nusxa tashlanadi
+    key = _path_key(file_path)
+    stat_result = os.stat(file_path)
+    state = _hot_cache()
+    with state["lock"]:
+        frequency = _hot_touch(state, key)
+        entry = state["entries"].get(key)
+        if entry is not None:
+            cached = entry[1]
+            if (cached.st_mtime_ns, cached.st_size) == (stat_result.st_mtime_ns, stat_result.st_size):
+                state["entries"].move_to_end(key)
+            else:
+                _hot_drop(state, key)
+                entry = None
+    if entry is not None:
+        count('hot_cache_hits_total')
+        return entry
+    count('hot_cache_misses_total')
+    if stat_result.st_size > HOT_CACHE_MAX_FILE:
+        return None, stat_result
+    buffer, loaded = _hot_admit(state, file_path, key, frequency)
+    return (buffer, loaded) if buffer is not None else (None, stat_result)
+
+def hot_cache_invalidate(key):
+    """Fayl (papka bo'lsa ichidagi hamma fayllar) keshdan chiqariladi"""
+    state = _hot_cache()
+    low, high = _prefix_range(key)
+    with state["lock"]:
+        for k in [k for k in state["entries"] if not key or k == key or low <= k < high]:
+            _hot_drop(state, k)
+
+def hot_cache_stats():
+    """Diagnostika uchun: (fayllar soni, band baytlar)"""
+    state = _hot_cache()
+    with state["lock"]:
+        return len(state["entries"]), state["bytes"]
+
+def _hot_cache_seed(state):
+    """Ishga tushganda eng ko'p yuklangan fayllar oldindan keshga olinadi"""
+    try:
+        top = get_top_downloads(HOT_CACHE_SEED)
+    except Exception:
+        return
+    for rank, (key, _, _) in enumerate(top):
+        # Reytingdagi o'rni boshlang'ich chastota bo'ladi
+        with state["lock"]:
+            frequency = _hot_touch(state, key, HOT_CACHE_SEED - rank)
+            if key in state["entries"]:
+                continue
+        try:
+            file_path = _abs_path(key)
+            if os.path.getsize(file_path) <= HOT_CACHE_MAX_FILE:
+                _hot_admit(state, file_path, key, frequency)
+        except OSError:
+            continue
+
+@timed
+def _read_bytes(path):
+    """Diskdagi faylni to'liq o'qish (yuklab olish keshini chetlab)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    count('file_opens_total')
+    count('file_bytes_read_total', len(data))
+    return data
+
+def read_file_bytes(file_path):
+    """Kutubxona fayli tarkibini o'qish (faqat yuklab olish bosilganda chaqiriladi)"""
+    buffer, _ = hot_file(local_copy(file_path))
+    if buffer is not None:
+        return buffer[:] if isinstance(buffer, mmap.mmap) else buffer
+    return _read_bytes(file_path)
+
+def render_download_button(file_path, key, label="⬇️"):
+    """Yuklab olish tugmasi (fayl baytlari render paytida o'qilmaydi)"""
+    url = download_url(file_path)
+    if url:
+        st.link_button(label, url)
+        return
+    # data sifatida callable beriladi: Streamlit uni faqat foydalanuvchi
+    # tugmani bosganda chaqiradi, shuning uchun har bir rerun da fayllar
+    # xotiraga yuklanmaydi.
+    st.download_button(
+        label=label,
+        data=functools.partial(read_file_bytes, file_path),
+        file_name=os.path.basename(file_path),
+        mime="application/octet-stream",
+        key=key,
+        on_click=register_download,
+        args=(file_path,)
+    )
+
+# --- Papkani ZIP arxiv qilib yuklash ---
+@st.cache_resource
+def _zip_cache():
+    """Arxiv keshi: har bir arxiv faqat bir marta quriladi (jarayon bo'yicha)"""
+    os.makedirs(ZIP_CACHE_FOLDER, exist_ok=True)
+    return {"lock": threading.Lock(), "building": {}}
+
+def _folder_zip_entries(folder_path):
+    """Papkadagi (ichki papkalar bilan) fayllar katalogdan: [(kalit, hajm, mtime)]"""
+    _ensure_catalog()
+    low, high = _prefix_range(_path_key(folder_path))
+    return _db().execute(
+        "SELECT path, size, mtime FROM catalog WHERE path >= ? AND path < ? ORDER BY path",
+        (low, high)
+    ).fetchall()
+
+def _folder_zip_key(entries):
+    """Arxiv kaliti: fayllar yo'li, hajmi va mtime idan xesh"""
+    digest = hashlib.sha256()
+    for key, size, mtime in entries:
+        digest.update(f"{key}\0{size}\0{mtime!r}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def _write_folder_zip(folder_path, entries, target):
+    """Arxivni fayllarni bo'laklab o'qib yozish (xotira sarfi o'zgarmas)"""
+    prefix_len = len(_path_key(folder_path)) + 1
+    root = os.path.basename(os.path.normpath(folder_path))
+    with zipfile.ZipFile(target, 'w', allowZip64=True) as archive:
+        for key, _, _ in entries:
+            ext = os.path.splitext(key)[1].lower()
+            try:
+                archive.write(
+                    _abs_path(key), f"{root}/{key[prefix_len:]}",
+                    compress_type=zipfile.ZIP_STORED if ext in ZIP_STORED_EXTS else zipfile.ZIP_DEFLATED
+                )
+            except OSError:
+                # Arxivlash paytida o'chirilgan fayl
+                continue
+
+def _evict_zip_cache(keep):
+    """Kesh hajmi chegaradan oshsa eng uzoq ishlatilmagan arxivlarni o'chirish"""
+    archives, total = [], 0
+    now = time.time()
+    for entry in os.scandir(ZIP_CACHE_FOLDER):
+        try:
+            stat_result = entry.stat()
+        except OSError:
+            continue
+        if _is_partial(entry.name):
+            # To'xtab qolgan yozishlar qoldig'i
+            if now - stat_result.st_mtime > 3600:
+                with contextlib.suppress(OSError):
+                    os.remove(entry.path)
+            continue
+        archives.append((stat_result.st_mtime, entry.path, stat_result.st_size))
+        total += stat_result.st_size
+    for _, path, size in sorted(archives):
+        if total <= ZIP_CACHE_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        with contextlib.suppress(OSError):
+            os.remove(path)
+            total -= size
+
+@timed
+def build_folder_zip(folder_path):
+    """Papka arxivini keshdan olish yoki qurish; arxiv yo'lini qaytaradi"""
+    entries = _folder_zip_entries(folder_path)
+    archive_path = os.path.join(ZIP_CACHE_FOLDER, _folder_zip_key(entries) + '.zip')
+    cache = _zip_cache()
+    with cache["lock"]:
+        build_lock = cache["building"].setdefault(archive_path, threading.Lock())
+    try:
+        with build_lock:
+            try:
+                # mtime LRU uchun oxirgi ishlatilgan vaqt sifatida yangilanadi
+                os.utime(archive_path)
+                return archive_path
+            except OSError:
+                pass
+            fd, tmp_path = tempfile.mkstemp(prefix='.zip', suffix=PARTIAL_SUFFIX, dir=ZIP_CACHE_FOLDER)
+            try:
+                with os.fdopen(fd, 'wb') as target:
+                    _write_folder_zip(folder_path, entries, target)
+                os.replace(tmp_path, archive_path)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+                raise
+    finally:
+        with cache["lock"]:
+            cache["building"].pop(archive_path, None)
+    _evict_zip_cache(archive_path)
+    return archive_path
+
+def read_folder_zip(folder_path):
+    """Papka arxivi baytlari (faqat tugma bosilganda chaqiriladi)"""
+    if get_folder_stats(folder_path)["bytes"] > ZIP_INLINE_MAX_BYTES:
+        raise ValueError("Papka xotirada arxivlash uchun juda katta")
+    for _ in range(2):
+        try:
+            return _read_bytes(build_folder_zip(folder_path))
+        except FileNotFoundError:
+            # Arxivni o'qishdan oldin boshqa so'rov uni keshdan chiqargan
+            continue
+    return _read_bytes(build_folder_zip(folder_path))
+
+def register_folder_download(folder_path):
+    """Papka arxivi yuklanganda ichidagi har bir faylni hisoblash"""
+    for key, _, _ in _folder_zip_entries(folder_path):
+        register_download(_abs_path(key))
+
+def render_folder_zip_button(folder_path, key, txt):
+    """Papkani ZIP qilib yuklab olish tugmasi (arxiv bosilganda tayyorlanadi)"""
+    url = download_url(folder_path, folder=True)
+    if url:
+        st.link_button(txt['zip_download'], url)
+        return
+    if get_folder_stats(folder_path)["bytes"] > ZIP_INLINE_MAX_BYTES:
+        st.caption(txt['zip_too_large'].format(size=format_size(ZIP_INLINE_MAX_BYTES)))
+        return
+    st.download_button(
+        label=txt['zip_download'],
+        data=functools.partial(read_folder_zip, folder_path),
+        file_name=os.path.basename(os.path.normpath(folder_path)) + ".zip",
+        mime="application/zip",
+        key=key,
+        on_click=register_folder_download,
+        args=(folder_path,)
+    )
+
+# --- HTTP yuklab olish serveri (keshlash va qayta davom ettirish) ---
+class _DownloadHandler(BaseHTTPRequestHandler):
+    """/f/<kalit> - fayl, /z/<kalit> - papka arxivi"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            if not self._metrics_allowed():
+                self._send_empty(404)
+                return
+            body = render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._serve(head=False)
+
+    def _metrics_allowed(self):
+        """/metrics faqat to'g'ri token bilan beriladi"""
+        if not METRICS_TOKEN:
+            return False
+        header = self.headers.get('Authorization', '')
+        return hmac.compare_digest(header.encode('utf-8'), f"Bearer {METRICS_TOKEN}".encode('utf-8'))
+
+    def _client(self):
+        """Mijoz manzili. Ishonchli proksi ortida - X-Forwarded-For ning oxirgi
+        yozuvi (uni proksi qo'shadi; oldingilarini mijoz o'zi yozishi mumkin)"""
+        if DOWNLOAD_TRUST_PROXY:
+            forwarded = ','.join(self.headers.get_all('X-Forwarded-For') or []).split(',')[-1].strip()
+            if forwarded:
+                return forwarded
+        return self.client_address[0]
+
+    def _resolve(self):
+        """So'rov yo'lidan (diskdagi fayl, fayl nomi, hisoblash funksiyasi, keshlanadimi)"""
+        route, _, quoted = urllib.parse.urlsplit(self.path).path.lstrip('/').partition('/')
+        key = urllib.parse.unquote(quoted).strip('/')
+        if not key or any(part in ('', '.', '..') for part in key.split('/')):
+            return None
+        _ensure_catalog()
+        conn = _db()
+        if route == 'f':
+            # Faqat katalogdagi fayllar beriladi (yo'l bo'yicha chiqib ketish yo'q)
+            if not conn.execute("SELECT 1 FROM catalog WHERE path = ?", (key,)).fetchone():
+                return None
+            file_path = local_copy(_abs_path(key))
+            return file_path, os.path.basename(file_path), functools.partial(register_download, file_path), True
+        if route == 'z':
+            if not conn.execute("SELECT 1 FROM folders WHERE path = ?", (key,)).fetchone():
+                return None
+            folder_path = _abs_path(key)
+            return (
+                build_folder_zip(folder_path), key.rsplit('/', 1)[-1] + '.zip',
+                functools.partial(register_folder_download, folder_path), False
+            )
+        return None
+
+    def _send_empty(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _not_modified(self, etag, mtime):
+        """If-None-Match / If-Modified-Since shartlari bajarilsa True"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                pass
+        return False
+
+    def _byte_range(self, size, etag, last_modified):
+        """Range sarlavhasidan (boshi, oxiri) yoki None (butun fayl); 416 uchun False"""
+        header = self.headers.get('Range')
+        if not header or not header.startswith('bytes=') or ',' in header:
+            # Bir nechta oraliq so'ralsa butun fayl beriladi
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range not in (etag, last_modified):
+            return None
+        start, _, end = header[len('bytes='):].strip().partition('-')
+        try:
+            if start:
+                start = int(start)
+                end = min(int(end), size - 1) if end else size - 1
+            else:
+                # bytes=-N: oxirgi N bayt
+                start, end = max(size - int(end), 0), size - 1
+        except ValueError:
+            return None
+        if start > end or start >= size:
+            return False
+        return start, end
+
+    def _serve(self, head):
+        try:
+            resolved = self._resolve()
+        except Exception:
+            resolved = None
+        if resolved is None:
+            self._send_empty(404)
+            return
+        file_path, file_name, on_complete, cacheable = resolved
+        buffer = None
+        if cacheable:
+            try:
+                buffer, stat_result = hot_file(file_path)
+            except OSError:
+                pass
+        if buffer is not None:
+            # Xotiradagi fayl diskka murojaat qilmasdan yuboriladi
+            f = contextlib.nullcontext()
+        else:
+            try:
+                f = open(file_path, 'rb')
+            except OSError:
+                self._send_empty(404)
+                return
+            count('file_opens_total')
+            stat_result = os.fstat(f.fileno())
+        with f:
+            size = stat_result.st_size
+            etag = f'"{size:x}-{stat_result.st_mtime_ns:x}"'
+            last_modified = email.utils.formatdate(stat_result.st_mtime, usegmt=True)
+            cache_headers = [
+                ('ETag', etag), ('Last-Modified', last_modified),
+                ('Cache-Control', f'public, max-age={DOWNLOAD_CACHE_MAX_AGE}'), ('Accept-Ranges', 'bytes'),
+            ]
+            if self._not_modified(etag, stat_result.st_mtime):
+                self._send_empty(304, cache_headers)
+                return
+            byte_range = self._byte_range(size, etag, last_modified)
+            if byte_range is False:
+                self._send_empty(416, [('Content-Range', f'bytes */{size}')])
+                return
+            start, end = byte_range or (0, size - 1)
+            self.send_response(206 if byte_range else 200)
+            for name, value in cache_headers:
+                self.send_header(name, value)
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-Type', 'application/zip' if file_name.endswith('.zip') else 'application/octet-stream')
+            self.send_header('Content-Disposition', "attachment; filename*=UTF-8''" + urllib.parse.quote(file_name))
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            if head:
+                return
+            self.wfile.flush()
+            sent = 0
+            try:
+                with contextlib.ExitStack() as stack:
+                    view = stack.enter_context(memoryview(buffer)) if buffer is not None else None
+                    while start + sent <= end:
+                        offset = start + sent
+                        length = min(DOWNLOAD_SEND_CHUNK, end + 1 - offset)
+                        if view is not None:
+                            self.wfile.write(view[offset:offset + length])
+                        else:
+                            # socket.sendfile imkon bo'lsa os.sendfile (nol nusxa) ishlatadi
+                            length = self.connection.sendfile(f, offset, length)
+                            if not length:
+                                break
+                        sent += length
+            except OSError:
+                # Mijoz uzildi - yetgan qismi keyingi davom ettirish uchun eslab qolinadi
+                self.close_connection = True
+            count('download_bytes_sent_total', sent)
+            complete = _track_delivery((self._client(), file_path, etag), start, sent, size)
+        # Fayl boshidan oxirigacha yetkazilgandagina yuklash hisoblanadi: qismlab
+        # (davom ettirib) yuklash bir marta sanaladi, faqat oxiri (bytes=-N) so'ralsa - sanalmaydi
+        if complete:
+            on_complete()
+
+@st.cache_resource
+def _download_deliveries():
+    """Hali to'liq yetkazilmagan yuklashlar: (mijoz, fayl, ETag) -> yetkazilgan oraliqlar"""
+    return {"lock": threading.Lock(), "spans": collections.OrderedDict()}
+
+def _track_delivery(key, start, sent, size):
+    """Yetkazilgan [start, start + sent) oraliqni qo'shish; fayl to'liq yetkazilgan bo'lsa True"""
+    if start == 0 and sent >= size:
+        return True
+    if sent <= 0:
+        return False
+    state = _download_deliveries()
+    with state["lock"]:
+        spans = sorted(state["spans"].pop(key, []) + [(start, start + sent)])
+        merged = [spans[0]]
+        for span_start, span_end in spans[1:]:
+            if span_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], span_end))
+            else:
+                merged.append((span_start, span_end))
+        if merged[0][0] == 0 and merged[0][1] >= size:
+            return True
+        state["spans"][key] = merged
+        while len(state["spans"]) > DOWNLOAD_TRACK_MAX:
+            state["spans"].popitem(last=False)
+    return False
+
+@st.cache_resource
+def _download_server():
+    """Yuklab olish HTTP serveri (jarayon bo'yicha bitta); ishga tushmasa None"""
+    if not DOWNLOAD_SERVER_ENABLED:
+        return None
+    try:
+        server = ThreadingHTTPServer((DOWNLOAD_SERVER_HOST, DOWNLOAD_SERVER_PORT), _DownloadHandler)
+    except OSError:
+        # Port band (masalan, boshqa jarayon allaqachon ishga tushirgan)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _download_base_url():
+    """Brauzer uchun yuklab olish serverining manzili"""
+    return DOWNLOAD_BASE_URL.rstrip('/')
+
+def download_url(path, folder=False):
+    """Fayl (yoki papka arxivi) uchun yuklab olish havolasi; server bo'lmasa None"""
+    if _download_server() is None:
+        return None
+    route = 'z' if folder else 'f'
+    return f"{_download_base_url()}/{route}/{urllib.parse.quote(_path_key(path))}"
 
 def clear_search_state():
     """Qidiruvni tozalash"""
@@ -159,97 +2690,911 @@ def rename_item(path, old_name, new_name):
     try:
         old_path = os.path.join(path, old_name)
         new_path = os.path.join(path, new_name)
-        os.rename(old_path, new_path)
+        _storage().rename(_path_key(old_path), _path_key(new_path))
         
-        # Metadata (izoh) ni ham yangilash
-        data = load_metadata()
-        try:
-            old_key = os.path.relpath(old_path, UPLOAD_FOLDER)
-            new_key = os.path.relpath(new_path, UPLOAD_FOLDER)
-            if old_key in data:
-                data[new_key] = data.pop(old_key)
-                save_metadata_to_file(data)
-        except:
-            pass
-
-        # Stats (yuklashlar soni) ni ham yangilash
-        stats = load_stats()
+        # Izoh va statistika kalitlarini ham yangilash (papka bo'lsa ichidagilar ham)
         try:
-            old_key = os.path.relpath(old_path, UPLOAD_FOLDER)
-            new_key = os.path.relpath(new_path, UPLOAD_FOLDER)
-            if old_key in stats:
-                stats[new_key] = stats.pop(old_key)
-                save_stats(stats)
+            # Eski nom bilan buferda turgan yuklashlar ham ko'chishi kerak
+            flush_download_stats()
+            with _transaction() as conn:
+                # Ustiga yozilgan fayl bo'lsa, uning ombordagi havolasi bo'shaydi
+                freed = _blob_release(conn, _path_key(new_path))
+                _rekey_paths(conn, _path_key(old_path), _path_key(new_path))
+            _delete_blobs(freed)
         except:
             pass
-            
+        catalog_update(old_path)
+        catalog_update(new_path)
+
         return True
     except:
         return False
 
-def search_files(query, file_type=None):
-    """Fayllarni qidirish (rekursiv)"""
-    results = []
-    for root, dirs, files in os.walk(UPLOAD_FOLDER):
-        for file in files:
-            if query.lower() in file.lower():
-                if file_type and file_type != "Barchasi":
-                    if not file.lower().endswith(file_type.lower()):
-                        continue
-                full_path = os.path.join(root, file)
-                results.append((file, full_path))
-    return results
+def _bulk_new_name(pattern, name, index):
+    """Andoza bo'yicha yangi nom ({name}, {stem}, {ext}, {n}); yaroqsiz bo'lsa None"""
+    stem, ext = os.path.splitext(name)
+    try:
+        new_name = pattern.format(name=name, stem=stem, ext=ext, n=index)
+    except (KeyError, IndexError, ValueError, AttributeError):
+        return None
+    if not new_name or new_name in ('.', '..') or '/' in new_name or os.sep in new_name:
+        return None
+    return new_name
+
+def bulk_apply(path, names, action, value=None, target=None, progress=None):
+    """Papkadagi bir nechta element ustida bitta amal: 'move' (target papkaga),
+    'rename' (value - andoza), 'delete' yoki 'comment' (value - izoh).
+    Fayl tizimi amallari har element uchun alohida, izoh/statistika/katalog
+    esa hammasi uchun bitta tranzaksiyada yangilanadi.
+    Qaytaradi: (bajarilgan elementlar soni, [(nom, sabab)] - o'tkazib yuborilganlar).
+    Sabab - tarjima kaliti ('bulk_err_...') yoki xato matni.
+    Metama'lumotlarni yozib bo'lmasa RuntimeError (fayllar allaqachon ko'chgan)"""
+    # Buferdagi yuklashlar ham eski nomlar bilan birga ko'chishi kerak
+    flush_download_stats()
+    backend = _storage()
+    done, skipped = [], []
+    for index, name in enumerate(names, 1):
+        old_path = os.path.join(path, name)
+        old_key = _path_key(old_path)
+        try:
+            if not os.path.exists(old_path):
+                skipped.append((name, 'bulk_err_missing'))
+            elif action == 'comment':
+                if os.path.isfile(old_path):
+                    done.append((old_key, old_key))
+                else:
+                    skipped.append((name, 'bulk_err_folder'))
+            elif action == 'delete':
+                backend.delete(old_key)
+                done.append((old_key, None))
+            else:
+                new_name = name if action == 'move' else _bulk_new_name(value, name, index)
+                new_path = os.path.join(target if action == 'move' else path, new_name or name)
+                new_key = _path_key(new_path)
+                # Mavjud faylni ustidan yozmaslik va papkani o'z ichiga ko'chirmaslik
+                if not new_name:
+                    skipped.append((name, 'bulk_err_name'))
+                elif new_key == old_key:
+                    skipped.append((name, 'bulk_err_same'))
+                elif new_key.startswith(old_key + '/'):
+                    skipped.append((name, 'bulk_err_target'))
+                elif os.path.exists(new_path):
+                    skipped.append((name, 'bulk_err_exists'))
+                else:
+                    backend.rename(old_key, new_key)
+                    done.append((old_key, new_key))
+        except Exception as error:
+            logger.warning("Ommaviy amal (%s) bajarilmadi: %s", action, old_key, exc_info=True)
+            skipped.append((name, str(error) or type(error).__name__))
+        if progress:
+            progress(index, len(names))
+    if not done:
+        return 0, skipped
+
+    freed = []
+    try:
+        _ensure_catalog()
+        with _transaction() as conn:
+            if action == 'comment':
+                if value:
+                    conn.executemany(
+                        "INSERT INTO comments (path, comment) VALUES (?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET comment = excluded.comment",
+                        [(key, value) for key, _ in done]
+                    )
+                else:
+                    conn.executemany("DELETE FROM comments WHERE path = ?", [(key,) for key, _ in done])
+                _bump_version(conn, 'comments')
+            else:
+                for old_key, new_key in done:
+                    hot_cache_invalidate(old_key)
+                    if new_key is None:
+                        freed += _blob_release(conn, old_key)
+                        _forget_paths(conn, old_key)
+                    else:
+                        _rekey_paths(conn, old_key, new_key, bump=False)
+                        _catalog_apply(conn, _abs_path(new_key))
+                    _catalog_apply(conn, _abs_path(old_key))
+                if action != 'delete':
+                    for table in _PATH_TABLES:
+                        _bump_version(conn, table)
+    except Exception as error:
+        logger.exception("Ommaviy amal (%s) metama'lumotlari yozilmadi: %s", action, [key for key, _ in done])
+        # Fayllar ko'chgan, lekin izoh/statistika eski kalitlarda qoldi: hech bo'lmasa
+        # katalog diskka moslashtiriladi (yetimlarni compact_stores qayta bog'laydi)
+        with contextlib.suppress(Exception):
+            reconcile_catalog()
+        raise RuntimeError(str(error) or type(error).__name__) from error
+    _delete_blobs(freed)
+    for _, new_key in done:
+        if new_key is not None and action != 'comment':
+            schedule_content_index(new_key)
+    return len(done), skipped
+
+# O'zbek (va rus) kirill harflarini lotinchaga o'girish jadvali.
+# Qidiruvda ikkala yozuv ham bir xil ko'rinishga keltiriladi.
+_CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'ғ': 'g', 'д': 'd', 'е': 'e',
+    'ё': 'yo', 'ж': 'j', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'қ': 'q',
+    'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'ў': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ҳ': 'h', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e',
+    'ю': 'yu', 'я': 'ya',
+}
+_FOLD_TABLE = str.maketrans({
+    **_CYRILLIC_TO_LATIN,
+    # o‘, g‘ dagi turli apostroflar olib tashlanadi (ў/ғ bilan mos kelishi uchun)
+    "'": '', '‘': '', '’': '', 'ʻ': '', 'ʼ': '', '`': '',
+})
+_TOKEN_RE = re.compile(r'\w+')
+
+def fold_text(text):
+    """Matnni qidiruv uchun bir xil ko'rinishga keltirish (kirill -> lotin)"""
+    return text.lower().translate(_FOLD_TABLE)
+
+def _trigrams(folded):
+    """So'zlar bo'yicha trigramlar to'plami (chetlari bo'sh joy bilan)"""
+    grams = set()
+    for token in _TOKEN_RE.findall(folded):
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+def _build_search_index():
+    """Katalog va izohlar bo'yicha trigram inverted indeks qurish"""
+    comments = _metadata_snapshot()
+    paths, names, folded_names, exts, sizes = [], [], [], [], []
+    postings = {}
+    rows = _db().execute("SELECT path, name, ext FROM catalog ORDER BY path")
+    for doc_id, (key, name, ext) in enumerate(rows):
+        stem = fold_text(os.path.splitext(name)[0])
+        grams = _trigrams(stem) | _trigrams(fold_text(comments.get(key, "")))
+        for gram in grams:
+            postings.setdefault(gram, []).append(doc_id)
+        paths.append(key)
+        names.append(name)
+        folded_names.append(stem)
+        exts.append(ext)
+        sizes.append(len(grams))
+    return {
+        "paths": paths, "names": names, "folded_names": folded_names,
+        "exts": np.array(exts, dtype=object), "sizes": np.array(sizes, dtype=np.float32),
+        "postings": {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()},
+        "popularity": None, "popularity_version": None,
+    }
+
+@st.cache_resource
+def _search_index_holder():
+    """Qidiruv indeksi (barcha sessiyalar uchun umumiy)"""
+    return {"lock": threading.Lock(), "key": None, "index": None}
+
+def _search_index():
+    """Katalog yoki izohlar o'zgargan bo'lsa indeksni qayta qurish"""
+    _ensure_catalog()
+    holder = _search_index_holder()
+    key = (get_version('catalog'), get_version('comments'))
+    downloads_version = get_version('downloads')
+    with holder["lock"]:
+        if holder["key"] != key:
+            holder["index"] = _build_search_index()
+            holder["key"] = key
+        index = holder["index"]
+        if index["popularity_version"] != downloads_version:
+            # Yuklashlar soni 0..1 oralig'iga (log shkalada) keltiriladi
+            downloads = dict(_db().execute("SELECT path, count FROM downloads"))
+            counts = np.log1p(np.array([downloads.get(p, 0) for p in index["paths"]], dtype=np.float32))
+            index["popularity"] = counts / (counts.max() if counts.size and counts.max() > 0 else 1.0)
+            index["popularity_version"] = downloads_version
+        return index
+
+@timed
+def search_files(query, file_type=None, limit=SEARCH_LIMIT):
+    """Fayllarni qidirish (trigram indeks, kirill/lotin, xatoliklarga chidamli)"""
+    index = _search_index()
+    folded = fold_text(query).strip()
+    grams = _trigrams(folded)
+    if not grams or not index["paths"]:
+        return []
+
+    # Har bir hujjatda nechta so'rov trigrami borligini sanash
+    lists = [index["postings"][g] for g in grams if g in index["postings"]]
+    if not lists:
+        return []
+    hits = np.bincount(np.concatenate(lists), minlength=len(index["paths"])).astype(np.float32)
+    min_hits = max(1, math.ceil(len(grams) * SEARCH_MIN_SIMILARITY))
+    candidates = np.flatnonzero(hits >= min_hits)
+    if file_type and file_type != "Barchasi":
+        ext = file_type.lower()
+        if not ext.startswith('.'):
+            ext = '.' + ext
+        candidates = candidates[index["exts"][candidates] == ext]
+    if not candidates.size:
+        return []
+
+    # Dice o'xshashligi + yuklashlar soni bo'yicha reyting
+    quality = 2 * hits[candidates] / (len(grams) + index["sizes"][candidates])
+    scores = quality + SEARCH_DOWNLOAD_WEIGHT * index["popularity"][candidates]
+    if candidates.size > limit * 4:
+        keep = np.argpartition(-scores, limit * 4)[:limit * 4]
+        candidates, scores = candidates[keep], scores[keep]
+
+    # To'g'ridan-to'g'ri mos kelgan nomlarga bonus (faqat saralanganlar uchun)
+    ranked = []
+    for doc_id, score in zip(candidates.tolist(), scores.tolist()):
+        if folded in index["folded_names"][doc_id]:
+            score += 0.5
+        ranked.append((score, -doc_id))
+    ranked.sort(reverse=True)
+    return [
+        (index["names"][-neg_id], os.path.join(UPLOAD_FOLDER, index["paths"][-neg_id]))
+        for _, neg_id in ranked[:limit]
+    ]
+
+# --- Fayl ichidagi matn bo'yicha qidiruv (FTS5 indeksi) ---
+@st.cache_resource
+def _content_indexer():
+    """Matn indeksatorining navbati va fon oqimi (jarayon bo'yicha bitta)"""
+    state = {"queue": queue.Queue()}
+    threading.Thread(target=_content_index_loop, args=(state,), daemon=True).start()
+    # Ishga tushishda katalog bilan to'liq moslashtirish
+    state["queue"].put(None)
+    return state
+
+def schedule_content_index(key=None):
+    """Kalit (yoki None - hammasi) ostidagi fayllarni indekslash navbatiga qo'yish"""
+    _content_indexer()["queue"].put(key)
+
+def _content_index_loop(state):
+    """Navbatdagi o'zgarishlarni fon jarayonlarida indekslash"""
+    # fork ko'p oqimli server jarayonida xavfli, shuning uchun spawn
+    executor = ProcessPoolExecutor(
+        max_workers=CONTENT_INDEX_WORKERS,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+    while True:
+        keys = {state["queue"].get()}
+        # Ketma-ket kelgan so'rovlar bitta o'tishda bajariladi
+        while True:
+            try:
+                keys.add(state["queue"].get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if None in keys:
+                keys = {None}
+            jobs = {}
+            for key in keys:
+                jobs.update(_content_stale_files(key))
+            futures = [
+                executor.submit(content_extract.extract_file, key, os.path.join(UPLOAD_FOLDER, key), known_hash)
+                for key, known_hash in jobs.items()
+            ]
+            for future in as_completed(futures):
+                try:
+                    _content_store(*future.result())
+                except Exception:
+                    continue
+        except Exception:
+            continue
+
+def _content_stale_files(key=None):
+    """Indeksi eskirgan fayllar {kalit: eski xesh}; o'chirilganlarini tozalash"""
+    conn = _db()
+    _ensure_catalog()
+    where, params = "", []
+    if key is not None:
+        low, high = _prefix_range(key)
+        where, params = " AND (c.path = ? OR (c.path >= ? AND c.path < ?))", [key, low, high]
+    extensions = content_extract.supported_extensions()
+    placeholders = ",".join("?" * len(extensions))
+    rows = conn.execute(
+        "SELECT c.path, d.sha256 FROM catalog c LEFT JOIN content_docs d ON d.path = c.path "
+        f"WHERE c.ext IN ({placeholders}) "
+        "AND (d.path IS NULL OR d.mtime != c.mtime OR d.size != c.size)" + where,
+        extensions + params
+    ).fetchall()
+    with _transaction(conn) as conn:
+        # Katalogda yo'q yoki boshqa nom ostida qolib ketgan yozuvlar
+        conn.execute("DELETE FROM content_docs WHERE path NOT IN (SELECT path FROM catalog)")
+        conn.execute("DELETE FROM content_fts WHERE rowid NOT IN (SELECT id FROM content_docs)")
+    return dict(rows)
+
+def _content_store(key, mtime, size, sha256, text):
+    """Ajratib olingan matnni indeksga yozish (text=None: tarkib o'zgarmagan)"""
+    with _transaction() as conn:
+        if not conn.execute("SELECT 1 FROM catalog WHERE path = ?", (key,)).fetchone():
+            return
+        row = conn.execute("SELECT id FROM content_docs WHERE path = ?", (key,)).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE content_docs SET mtime = ?, size = ?, sha256 = ? WHERE id = ?",
+                (mtime, size, sha256, row[0])
+            )
+            if text is None:
+                return
+            doc_id = row[0]
+            conn.execute("DELETE FROM content_fts WHERE rowid = ?", (doc_id,))
+        else:
+            doc_id = conn.execute(
+                "INSERT INTO content_docs (path, mtime, size, sha256) VALUES (?, ?, ?, ?)",
+                (key, mtime, size, sha256)
+            ).lastrowid
+            if text is None:
+                text = content_extract.extract_text(os.path.join(UPLOAD_FOLDER, key))
+        conn.execute("INSERT INTO content_fts (rowid, body) VALUES (?, ?)", (doc_id, text))
+        _bump_version(conn, 'content')
+
+# --- Fayl ko'rinishlari (rasm va matndan parcha) ---
+@st.cache_resource
+def _preview_worker():
+    """Ko'rinish tayyorlovchi jarayonlar hovuzi (jarayon bo'yicha bitta)"""
+    os.makedirs(PREVIEW_FOLDER, exist_ok=True)
+    executor = ProcessPoolExecutor(
+        max_workers=PREVIEW_WORKERS,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+    return {"lock": threading.Lock(), "pending": set(), "executor": executor}
+
+def _preview_paths(sha256):
+    """Xesh bo'yicha (rasm, parcha) fayllari yo'li"""
+    folder = os.path.join(PREVIEW_FOLDER, sha256[:2])
+    return os.path.join(folder, sha256 + '.png'), os.path.join(folder, sha256 + '.txt')
+
+def _preview_lookup(keys):
+    """Tayyor ko'rinishlar {kalit: (xesh, rasm bor-yo'qligi)} (fayl o'zgarmagan bo'lsa)"""
+    found = {}
+    conn = _db()
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            "SELECT p.path, p.sha256, k.has_image FROM preview_index p "
+            "JOIN catalog c ON c.path = p.path AND c.mtime = p.mtime AND c.size = p.size "
+            f"JOIN preview_cache k ON k.sha256 = p.sha256 WHERE p.path IN ({placeholders})",
+            chunk
+        )
+        for key, sha256, has_image in rows:
+            found[key] = (sha256, has_image)
+    return found
+
+def schedule_previews(file_paths):
+    """Ko'rinishi yo'q yoki eskirgan fayllar uchun fon vazifalarini qo'yish (kutmaydi)"""
+    keys = [_path_key(file_path) for file_path in file_paths]
+    ready = _preview_lookup(keys)
+    worker = _preview_worker()
+    submitted = []
+    with worker["lock"]:
+        for key in keys:
+            if key in ready or key in worker["pending"]:
+                continue
+            worker["pending"].add(key)
+            submitted.append((key, worker["executor"].submit(
+                content_extract.make_preview, key, _abs_path(key), PREVIEW_IMAGE_WIDTH, PREVIEW_EXCERPT_CHARS
+            )))
+    # Tugagan vazifaning callback i shu oqimda darhol chaqiriladi va qulfni
+    # qayta oladi - shuning uchun callback lar qulf bo'shagandan keyin qo'shiladi
+    for key, future in submitted:
+        future.add_done_callback(functools.partial(_preview_done, key))
+
+def _preview_done(key, future):
+    """Tayyor ko'rinishni keshga yozish (hovuz oqimida chaqiriladi)"""
+    worker = _preview_worker()
+    try:
+        _preview_store(*future.result())
+    except Exception:
+        pass
+    finally:
+        with worker["lock"]:
+            worker["pending"].discard(key)
+
+def _preview_store(key, mtime, size, sha256, image, excerpt):
+    """Ko'rinish fayllarini yozib, indeks va LRU jadvalini yangilash"""
+    image_path, excerpt_path = _preview_paths(sha256)
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    total = len(excerpt.encode('utf-8'))
+    if image:
+        with open(image_path + PARTIAL_SUFFIX, 'wb') as f:
+            f.write(image)
+        os.replace(image_path + PARTIAL_SUFFIX, image_path)
+        total += len(image)
+    with open(excerpt_path + PARTIAL_SUFFIX, 'w', encoding='utf-8') as f:
+        f.write(excerpt)
+    os.replace(excerpt_path + PARTIAL_SUFFIX, excerpt_path)
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO preview_index (path, mtime, size, sha256) VALUES (?, ?, ?, ?)",
+            (key, mtime, size, sha256)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO preview_cache (sha256, has_image, bytes, used) VALUES (?, ?, ?, ?)",
+            (sha256, 1 if image else 0, total, time.time())
+        )
+        _evict_previews(conn)
+
+def _evict_previews(conn):
+    """Kesh hajmi chegaradan oshsa eng uzoq ko'rilmagan ko'rinishlarni o'chirish"""
+    total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM preview_cache").fetchone()[0]
+    if total <= PREVIEW_CACHE_MAX_BYTES:
+        return
+    evicted = []
+    for sha256, size in conn.execute("SELECT sha256, bytes FROM preview_cache ORDER BY used"):
+        if total <= PREVIEW_CACHE_MAX_BYTES:
+            break
+        evicted.append(sha256)
+        total -= size
+    conn.executemany("DELETE FROM preview_cache WHERE sha256 = ?", [(sha256,) for sha256 in evicted])
+    for sha256 in evicted:
+        for path in _preview_paths(sha256):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+@timed
+def get_preview(file_path):
+    """Tayyor ko'rinish {"image": baytlar yoki None, "excerpt": matn}; hali yo'q bo'lsa None"""
+    key = _path_key(file_path)
+    found = _preview_lookup([key]).get(key)
+    if found is None:
+        schedule_previews([file_path])
+        return None
+    sha256, has_image = found
+    image_path, excerpt_path = _preview_paths(sha256)
+    try:
+        with open(excerpt_path, 'r', encoding='utf-8') as f:
+            excerpt = f.read()
+        image = _read_bytes(image_path) if has_image else None
+    except OSError:
+        # Fayllar yo'qolgan (masalan, qo'lda o'chirilgan) - qayta tayyorlanadi
+        with _transaction() as conn:
+            conn.execute("DELETE FROM preview_cache WHERE sha256 = ?", (sha256,))
+        schedule_previews([file_path])
+        return None
+    with _transaction() as conn:
+        conn.execute("UPDATE preview_cache SET used = ? WHERE sha256 = ?", (time.time(), sha256))
+    return {"image": image, "excerpt": excerpt}
+
+def _toggle_preview(file_path):
+    """Fayl ko'rinishini ochish/yopish (ochilishi - faylning ko'rilishi)"""
+    open_previews = st.session_state.setdefault('open_previews', set())
+    if file_path in open_previews:
+        open_previews.discard(file_path)
+    else:
+        open_previews.add(file_path)
+        record_view(file_path)
+
+def render_preview_button(file_path, key, txt):
+    """Fayl qatoridagi 👁️ tugmasi"""
+    st.button("👁️", key=f"pv_{key}", help=txt['preview'], on_click=_toggle_preview, args=(file_path,))
+
+def render_preview(file_path, key, txt):
+    """Ochilgan fayl ko'rinishi (tayyor bo'lmasa kutmasdan xabar chiqariladi)"""
+    if file_path not in st.session_state.get('open_previews', ()):
+        return
+    preview = get_preview(file_path)
+    if preview is None:
+        st.caption(txt['preview_pending'])
+        # Bosilganda sahifa qayta chiziladi
+        st.button("🔄", key=f"pv_refresh_{key}")
+        return
+    if preview["image"]:
+        st.image(preview["image"], width=PREVIEW_IMAGE_WIDTH)
+    if preview["excerpt"]:
+        st.caption(preview["excerpt"] + "…")
+    elif not preview["image"]:
+        st.caption(txt['preview_none'])
+
+def _fts_query(text):
+    """Foydalanuvchi so'rovini xavfsiz FTS5 ifodasiga aylantirish"""
+    tokens = _TOKEN_RE.findall(text.lower())
+    # Har bir so'z prefiks sifatida: "suyagi" -> "suyagining" ham topiladi
+    return " ".join('"' + token.replace('"', '""') + '"*' for token in tokens)
+
+@timed
+def search_content(query, limit=SEARCH_LIMIT):
+    """Fayllar ichidan qidirish: (nom, to'liq yo'l, ajratilgan parcha) ro'yxati"""
+    match = _fts_query(query)
+    if not match:
+        return []
+    folded = _fts_query(fold_text(query))
+    if folded != match:
+        # Kirillcha so'rov lotincha matnni ham topishi uchun
+        match = f"({match}) OR ({folded})"
+    try:
+        rows = _db().execute(
+            "SELECT d.path, snippet(content_fts, 0, '**', '**', '…', 16) "
+            "FROM content_fts JOIN content_docs d ON d.id = content_fts.rowid "
+            "WHERE content_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    return [
+        (os.path.basename(key), os.path.join(UPLOAD_FOLDER, key), snippet.replace('\n', ' '))
+        for key, snippet in rows
+    ]
+
+# --- Papka ro'yxatini saralash va sahifalash ---
+@st.cache_resource
+def _listing_cache():
+    """Saralangan papka ro'yxatlari keshi (barcha sessiyalar uchun umumiy)"""
+    return {"lock": threading.Lock(), "entries": collections.OrderedDict()}
+
+def _scan_directory(path):
+    """Papkani bir marta o'qish: (papka nomlari, [(nom, hajm, mtime)])"""
+    folders, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    folders.append(entry.name)
+                elif entry.is_file() and not _is_partial(entry.name):
+                    stat_result = entry.stat()
+                    files.append((entry.name, stat_result.st_size, stat_result.st_mtime))
+            except OSError:
+                continue
+    return folders, files
+
+@timed
+def get_sorted_listing(path, sort_by='name'):
+    """Papka tarkibi saralangan holda: (papkalar, [(nom, hajm, mtime, yuklashlar)])"""
+    try:
+        dir_mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return [], []
+    # Papka, katalog yoki (yuklashlar bo'yicha saralashda) statistika
+    # o'zgarmaguncha oldingi natija qaytariladi
+    version = (dir_mtime, get_version('catalog'), get_version('downloads') if sort_by == 'downloads' else 0)
+    cache_key = (os.path.normpath(path), sort_by)
+    cache = _listing_cache()
+    with cache["lock"]:
+        hit = cache["entries"].get(cache_key)
+        if hit and hit[0] == version:
+            cache["entries"].move_to_end(cache_key)
+            return hit[1]
+
+    try:
+        folders, files = _scan_directory(path)
+    except OSError:
+        return [], []
+    downloads = {}
+    if sort_by == 'downloads':
+        folder_key = _path_key(path)
+        if folder_key:
+            low, high = _prefix_range(folder_key)
+            rows = _db().execute("SELECT path, count FROM downloads WHERE path >= ? AND path < ?", (low, high))
+        else:
+            rows = _db().execute("SELECT path, count FROM downloads")
+        downloads = {key.rsplit('/', 1)[-1]: count for key, count in rows if key.rpartition('/')[0] == folder_key}
+    files = [(name, size, mtime, downloads.get(name, 0)) for name, size, mtime in files]
+
+    folders.sort(key=str.lower)
+    if sort_by == 'size':
+        files.sort(key=lambda f: (-f[1], f[0].lower()))
+    elif sort_by == 'mtime':
+        files.sort(key=lambda f: (-f[2], f[0].lower()))
+    elif sort_by == 'downloads':
+        files.sort(key=lambda f: (-f[3], f[0].lower()))
+    else:
+        files.sort(key=lambda f: f[0].lower())
+
+    listing = (folders, files)
+    with cache["lock"]:
+        cache["entries"][cache_key] = (version, listing)
+        cache["entries"].move_to_end(cache_key)
+        while len(cache["entries"]) > LISTING_CACHE_SIZE:
+            cache["entries"].popitem(last=False)
+    return listing
+
+def _set_page(name, page):
+    """Sahifa kursorini o'zgartirish (tugma callback i)"""
+    st.session_state[f"page_{name}"]["page"] = page
+
+def paginate(items, name, context, page_size):
+    """session_state dagi kursor bo'yicha joriy sahifa: (elementlar, sahifa, sahifalar soni)"""
+    # Papka, so'rov yoki saralash o'zgarsa birinchi sahifaga qaytiladi
+    cursor = st.session_state.get(f"page_{name}")
+    if not cursor or cursor["context"] != context:
+        cursor = {"context": context, "page": 0}
+        st.session_state[f"page_{name}"] = cursor
+    pages = max(1, math.ceil(len(items) / page_size))
+    cursor["page"] = max(0, min(cursor["page"], pages - 1))
+    start = cursor["page"] * page_size
+    return items[start:start + page_size], cursor["page"], pages
+
+def render_listing_controls(name, txt, sortable=True):
+    """Saralash va sahifa hajmi tanlovi: (sort_by, page_size)"""
+    col_sort, col_size = st.columns([3, 1])
+    sort_by = 'name'
+    if sortable:
+        with col_sort:
+            sort_by = st.selectbox(
+                txt['sort_by'], LISTING_SORTS, format_func=lambda s: txt[f'sort_{s}'], key=f"sort_{name}"
+            )
+    with col_size:
+        page_size = st.selectbox(txt['page_size'], PAGE_SIZES, key=f"page_size_{name}")
+    return sort_by, page_size
+
+def render_pager(name, page, pages, txt):
+    """Oldingi/keyingi sahifa tugmalari"""
+    if pages <= 1:
+        return
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("◀", key=f"prev_{name}", disabled=page == 0, on_click=_set_page, args=(name, page - 1))
+    with col_info:
+        st.caption(f"{txt['page']} {page + 1} / {pages}")
+    with col_next:
+        st.button("▶", key=f"next_{name}", disabled=page >= pages - 1, on_click=_set_page, args=(name, page + 1))
+
+def page_listing(folders, files, name, context, page_size):
+    """Papkalar va fayllarni birgalikda sahifalash: (papkalar, fayllar, sahifa, sahifalar)"""
+    items = [(True, folder) for folder in folders] + [(False, row) for row in files]
+    page_items, page, pages = paginate(items, name, context, page_size)
+    page_folders = [item for is_dir, item in page_items if is_dir]
+    page_files = [item for is_dir, item in page_items if not is_dir]
+    return page_folders, page_files, page, pages
+
+# --- Papkalar daraxti va har bir papka bo'yicha yig'indilar ---
+# Daraxt katalog jadvallaridan quriladi (diskni aylanmaydi) va mutatsiya
+# funksiyalari faqat o'zgargan papka hamda uning ajdodlarini yangilaydi.
+_EMPTY_FOLDER_STATS = {"files": 0, "total_files": 0, "bytes": 0, "downloads": 0, "mtime": 0.0}
+
+@st.cache_resource
+def _folder_tree():
+    """Papkalar daraxti keshi (barcha sessiyalar uchun umumiy)"""
+    return {"lock": threading.Lock(), "key": None, "children": {}, "direct": {}, "totals": {}}
+
+def _parent_key(key):
+    """Kalitning ota-papkasi ('' - asosiy papka)"""
+    return key.rpartition('/')[0]
+
+def _key_depth(key):
+    """Papka chuqurligi (asosiy papka 0)"""
+    return key.count('/') + 1 if key else 0
+
+def _tree_load(tree, conn, folder_rows):
+    """Berilgan papkalarni daraxtga qo'shib, ularning o'z yig'indilarini o'qish"""
+    for key, parent, mtime in folder_rows:
+        tree["children"].setdefault(key, set())
+        if parent is not None:
+            tree["children"].setdefault(parent, set()).add(key)
+        tree["direct"][key] = {"files": 0, "bytes": 0, "downloads": 0, "mtime": mtime}
+    keys = [row[0] for row in folder_rows]
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            "SELECT c.folder, COUNT(*), SUM(c.size), MAX(c.mtime), SUM(COALESCE(d.count, 0)) "
+            "FROM catalog c LEFT JOIN downloads d ON d.path = c.path "
+            f"WHERE c.folder IN ({placeholders}) GROUP BY c.folder",
+            chunk
+        )
+        for key, files, size, mtime, downloads in rows:
+            direct = tree["direct"][key]
+            direct.update(files=files, bytes=size or 0, downloads=downloads or 0)
+            direct["mtime"] = max(direct["mtime"], mtime or 0.0)
+
+def _tree_total(tree, key):
+    """Papkaning (ichki papkalari bilan) yig'indisini qayta hisoblash"""
+    direct = tree["direct"].get(key)
+    if direct is None:
+        tree["totals"].pop(key, None)
+        return
+    total = dict(direct, total_files=direct["files"])
+    for child in tree["children"].get(key, ()):
+        child_total = tree["totals"].get(child)
+        if child_total:
+            total["total_files"] += child_total["total_files"]
+            total["bytes"] += child_total["bytes"]
+            total["downloads"] += child_total["downloads"]
+            total["mtime"] = max(total["mtime"], child_total["mtime"])
+    tree["totals"][key] = total
+
+def _tree_rebuild(tree, conn):
+    """Daraxtni katalogdan to'liq qurish"""
+    tree["children"], tree["direct"], tree["totals"] = {}, {}, {}
+    rows = conn.execute("SELECT path, parent, mtime FROM folders").fetchall()
+    _tree_load(tree, conn, rows)
+    for key in sorted(tree["direct"], key=_key_depth, reverse=True):
+        _tree_total(tree, key)
+
+def _tree_update_ancestors(tree, key):
+    """Papka va uning barcha ajdodlari yig'indisini yangilash"""
+    while True:
+        _tree_total(tree, key)
+        if not key:
+            break
+        key = _parent_key(key)
+
+def _tree_refresh(conn, key):
+    """catalog_update dan keyin faqat o'zgargan qismni yangilash"""
+    tree = _folder_tree()
+    new_key = _catalog_stats_versions(conn)
+    with tree["lock"]:
+        # Boshqa jarayon ham katalogni o'zgartirgan bo'lsa, to'liq qayta quriladi
+        if not key or tree["key"] != (new_key[0], new_key[1] - 1):
+            tree["key"] = None
+            return
+        prefix = key + '/'
+        stale = [k for k in tree["direct"] if k == key or k.startswith(prefix)]
+        for k in stale:
+            tree["direct"].pop(k, None)
+            tree["totals"].pop(k, None)
+            tree["children"].pop(k, None)
+        parent = _parent_key(key)
+        tree["children"].get(parent, set()).discard(key)
+
+        low, high = _prefix_range(key)
+        rows = conn.execute(
+            "SELECT path, parent, mtime FROM folders WHERE path = ? OR (path >= ? AND path < ?) OR path = ?",
+            (key, low, high, parent)
+        ).fetchall()
+        _tree_load(tree, conn, rows)
+        for k in sorted((row[0] for row in rows if row[0] != parent), key=_key_depth, reverse=True):
+            _tree_total(tree, k)
+        _tree_update_ancestors(tree, parent)
+        tree["key"] = new_key
+
+def _tree_apply_downloads(conn, pending):
+    """Flush qilingan yuklashlarni papka yig'indilariga qo'shish"""
+    tree = _folder_tree()
+    new_key = _catalog_stats_versions(conn)
+    placeholders = ",".join("?" * len(pending))
+    folders = dict(conn.execute(f"SELECT path, folder FROM catalog WHERE path IN ({placeholders})", list(pending)))
+    with tree["lock"]:
+        if tree["key"] != (new_key[0] - 1, new_key[1]):
+            tree["key"] = None
+            return
+        for path, folder in folders.items():
+            if folder not in tree["direct"]:
+                continue
+            tree["direct"][folder]["downloads"] += pending[path]
+            key = folder
+            while True:
+                if key in tree["totals"]:
+                    tree["totals"][key]["downloads"] += pending[path]
+                if not key:
+                    break
+                key = _parent_key(key)
+        tree["key"] = new_key
 
+def _folder_tree_snapshot():
+    """Joriy daraxt (versiya mos kelmasa katalogdan qayta quriladi)"""
+    _ensure_catalog()
+    conn = _db()
+    tree = _folder_tree()
+    key = _catalog_stats_versions(conn)
+    with tree["lock"]:
+        if tree["key"] != key:
+            _tree_rebuild(tree, conn)
+            tree["key"] = key
+        return tree
+
+@timed
+def get_folder_stats(folder_path):
+    """Papka bo'yicha: fayllar soni, ichki papkalar bilan jami fayllar, hajm, yuklashlar, mtime"""
+    tree = _folder_tree_snapshot()
+    with tree["lock"]:
+        return dict(tree["totals"].get(_path_key(folder_path), _EMPTY_FOLDER_STATS))
+
+@timed
 def get_all_folders(base_path):
     """Barcha papkalarni olish (rekursiv)"""
-    folders = []
-    for root, dirs, files in os.walk(base_path):
-        folders.append(root)
-    return sorted(folders)
+    tree = _folder_tree_snapshot()
+    base_key = _path_key(base_path)
+    with tree["lock"]:
+        keys = [k for k in tree["direct"] if not base_key or k == base_key or k.startswith(base_key + '/')]
+    return sorted(os.path.join(UPLOAD_FOLDER, k) if k else UPLOAD_FOLDER for k in keys)
+
+# --- Sozlamalar keshi va reklama muddati rejalashtiruvchisi ---
+_DEFAULT_AD = {"text": "", "active": False}
+
+@st.cache_resource
+def _settings_cache():
+    """Sozlamalar keshi (barcha sessiyalar uchun umumiy)"""
+    return {
+        "lock": threading.Lock(), "version": None, "checked": 0.0,
+        "ad": _DEFAULT_AD, "credentials": None, "secrets_mtime": None
+    }
+
+def _settings_snapshot(force=False):
+    """Sozlamalarni keshdan olish: (reklama, (login, parol)).
+    Baza versiyasi va maxfiy fayl mtime i ko'pi bilan
+    SETTINGS_REFRESH_INTERVAL da bir marta tekshiriladi."""
+    cache = _settings_cache()
+    with cache["lock"]:
+        now = time.monotonic()
+        if force or cache["version"] is None or now - cache["checked"] >= SETTINGS_REFRESH_INTERVAL:
+            cache["checked"] = now
+            version = get_version('settings')
+            if version != cache["version"]:
+                row = _db().execute("SELECT value FROM settings WHERE name = 'ad'").fetchone()
+                try:
+                    cache["ad"] = json.loads(row[0]) if row else _DEFAULT_AD
+                except ValueError:
+                    cache["ad"] = _DEFAULT_AD
+                cache["version"] = version
+            try:
+                secrets_mtime = os.stat(SECRETS_FILE).st_mtime_ns
+            except OSError:
+                secrets_mtime = None
+            if cache["credentials"] is None or secrets_mtime != cache["secrets_mtime"]:
+                data = _read_json(SECRETS_FILE, {})
+                cache["credentials"] = (data.get('username', 'admin'), data.get('password', 'admin123'))
+                cache["secrets_mtime"] = secrets_mtime
+        return cache["ad"], cache["credentials"]
 
+@timed
 def load_ad():
     """Reklamani o'qish"""
-    if os.path.exists(AD_FILE):
-        try:
-            with open(AD_FILE, 'r') as f:
-                data = json.load(f)
-            
-            # Muddatni tekshirish
-            if data.get('active') and data.get('expires_at'):
-                expires_at = datetime.fromisoformat(data['expires_at'])
-                if datetime.now() > expires_at:
-                    data['active'] = False
-                    with open(AD_FILE, 'w') as f:
-                        json.dump(data, f)
-            return data
-        except:
-            pass
-    return {"text": "", "active": False}
+    # Muddat o'tganini rejalashtiruvchi (_ad_scheduler) belgilaydi
+    return dict(_settings_snapshot()[0])
+
+def _save_ad_data(data):
+    """Reklama ma'lumotini bazaga yozish"""
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT INTO settings (name, value) VALUES ('ad', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (json.dumps(data),)
+        )
+        _bump_version(conn, 'settings')
+    _settings_snapshot(force=True)
+    _ad_scheduler()["wake"].set()
 
 def save_ad(text, active, hours=0):
     """Reklamani saqlash"""
     data = {"text": text, "active": active}
     if active and hours > 0:
         data["expires_at"] = (datetime.now() + timedelta(hours=hours)).isoformat()
-    
-    with open(AD_FILE, 'w') as f:
-        json.dump(data, f)
+    _save_ad_data(data)
 
-def load_admin_credentials():
-    """Admin login va parolini o'qish"""
-    if os.path.exists(SECRETS_FILE):
+def _expire_ad(expires_at):
+    """Muddati o'tgan reklamani o'chirish (agar u hali ham shu reklama bo'lsa)"""
+    with _transaction() as conn:
+        row = conn.execute("SELECT value FROM settings WHERE name = 'ad'").fetchone()
+        data = json.loads(row[0]) if row else {}
+        if data.get('active') and data.get('expires_at') == expires_at:
+            data['active'] = False
+            conn.execute("UPDATE settings SET value = ? WHERE name = 'ad'", (json.dumps(data),))
+            _bump_version(conn, 'settings')
+    _settings_snapshot(force=True)
+
+@st.cache_resource
+def _ad_scheduler():
+    """Reklama muddatini kuzatuvchi fon oqimi (jarayon bo'yicha bitta)"""
+    state = {"wake": threading.Event()}
+    threading.Thread(target=_ad_expiry_loop, args=(state,), daemon=True).start()
+    return state
+
+def _ad_expiry_loop(state):
+    """Reklama muddati tugaguncha uxlab, keyin uni o'chirish"""
+    while True:
+        delay = AD_CHECK_INTERVAL
         try:
-            with open(SECRETS_FILE, 'r') as f:
-                data = json.load(f)
-                return data.get('username', 'admin'), data.get('password', 'admin123')
-        except:
+            ad = _settings_snapshot(force=True)[0]
+            if ad.get('active') and ad.get('expires_at'):
+                remaining = (datetime.fromisoformat(ad['expires_at']) - datetime.now()).total_seconds()
+                if remaining <= 0:
+                    _expire_ad(ad['expires_at'])
+                    continue
+                delay = min(delay, remaining)
+        except Exception:
             pass
-    return 'admin', 'admin123'
+        state["wake"].wait(delay)
+        state["wake"].clear()
+
+def load_admin_credentials():
+    """Admin login va parolini o'qish"""
+    return _settings_snapshot()[1]
 
 def save_admin_credentials(username, password):
     """Admin login va parolini saqlash"""
-    with open(SECRETS_FILE, 'w') as f:
-        json.dump({'username': username, 'password': password}, f)
+    _atomic_write_json(SECRETS_FILE, {'username': username, 'password': password})
+    # Boshqa jarayonlar ham keshini yangilashi uchun
+    with _transaction() as conn:
+        _bump_version(conn, 'settings')
+    _settings_snapshot(force=True)
 
 # Tarjimalar lug'ati
 TRANSLATIONS = {
@@ -309,7 +3654,65 @@ TRANSLATIONS = {
         "root_folder": "Asosiy papka (Root)",
         "admin_stats": "📊 Yuklashlar Statistikasi",
         "stat_file": "Fayl nomi",
-        "stat_count": "Yuklashlar soni"
+        "stat_count": "Yuklashlar soni",
+        "search_by_name": "Nomi bo'yicha",
+        "search_by_content": "Fayl ichidan",
+        "sort_by": "Saralash",
+        "sort_name": "Nomi",
+        "sort_size": "Hajmi",
+        "sort_mtime": "Sana",
+        "sort_downloads": "Yuklashlar",
+        "page_size": "Sahifada",
+        "page": "Sahifa",
+        "stat_window": "Davr",
+        "stat_all_time": "Butun davr",
+        "stat_days": "kun",
+        "stat_folder_only": "Faqat joriy papka",
+        "stat_trend": "📈 Yuklashlar va ko'rishlar dinamikasi",
+        "zip_download": "📦 Papkani ZIP qilib yuklab olish",
+        "zip_too_large": "📦 Papka {size} dan katta - ZIP qilib yuklab bo'lmaydi",
+        "preview": "Ko'rib chiqish",
+        "preview_pending": "⏳ Ko'rinish tayyorlanmoqda...",
+        "preview_none": "Bu fayl uchun ko'rinish yo'q.",
+        "diagnostics": "🩺 Diagnostika",
+        "diag_sample_rate": "O'lchanadigan rerunlar ulushi",
+        "diag_span": "Qism",
+        "diag_calls": "Chaqiruvlar",
+        "diag_avg_ms": "O'rtacha, ms",
+        "diag_max_ms": "Eng ko'p, ms",
+        "diag_total_s": "Jami, s",
+        "diag_counter": "Hisoblagich",
+        "diag_value": "Qiymat",
+        "diag_sessions": "Sessiyalar",
+        "diag_busiest": "Eng ko'p rerun",
+        "diag_reset": "O'lchovlarni tozalash",
+        "diag_hot_cache": "Xotiradagi fayllar (soni · hajmi · topilish ulushi)",
+        "bulk_header": "🗂️ Ommaviy amallar",
+        "bulk_select": "Fayl va papkalarni tanlang",
+        "bulk_action": "Amal",
+        "bulk_move": "Ko'chirish",
+        "bulk_rename": "Nomini o'zgartirish",
+        "bulk_target": "Qaysi papkaga?",
+        "bulk_pattern": "Yangi nom andozasi",
+        "bulk_pattern_help": "{name} - to'liq nom, {stem} - kengaytmasiz nom, {ext} - kengaytma, {n} - tartib raqami (masalan: 2024_{n:02d}_{stem}{ext})",
+        "bulk_apply": "Bajarish",
+        "bulk_done": "Bajarildi",
+        "bulk_failed": "Fayllar ko'chirildi, lekin izoh va statistikani yangilab bo'lmadi",
+        "bulk_err_missing": "topilmadi",
+        "bulk_err_folder": "papkaga izoh yozilmaydi",
+        "bulk_err_name": "andoza yaroqsiz nom berdi",
+        "bulk_err_same": "nomi o'zgarmaydi",
+        "bulk_err_target": "papkani o'z ichiga ko'chirib bo'lmaydi",
+        "bulk_err_exists": "shu nomli element allaqachon bor",
+        "compact_btn": "🧹 Eskirgan yozuvlarni tozalash",
+        "compact_done": "Tozalangan yozuvlar",
+        "compact_normalized": "Tuzatilgan yo'llar",
+        "compact_rehomed": "Ko'chirilgan fayllarga bog'langan",
+        "stat_time": "Vaqt",
+        "stat_views": "Ko'rishlar soni",
+        "duplicate_of": "Bu fayl allaqachon mavjud:",
+        "dedup_btn": "♻️ Dublikatlarni birlashtirish",
+        "dedup_done": "Birlashtirilgan fayllar"
     },
     "ru": {
         "title": "🏛️ Веб-сайт базы Тошми",
@@ -367,48 +3770,115 @@ TRANSLATIONS = {
         "root_folder": "Главная папка (Root)",
         "admin_stats": "📊 Статистика скачиваний",
         "stat_file": "Имя файла",
-        "stat_count": "Количество скачиваний"
+        "stat_count": "Количество скачиваний",
+        "search_by_name": "По названию",
+        "search_by_content": "По содержимому",
+        "sort_by": "Сортировка",
+        "sort_name": "Имя",
+        "sort_size": "Размер",
+        "sort_mtime": "Дата",
+        "sort_downloads": "Скачивания",
+        "page_size": "На странице",
+        "page": "Страница",
+        "stat_window": "Период",
+        "stat_all_time": "За всё время",
+        "stat_days": "дн.",
+        "stat_folder_only": "Только текущая папка",
+        "stat_trend": "📈 Динамика скачиваний и просмотров",
+        "zip_download": "📦 Скачать папку в ZIP",
+        "zip_too_large": "📦 Папка больше {size} - скачать в ZIP нельзя",
+        "preview": "Предпросмотр",
+        "preview_pending": "⏳ Предпросмотр готовится...",
+        "preview_none": "Для этого файла нет предпросмотра.",
+        "diagnostics": "🩺 Диагностика",
+        "diag_sample_rate": "Доля измеряемых перезапусков",
+        "diag_span": "Участок",
+        "diag_calls": "Вызовы",
+        "diag_avg_ms": "Среднее, мс",
+        "diag_max_ms": "Максимум, мс",
+        "diag_total_s": "Всего, с",
+        "diag_counter": "Счётчик",
+        "diag_value": "Значение",
+        "diag_sessions": "Сессии",
+        "diag_busiest": "Больше всего перезапусков",
+        "diag_reset": "Сбросить замеры",
+        "diag_hot_cache": "Файлы в памяти (кол-во · объём · доля попаданий)",
+        "bulk_header": "🗂️ Массовые операции",
+        "bulk_select": "Выберите файлы и папки",
+        "bulk_action": "Действие",
+        "bulk_move": "Переместить",
+        "bulk_rename": "Переименовать",
+        "bulk_target": "В какую папку?",
+        "bulk_pattern": "Шаблон нового имени",
+        "bulk_pattern_help": "{name} - полное имя, {stem} - имя без расширения, {ext} - расширение, {n} - порядковый номер (например: 2024_{n:02d}_{stem}{ext})",
+        "bulk_apply": "Выполнить",
+        "bulk_done": "Выполнено",
+        "bulk_failed": "Файлы перемещены, но комментарии и статистику обновить не удалось",
+        "bulk_err_missing": "не найден",
+        "bulk_err_folder": "к папке нельзя добавить комментарий",
+        "bulk_err_name": "шаблон дал недопустимое имя",
+        "bulk_err_same": "имя не меняется",
+        "bulk_err_target": "нельзя переместить папку в саму себя",
+        "bulk_err_exists": "элемент с таким именем уже есть",
+        "compact_btn": "🧹 Очистить устаревшие записи",
+        "compact_done": "Удалено записей",
+        "compact_normalized": "Исправлено путей",
+        "compact_rehomed": "Привязано к перемещённым файлам",
+        "stat_time": "Время",
+        "stat_views": "Количество просмотров",
+        "duplicate_of": "Этот файл уже есть:",
+        "dedup_btn": "♻️ Объединить дубликаты",
+        "dedup_done": "Объединено файлов"
     }
 }
 
 # 3. Asosiy Ilova Logikasi
-def main():
-    # Session State initsializatsiyasi
-    if 'lang' not in st.session_state:
-        st.session_state.lang = 'uz'
-    if 'dark_mode' not in st.session_state:
-        st.session_state.dark_mode = False
-    if 'current_path' not in st.session_state:
-        st.session_state.current_path = UPLOAD_FOLDER
-    if 'current_view' not in st.session_state:
-        st.session_state.current_view = 'user'
+# Sahifa mustaqil qayta ishlanadigan fragmentlarga bo'lingan: fragment ichidagi
+# tugma faqat o'sha fragmentni qayta ishlatadi. Butun sahifa faqat umumiy holat
+# (til, rejim, ko'rinish, admin joriy papkasi, papkalar tuzilmasi) o'zgarganda
+# st.rerun() bilan qayta ishlanadi.
 
-    txt = TRANSLATIONS[st.session_state.lang]
+def _set_state(name, value):
+    """Tugma callback i: session_state qiymatini o'rnatish"""
+    st.session_state[name] = value
+
+def _toggle_dark_mode():
+    """Tungi rejimni almashtirish"""
+    st.session_state.dark_mode = not st.session_state.dark_mode
+
+def _open_view(view):
+    """Foydalanuvchi/Admin ko'rinishiga o'tish"""
+    st.session_state.current_view = view
+    if view == 'user':
+        st.session_state['admin_logged_in'] = False
+
+def _open_folder(path):
+    """Papkaga kirish (faqat shu tugma turgan fragment qayta ishlaydi)"""
+    st.session_state.current_path = path
 
+def _rename_from_input(path, name, input_key):
+    """Tahrirlash popoveridagi yangi nom bilan qayta nomlash"""
+    rename_item(path, name, st.session_state[input_key])
+
+def _save_comment_from_input(file_path, input_key):
+    """Izoh maydonidagi matnni saqlash"""
+    save_comment(file_path, st.session_state[input_key])
+
+def render_header(txt):
+    """Til, rejim va admin tugmalari, mavzu CSS va sarlavha (faqat to'liq rerun da)"""
     # Til va Rejim tugmalari (Asosiy sahifada - Tepada)
     col_l1, col_l2, col_d, col_a, col_sp = st.columns([0.5, 0.5, 0.8, 2, 4])
     with col_l1:
-        if st.button("UZ"):
-            st.session_state.lang = 'uz'
-            st.rerun()
+        st.button("UZ", on_click=_set_state, args=('lang', 'uz'))
     with col_l2:
-        if st.button("RU"):
-            st.session_state.lang = 'ru'
-            st.rerun()
+        st.button("RU", on_click=_set_state, args=('lang', 'ru'))
     with col_d:
-        if st.button("☀️ | 🌙"):
-            st.session_state.dark_mode = not st.session_state.dark_mode
-            st.rerun()
+        st.button("☀️ | 🌙", on_click=_toggle_dark_mode)
     with col_a:
         if st.session_state.current_view == 'user':
-            if st.button(txt['menu_admin']):
-                st.session_state.current_view = 'admin'
-                st.rerun()
+            st.button(txt['menu_admin'], on_click=_open_view, args=('admin',))
         else:
-            if st.button(txt['menu_user']):
-                st.session_state.current_view = 'user'
-                st.session_state['admin_logged_in'] = False
-                st.rerun()
+            st.button(txt['menu_user'], on_click=_open_view, args=('user',))
 
     # Tungi rejim (Dark Mode)
     if st.session_state.dark_mode:
@@ -463,6 +3933,9 @@ def main():
 
     st.title(txt['title'])
 
+@fragment('clock', run_every=HEADER_REFRESH_INTERVAL)
+def clock_fragment(txt):
+    """Soat va reklama (o'zi vaqti-vaqti bilan yangilanadi)"""
     # Soat (O'zbekiston vaqti)
     uz_time = datetime.now(timezone.utc) + timedelta(hours=5)
     st.markdown(f"##### 🕒 {uz_time.strftime('%H:%M | %d.%m.%Y')}")
@@ -472,114 +3945,432 @@ def main():
     if ad_data.get('active') and ad_data.get('text'):
         st.warning(f"{txt['ad_label']}: {ad_data['text']}")
 
-    # --- FOYDALANUVCHI QISMI ---
-    if st.session_state.current_view == 'user':
-        # Top 5 qismi
-        top_files = get_top_downloads()
-        if top_files:
-            with st.expander(txt['top_5'], expanded=False):
-                for rel_path, count in top_files:
-                    full_path = os.path.join(UPLOAD_FOLDER, rel_path)
-                    if os.path.exists(full_path):
-                        filename = os.path.basename(full_path)
-                        f_size = get_file_size(full_path)
-                        col_t1, col_t2 = st.columns([4, 1])
-                        with col_t1:
-                            st.write(f"🏆 **{filename}** - {count} {txt['downloads']} ({f_size})")
-                        with col_t2:
-                            with open(full_path, "rb") as f:
-                                file_data = f.read()
-                            st.download_button(
-                                label="⬇️",
-                                data=file_data,
-                                file_name=filename,
-                                mime="application/octet-stream",
-                                key=f"dl_top_{rel_path}",
-                                on_click=register_download,
-                                args=(full_path,)
-                            )
-
-        # Qidiruv tizimi
-        search_query = st.text_input("🔍", placeholder=txt['search_ph'], key="search_input")
-        
-        if search_query:
-            st.button(txt['back'], key="back_from_search", on_click=clear_search_state)
+@fragment('top5')
+def top5_fragment(txt):
+    """Top 5 qismi"""
+    top_files = get_top_downloads()
+    if top_files:
+        with st.expander(txt['top_5'], expanded=False):
+            for rel_path, count, size in top_files:
+                full_path = os.path.join(UPLOAD_FOLDER, rel_path)
+                filename = os.path.basename(full_path)
+                col_t1, col_t2 = st.columns([4, 1])
+                with col_t1:
+                    st.write(f"🏆 **{filename}** - {count} {txt['downloads']} ({format_size(size)})")
+                with col_t2:
+                    render_download_button(full_path, key=f"dl_top_{rel_path}")
+
+@fragment('search')
+def search_fragment(txt):
+    """Qidiruv maydoni va natijalari"""
+    search_query = st.text_input("🔍", placeholder=txt['search_ph'], key="search_input")
+    # Qidiruv boshlanganda yoki tozalanganda papkalar ro'yxati ham almashadi
+    if bool(search_query) != st.session_state.search_shown:
+        st.rerun()
+    if not search_query:
+        return
+
+    st.button(txt['back'], key="back_from_search", on_click=clear_search_state)
+
+    st.subheader(f"🔍 {search_query}")
+    search_mode = st.radio(
+        "🔍", [txt['search_by_name'], txt['search_by_content']],
+        horizontal=True, label_visibility="collapsed", key="search_mode"
+    )
+    if search_mode == txt['search_by_content']:
+        results = search_content(search_query)
+    else:
+        results = [(filename, full_path, "") for filename, full_path in search_files(search_query)]
+    if not results:
+        st.info(txt['no_files'])
+        return
+    _, page_size = render_listing_controls("search", txt, sortable=False)
+    results, page, pages = paginate(results, "search", (search_query, search_mode, page_size), page_size)
+    comments = get_comments([full_path for _, full_path, _ in results])
+    for filename, full_path, snippet in results:
+        comment = comments[full_path]
+        file_size = get_file_size(full_path)
+        col_info, col_dl = st.columns([4, 1])
+        with col_info:
+            st.markdown(f"📄 **{filename}** ({file_size})")
+            if comment:
+                st.caption(f"📝 {comment}")
+            if snippet:
+                st.caption(f"🔎 {snippet}")
+            render_preview(full_path, f"search_{os.path.relpath(full_path, UPLOAD_FOLDER)}", txt)
+        with col_dl:
+            render_download_button(full_path, key=f"dl_search_{os.path.relpath(full_path, UPLOAD_FOLDER)}")
+            render_preview_button(full_path, f"search_{os.path.relpath(full_path, UPLOAD_FOLDER)}", txt)
+        st.divider()
+    render_pager("search", page, pages, txt)
+
+@fragment('browse')
+def browser_fragment(txt):
+    """Papkalar bo'ylab navigatsiya (papkaga kirish faqat shu fragmentni yangilaydi)"""
+    current_display_path = st.session_state.current_path
+
+    # Orqaga qaytish tugmasi
+    if current_display_path != UPLOAD_FOLDER:
+        st.button(txt['back'], on_click=_open_folder, args=(os.path.dirname(current_display_path),))
+        st.write(f"📂 {txt['current_path']}: `{os.path.relpath(current_display_path, UPLOAD_FOLDER)}`")
+        if get_folder_stats(current_display_path)["total_files"]:
+            render_folder_zip_button(current_display_path, "zip_user", txt)
+
+    sort_by, page_size = render_listing_controls("user", txt)
+    folders, files = get_sorted_listing(current_display_path, sort_by)
+
+    if not folders and not files:
+        st.info(txt['no_files'])
 
-            st.subheader(f"🔍 {search_query}")
-            results = search_files(search_query)
-            if not results:
-                st.info(txt['no_files'])
+    folders, files, page, pages = page_listing(
+        folders, files, "user", (current_display_path, sort_by, page_size), page_size
+    )
+
+    # Papkalarni ko'rsatish
+    for folder in folders:
+        st.button(
+            f"📁 {folder}", key=f"dir_{folder}",
+            on_click=_open_folder, args=(os.path.join(current_display_path, folder),)
+        )
+
+    # Fayllarni ko'rsatish
+    page_paths = [os.path.join(current_display_path, f[0]) for f in files]
+    comments = get_comments(page_paths)
+    # Sahifadagi fayllar ko'rinishi oldindan (fonda) tayyorlanadi
+    schedule_previews(page_paths)
+    for filename, size, _, _ in files:
+        file_path = os.path.join(current_display_path, filename)
+        comment = comments[file_path]
+        file_size = format_size(size)
+
+        col_info, col_dl = st.columns([4, 1])
+        with col_info:
+            st.markdown(f"📄 **{filename}** ({file_size})")
+            if comment:
+                st.info(f"📝 {comment}")
+            render_preview(file_path, f"user_{filename}", txt)
+        with col_dl:
+            render_download_button(file_path, key=f"dl_user_{filename}")
+            render_preview_button(file_path, f"user_{filename}", txt)
+        st.divider()
+    render_pager("user", page, pages, txt)
+
+@fragment('admin.stats')
+def admin_stats_fragment(txt):
+    """Admin: yuklashlar statistikasi va dinamika"""
+    current_admin_path = st.session_state.current_path
+    st.subheader(txt['admin_stats'])
+
+    col_window, col_scope = st.columns(2)
+    with col_window:
+        stat_days = st.selectbox(
+            txt['stat_window'], [None, 1, 7, 30],
+            format_func=lambda d: txt['stat_all_time'] if d is None else f"{d} {txt['stat_days']}",
+            key="stat_window"
+        )
+    with col_scope:
+        stat_folder_only = st.checkbox(txt['stat_folder_only'], key="stat_folder_only")
+    stat_folder = _path_key(current_admin_path) if stat_folder_only else None
+    admin_top_files = get_top_downloads(10, folder=stat_folder or None, days=stat_days)
+    if admin_top_files:
+        stats_data = [
+            {txt['stat_file']: f_name, txt['stat_count']: f_count}
+            for f_name, f_count, _ in admin_top_files
+        ]
+        st.dataframe(stats_data, use_container_width=True, hide_index=True)
+    else:
+        st.info(txt['no_files'])
+
+    trend_labels, trend = get_trends(stat_folder or '', stat_days or 90)
+    st.caption(txt['stat_trend'])
+    st.line_chart(
+        {txt['stat_time']: trend_labels, txt['stat_count']: trend['d'], txt['stat_views']: trend['v']},
+        x=txt['stat_time']
+    )
+
+@fragment('admin.ad')
+def admin_ad_fragment(txt):
+    """Admin: reklama sozlamalari"""
+    ad_data = load_ad()
+    st.subheader(txt['ad_settings'])
+
+    new_ad_text = st.text_area(txt['ad_text'], value=ad_data.get('text', ''))
+    new_ad_active = st.checkbox(txt['ad_active'], value=ad_data.get('active', False))
+    new_ad_hours = st.number_input(txt['ad_hours'], min_value=0, value=0, help=txt['ad_hours_help'])
+
+    if st.button(txt['ad_save']):
+        save_ad(new_ad_text, new_ad_active, new_ad_hours)
+        st.success(txt['success_ad'])
+        # Reklama sahifa tepasida (boshqa fragmentda) ko'rinadi
+        st.rerun()
+
+@fragment('admin.settings')
+def admin_settings_fragment(txt):
+    """Admin: parol, dublikatlar va diagnostika"""
+    st.subheader(txt['settings'])
+    with st.expander(txt['change_pass']):
+        current_user, _ = load_admin_credentials()
+        new_username = st.text_input(txt['login_user'], value=current_user)
+        new_password = st.text_input(txt['new_pass'], type='password')
+        if st.button(txt['save_pass']):
+            if new_username and new_password:
+                save_admin_credentials(new_username, new_password)
+                st.success(txt['success_pass'])
             else:
-                for filename, full_path in results:
-                    comment = get_comment(full_path)
-                    file_size = get_file_size(full_path)
-                    col_info, col_dl = st.columns([4, 1])
-                    with col_info:
-                        st.markdown(f"📄 **{filename}** ({file_size})")
-                        if comment:
-                            st.caption(f"📝 {comment}")
-                    with col_dl:
-                        with open(full_path, "rb") as f:
-                            file_data = f.read()
-                        st.download_button(
-                            label="⬇️",
-                            data=file_data,
-                            file_name=filename,
-                            mime="application/octet-stream",
-                            key=f"dl_search_{filename}",
-                            on_click=register_download,
-                            args=(full_path,)
-                        )
-                    st.divider()
+                st.warning(txt['pass_empty_warning'])
+
+    if st.button(txt['dedup_btn']):
+        merged, saved = deduplicate_library()
+        st.success(f"{txt['dedup_done']}: {merged} ({format_size(saved)})")
+
+    if st.button(txt['compact_btn']):
+        report = compact_stores()
+        st.success(f"{txt['compact_done']}: {report['entries']} ({format_size(report['bytes'])})")
+        details = [f"{txt['compact_normalized']}: {report['normalized']}", f"{txt['compact_rehomed']}: {report['rehomed']}"]
+        details += [f"{table}: {n}" for table, n in sorted(report['pruned'].items())]
+        st.caption(" · ".join(details))
+
+    with st.expander(txt['diagnostics']):
+        render_diagnostics(txt)
+
+@fragment('admin.upload')
+def admin_upload_fragment(txt):
+    """Admin: fayl yuklash"""
+    current_admin_path = st.session_state.current_path
+    st.subheader(txt['upload_header'])
+
+    # Papka tanlash
+    all_folders = get_all_folders(UPLOAD_FOLDER)
+    folder_map = {}
+    for f in all_folders:
+        rel = os.path.relpath(f, UPLOAD_FOLDER)
+        display = txt['root_folder'] if rel == "." else rel
+        folder_map[display] = f
+
+    current_rel = os.path.relpath(current_admin_path, UPLOAD_FOLDER)
+    default_val = txt['root_folder'] if current_rel == "." else current_rel
+
+    if default_val not in folder_map:
+        default_val = list(folder_map.keys())[0]
+
+    selected_folder = st.selectbox(txt['select_folder'], list(folder_map.keys()), index=list(folder_map.keys()).index(default_val))
+    target_path = folder_map[selected_folder]
+
+    for message in st.session_state.pop('upload_report', []):
+        st.info(message)
+
+    admin_upload = st.file_uploader(txt['upload_label'], key="admin_uploader", accept_multiple_files=True)
+    if admin_upload:
+        if st.button(txt['upload_btn']):
+            bars = {f.name: st.progress(0.0, text=f.name) for f in admin_upload}
+
+            def show_progress(progress):
+                for name, fraction in progress.items():
+                    bars[name].progress(min(fraction, 1.0), text=f"{name} ({fraction:.0%})")
+
+            results = save_uploaded_files(admin_upload, target_path, on_progress=show_progress)
+            saved_count = 0
+            report = []
+            for file, result in zip(admin_upload, results):
+                if result:
+                    saved_count += 1
+                    if result['duplicates']:
+                        report.append(f"♻️ {file.name}: {txt['duplicate_of']} {', '.join(result['duplicates'])}")
+                    bars[file.name].progress(1.0, text=f"{file.name} ✅ sha256: {result['sha256'][:12]}")
+                else:
+                    bars[file.name].progress(0.0, text=f"{file.name} ❌ {txt['error_upload']}")
+            if saved_count > 0:
+                st.success(f"{saved_count} {txt['success_upload']}")
+                # Dublikatlar haqidagi xabar rerun dan keyin ko'rsatiladi
+                st.session_state.upload_report = report
+                # Yangi fayllar fayllar ro'yxati fragmentida ham ko'rinishi kerak
+                st.rerun()
+
+def render_bulk_panel(current_admin_path, txt):
+    """Admin: tanlangan fayl/papkalar ustida bitta amal (ko'chirish, nomlash, o'chirish, izoh)"""
+    for message in st.session_state.pop('bulk_report', []):
+        st.info(message)
+    for message in st.session_state.pop('bulk_errors', []):
+        st.warning(message)
+    # Bajarilgandan keyin tanlov tozalanadi (vidjet yaratilishidan oldin)
+    if st.session_state.pop('bulk_clear', False):
+        st.session_state.bulk_items = []
+
+    folders, files = get_sorted_listing(current_admin_path)
+    folder_names = set(folders)
+    selected = st.multiselect(
+        txt['bulk_select'], list(folders) + [name for name, *_ in files],
+        format_func=lambda name: f"📁 {name}" if name in folder_names else f"📄 {name}",
+        key="bulk_items"
+    )
+    actions = {
+        'move': txt['bulk_move'], 'rename': txt['bulk_rename'],
+        'delete': txt['delete_btn'], 'comment': txt['comment']
+    }
+    action = st.radio(txt['bulk_action'], list(actions), format_func=actions.get, horizontal=True, key="bulk_action")
+    value = target = None
+    if action == 'move':
+        targets = [f for f in get_all_folders(UPLOAD_FOLDER) if f != current_admin_path]
+        target = st.selectbox(
+            txt['bulk_target'], targets, key="bulk_target",
+            format_func=lambda f: txt['root_folder'] if f == UPLOAD_FOLDER else os.path.relpath(f, UPLOAD_FOLDER)
+        )
+    elif action == 'rename':
+        value = st.text_input(txt['bulk_pattern'], value="{stem}{ext}", help=txt['bulk_pattern_help'], key="bulk_pattern")
+    elif action == 'comment':
+        value = st.text_input(txt['write_comment'], key="bulk_comment")
+
+    if st.button(txt['bulk_apply'], disabled=not selected or (action == 'move' and target is None), key="bulk_apply"):
+        bar = st.progress(0.0)
+
+        def show_progress(done, total):
+            bar.progress(done / total, text=f"{done}/{total}")
+
+        try:
+            done, skipped = bulk_apply(current_admin_path, selected, action, value=value, target=target, progress=show_progress)
+        except RuntimeError as error:
+            st.session_state.bulk_errors = [f"{txt['bulk_failed']}: {error}"]
         else:
-            # Papkalar bo'ylab navigatsiya
-            current_display_path = st.session_state.current_path
-            
-            # Orqaga qaytish tugmasi
-            if current_display_path != UPLOAD_FOLDER:
-                if st.button(txt['back']):
-                    st.session_state.current_path = os.path.dirname(current_display_path)
+            st.session_state.bulk_report = [f"{txt['bulk_done']}: {done}/{len(selected)}"]
+            st.session_state.bulk_errors = [f"{name}: {txt.get(reason, reason)}" for name, reason in skipped]
+        st.session_state.bulk_clear = True
+        # Papkalar tuzilmasi boshqa kartalarda ham ishlatiladi
+        st.rerun()
+
+@fragment('admin.files')
+def admin_files_fragment(txt):
+    """Admin: fayllar va papkalarni boshqarish"""
+    current_admin_path = st.session_state.current_path
+    st.write(txt['files_list'])
+
+    # Papka yaratish (papkalar tuzilmasi boshqa kartalarda ham ishlatiladi)
+    with st.expander(txt['create_folder']):
+        new_folder_name = st.text_input(txt['folder_name'])
+        if st.button(txt['create']):
+            if new_folder_name:
+                if create_folder(current_admin_path, new_folder_name):
+                    st.success(txt['success_upload'])
                     st.rerun()
-                st.write(f"📂 {txt['current_path']}: `{os.path.relpath(current_display_path, UPLOAD_FOLDER)}`")
+                else:
+                    st.error(txt['error_upload'])
+
+    with st.expander(txt['bulk_header']):
+        render_bulk_panel(current_admin_path, txt)
 
-            folders, files = get_content(current_display_path)
+    sort_by, page_size = render_listing_controls("admin", txt)
+    folders, files = get_sorted_listing(current_admin_path, sort_by)
 
-            if not folders and not files:
-                st.info(txt['no_files'])
+    if not folders and not files:
+        st.warning(txt['no_files'])
 
-            # Papkalarni ko'rsatish
-            for folder in folders:
-                if st.button(f"📁 {folder}", key=f"dir_{folder}"):
-                    st.session_state.current_path = os.path.join(current_display_path, folder)
+    folders, files, page, pages = page_listing(
+        folders, files, "admin", (current_admin_path, sort_by, page_size), page_size
+    )
+
+    # Papkalarni boshqarish: joriy papka va papkalar tuzilmasi butun admin
+    # panelida umumiy, shuning uchun bu amallardan keyin butun sahifa yangilanadi
+    for folder in folders:
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            f_stats = get_folder_stats(os.path.join(current_admin_path, folder))
+            f_label = f"📁 {folder} ({f_stats['files']} · {format_size(f_stats['bytes'])} · ⬇️ {f_stats['downloads']})"
+            if st.button(f_label, key=f"adm_dir_{folder}"):
+                st.session_state.current_path = os.path.join(current_admin_path, folder)
+                st.rerun()
+        with col2:
+            with st.popover(txt['rename']):
+                new_name = st.text_input(txt['new_name'], value=folder, key=f"ren_d_{folder}")
+                if st.button(txt['save'], key=f"save_d_{folder}"):
+                    rename_item(current_admin_path, folder, new_name)
                     st.rerun()
+        with col3:
+            if st.button(txt['delete_btn'], key=f"del_dir_{folder}"):
+                delete_item(current_admin_path, folder)
+                st.rerun()
+
+    # Fayllarni boshqarish (faqat shu fragment qayta ishlaydi)
+    comments = get_comments([os.path.join(current_admin_path, f[0]) for f in files])
+    for filename, size, _, _ in files:
+        file_path = os.path.join(current_admin_path, filename)
+        file_size = format_size(size)
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            st.text(f"📄 {filename} ({file_size})")
 
-            # Fayllarni ko'rsatish
-            for filename in files:
-                file_path = os.path.join(current_display_path, filename)
-                comment = get_comment(file_path)
-                file_size = get_file_size(file_path)
-                
-                col_info, col_dl = st.columns([4, 1])
-                with col_info:
-                    st.markdown(f"📄 **{filename}** ({file_size})")
-                    if comment:
-                        st.info(f"📝 {comment}")
-                with col_dl:
-                    with open(file_path, "rb") as f:
-                        file_data = f.read()
-                    st.download_button(
-                        label="⬇️",
-                        data=file_data,
-                        file_name=filename,
-                        mime="application/octet-stream",
-                        key=f"dl_user_{filename}",
-                        on_click=register_download,
-                        args=(file_path,)
+            # Izoh yozish qismi
+            current_comment = comments[file_path]
+            if current_comment:
+                st.caption(f"📝 {current_comment}")
+
+            with st.popover(f"💬 {txt['comment']}"):
+                st.text_input(txt['write_comment'], value=current_comment, key=f"c_in_{filename}")
+                c_col1, c_col2 = st.columns(2)
+                with c_col1:
+                    st.button(
+                        txt['save'], key=f"c_save_{filename}",
+                        on_click=_save_comment_from_input, args=(file_path, f"c_in_{filename}")
+                    )
+                with c_col2:
+                    st.button(
+                        txt['delete_btn'], key=f"c_del_{filename}",
+                        on_click=save_comment, args=(file_path, "")
                     )
-                st.divider()
+
+        with col2:
+            with st.popover(txt['rename']):
+                st.text_input(txt['new_name'], value=filename, key=f"ren_f_{filename}")
+                st.button(
+                    txt['save'], key=f"save_f_{filename}",
+                    on_click=_rename_from_input, args=(current_admin_path, filename, f"ren_f_{filename}")
+                )
+        with col3:
+            st.button(
+                txt['delete_btn'], key=f"del_file_{filename}",
+                on_click=delete_item, args=(current_admin_path, filename)
+            )
+
+    render_pager("admin", page, pages, txt)
+
+def main():
+    # Session State initsializatsiyasi
+    if 'lang' not in st.session_state:
+        st.session_state.lang = 'uz'
+    if 'dark_mode' not in st.session_state:
+        st.session_state.dark_mode = False
+    if 'current_path' not in st.session_state:
+        st.session_state.current_path = UPLOAD_FOLDER
+    if 'current_view' not in st.session_state:
+        st.session_state.current_view = 'user'
+
+    txt = TRANSLATIONS[st.session_state.lang]
+
+    # Fon indeksatorini ishga tushirish (jarayon bo'yicha bir marta)
+    _content_indexer()
+    _fs_watcher()
+    _ad_scheduler()
+    _event_log()
+    _download_server()
+    _hot_cache()
+    _storage()
+    _compactor()
+
+    section('render.header')
+    render_header(txt)
+    clock_fragment(txt)
+
+    # --- FOYDALANUVCHI QISMI ---
+    if st.session_state.current_view == 'user':
+        top5_fragment(txt)
+
+        # Qidiruv bo'lsa papkalar ro'yxati o'rniga natijalar ko'rsatiladi
+        st.session_state.search_shown = bool(st.session_state.get('search_input'))
+        search_fragment(txt)
+        if not st.session_state.search_shown:
+            browser_fragment(txt)
 
     # --- ADMIN PANELI QISMI ---
     elif st.session_state.current_view == 'admin':
+        section('render.admin')
         st.subheader(txt['admin_header'])
 
         # Session State orqali login holatini tekshirish
@@ -602,162 +4393,30 @@ def main():
         else:
             # Admin tizimga kirgandan keyingi ko'rinish
             st.success(txt['welcome'])
-            
-            if st.button(txt['logout_btn']):
-                st.session_state['admin_logged_in'] = False
-                st.rerun()
+
+            st.button(txt['logout_btn'], on_click=_set_state, args=('admin_logged_in', False))
 
             # Admin navigatsiyasi
             current_admin_path = st.session_state.current_path
             if current_admin_path != UPLOAD_FOLDER:
-                if st.button(txt['back'], key='admin_back'):
-                    st.session_state.current_path = os.path.dirname(current_admin_path)
-                    st.rerun()
-            
+                st.button(
+                    txt['back'], key='admin_back',
+                    on_click=_open_folder, args=(os.path.dirname(current_admin_path),)
+                )
+
             st.info(f"📂 {txt['current_path']}: `{os.path.relpath(current_admin_path, UPLOAD_FOLDER)}`")
 
             st.divider()
-            st.subheader(txt['admin_stats'])
-            
-            admin_top_files = get_top_downloads(10)
-            if admin_top_files:
-                stats_data = [
-                    {txt['stat_file']: f_name, txt['stat_count']: f_count}
-                    for f_name, f_count in admin_top_files
-                ]
-                st.dataframe(stats_data, use_container_width=True, hide_index=True)
-            else:
-                st.info(txt['no_files'])
-
+            admin_stats_fragment(txt)
             st.divider()
-            st.subheader(txt['ad_settings'])
-            
-            new_ad_text = st.text_area(txt['ad_text'], value=ad_data.get('text', ''))
-            new_ad_active = st.checkbox(txt['ad_active'], value=ad_data.get('active', False))
-            new_ad_hours = st.number_input(txt['ad_hours'], min_value=0, value=0, help=txt['ad_hours_help'])
-            
-            if st.button(txt['ad_save']):
-                save_ad(new_ad_text, new_ad_active, new_ad_hours)
-                st.success(txt['success_ad'])
-                st.rerun()
-
+            admin_ad_fragment(txt)
             st.divider()
-            st.subheader(txt['settings'])
-            with st.expander(txt['change_pass']):
-                current_user, _ = load_admin_credentials()
-                new_username = st.text_input(txt['login_user'], value=current_user)
-                new_password = st.text_input(txt['new_pass'], type='password')
-                if st.button(txt['save_pass']):
-                    if new_username and new_password:
-                        save_admin_credentials(new_username, new_password)
-                        st.success(txt['success_pass'])
-                    else:
-                        st.warning(txt['pass_empty_warning'])
-
+            admin_settings_fragment(txt)
             st.divider()
-            st.subheader(txt['upload_header'])
-            
-            # Papka tanlash
-            all_folders = get_all_folders(UPLOAD_FOLDER)
-            folder_map = {}
-            for f in all_folders:
-                rel = os.path.relpath(f, UPLOAD_FOLDER)
-                display = txt['root_folder'] if rel == "." else rel
-                folder_map[display] = f
-            
-            current_rel = os.path.relpath(current_admin_path, UPLOAD_FOLDER)
-            default_val = txt['root_folder'] if current_rel == "." else current_rel
-            
-            if default_val not in folder_map:
-                default_val = list(folder_map.keys())[0]
-
-            selected_folder = st.selectbox(txt['select_folder'], list(folder_map.keys()), index=list(folder_map.keys()).index(default_val))
-            target_path = folder_map[selected_folder]
-
-            admin_upload = st.file_uploader(txt['upload_label'], key="admin_uploader", accept_multiple_files=True)
-            if admin_upload:
-                if st.button(txt['upload_btn']):
-                    saved_count = 0
-                    for file in admin_upload:
-                        if save_uploaded_file(file, target_path):
-                            saved_count += 1
-                    if saved_count > 0:
-                        st.success(f"{saved_count} {txt['success_upload']}")
-                        st.rerun()
-
+            admin_upload_fragment(txt)
             st.divider()
-            st.write(txt['files_list'])
-
-            # Papka yaratish
-            with st.expander(txt['create_folder']):
-                new_folder_name = st.text_input(txt['folder_name'])
-                if st.button(txt['create']):
-                    if new_folder_name:
-                        if create_folder(current_admin_path, new_folder_name):
-                            st.success(txt['success_upload'])
-                            st.rerun()
-                        else:
-                            st.error(txt['error_upload'])
-
-            folders, files = get_content(current_admin_path)
-            
-            if not folders and not files:
-                st.warning(txt['no_files'])
-            
-            # Papkalarni boshqarish
-            for folder in folders:
-                col1, col2, col3 = st.columns([3, 1, 1])
-                with col1:
-                    f_count = count_files_in_folder(os.path.join(current_admin_path, folder))
-                    if st.button(f"📁 {folder} ({f_count})", key=f"adm_dir_{folder}"):
-                        st.session_state.current_path = os.path.join(current_admin_path, folder)
-                        st.rerun()
-                with col2:
-                    with st.popover(txt['rename']):
-                        new_name = st.text_input(txt['new_name'], value=folder, key=f"ren_d_{folder}")
-                        if st.button(txt['save'], key=f"save_d_{folder}"):
-                            rename_item(current_admin_path, folder, new_name)
-                            st.rerun()
-                with col3:
-                    if st.button(txt['delete_btn'], key=f"del_dir_{folder}"):
-                        delete_item(current_admin_path, folder)
-                        st.rerun()
-
-            # Fayllarni boshqarish
-            for filename in files:
-                file_path = os.path.join(current_admin_path, filename)
-                file_size = get_file_size(file_path)
-                col1, col2, col3 = st.columns([3, 1, 1])
-                with col1:
-                    st.text(f"📄 {filename} ({file_size})")
-                    
-                    # Izoh yozish qismi
-                    current_comment = get_comment(file_path)
-                    if current_comment:
-                        st.caption(f"📝 {current_comment}")
-                    
-                    with st.popover(f"💬 {txt['comment']}"):
-                        new_comment = st.text_input(txt['write_comment'], value=current_comment, key=f"c_in_{filename}")
-                        c_col1, c_col2 = st.columns(2)
-                        with c_col1:
-                            if st.button(txt['save'], key=f"c_save_{filename}"):
-                                save_comment(file_path, new_comment)
-                                st.rerun()
-                        with c_col2:
-                            if st.button(txt['delete_btn'], key=f"c_del_{filename}"):
-                                save_comment(file_path, "")
-                                st.rerun()
-
-                with col2:
-                    with st.popover(txt['rename']):
-                        new_name = st.text_input(txt['new_name'], value=filename, key=f"ren_f_{filename}")
-                        if st.button(txt['save'], key=f"save_f_{filename}"):
-                            rename_item(current_admin_path, filename, new_name)
-                            st.rerun()
-                with col3:
-                    if st.button(txt['delete_btn'], key=f"del_file_{filename}"):
-                        delete_item(current_admin_path, filename)
-                        st.rerun()
+            admin_files_fragment(txt)
 
 if __name__ == '__main__':
-    main()
+    with profile_rerun():
+        main()
@@ -0,0 +1,312 @@
+# Sahifa chizish yo'llari uchun benchmark.
+# Sintetik yuklangan_fayllar daraxti (va eski JSON statistikasi) yaratiladi,
+# ilova Streamlit AppTest orqali ekransiz ishga tushiriladi va asosiy
+# stsenariylar vaqti o'lchanadi. Har bir hajm alohida jarayonda ishlaydi,
+# shuning uchun eng yuqori RSS va keshlar bir-biriga aralashmaydi.
+#
+#   python benchmark.py                      # 1k, 10k, 100k fayl
+#   python benchmark.py --sizes 1000 --runs 10
+#   python benchmark.py --save-baseline      # natijani asos sifatida saqlash
+import argparse
+import importlib.util
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows: eng yuqori RSS o'lchanmaydi
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_FILES = ('app.py', 'content_extract.py', 'storage.py')
+BASELINE_FILE = os.path.join(HERE, 'benchmark_baseline.json')
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# Fayl nomlari uchun so'zlar (qidiruv so'rovlari ham shulardan olinadi)
+WORDS = [
+    'anatomiya', 'fiziologiya', 'biokimyo', 'gistologiya', 'farmakologiya', 'patologiya',
+    'yelka', 'suyak', 'yurak', 'qon', 'nerv', 'mushak', 'test', 'savollar', 'javoblar',
+    'maruza', 'amaliy', 'nazorat', 'yakuniy', 'oraliq', 'анатомия', 'тест', 'лекция',
+]
+EXTENSIONS = ['.docx', '.docx', '.pdf', '.pdf', '.pptx', '.txt', '.jpg']
+SEARCH_QUERIES = ['anatomiya', 'yurak test', 'biokimyo', 'suyak', 'анат', 'farmakolgiya', 'qon nazorat']
+
+
+def _name(rng):
+    """Tasodifiy fayl yoki papka nomi"""
+    return ' '.join(rng.sample(WORDS, rng.randint(1, 3))) + f' {rng.randint(1, 999)}'
+
+
+def generate_library(root, files, seed=1):
+    """Sintetik kutubxona: papkalar (1-4 chuqurlik), fayllar va eski JSON statistikasi"""
+    rng = random.Random(seed)
+    upload_folder = os.path.join(root, 'yuklangan_fayllar')
+    os.makedirs(upload_folder)
+    folders = ['']
+    for _ in range(max(files // 50, 1)):
+        parent = rng.choice(folders)
+        if parent.count('/') >= 3:
+            parent = ''
+        folder = f"{parent}/{_name(rng)}".lstrip('/')
+        os.makedirs(os.path.join(upload_folder, folder), exist_ok=True)
+        folders.append(folder)
+
+    keys = set()
+    while len(keys) < files:
+        folder = rng.choice(folders)
+        keys.add(f"{folder}/{_name(rng)}{rng.choice(EXTENSIONS)}".lstrip('/'))
+    keys = sorted(keys)
+    for key in keys:
+        path = os.path.join(upload_folder, key)
+        with open(path, 'wb') as f:
+            if key.endswith('.txt'):
+                f.write(' '.join(rng.choices(WORDS, k=rng.randint(20, 400))).encode('utf-8'))
+            else:
+                # Hajmlar log-normal taqsimotda; ichi bo'sh (sparse) fayl
+                f.truncate(min(int(rng.lognormvariate(10, 1.5)), 50 * 1024 * 1024))
+
+    popular = rng.sample(keys, max(len(keys) // 3, 1))
+    with open(os.path.join(root, 'download_stats.json'), 'w', encoding='utf-8') as f:
+        json.dump({key: int(rng.paretovariate(1.2) * 3) for key in popular}, f, ensure_ascii=False)
+    with open(os.path.join(root, 'view_stats.json'), 'w', encoding='utf-8') as f:
+        json.dump({key: int(rng.paretovariate(1.2) * 10) for key in popular}, f, ensure_ascii=False)
+    commented = rng.sample(keys, max(len(keys) // 10, 1))
+    with open(os.path.join(root, 'file_metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump({key: ' '.join(rng.sample(WORDS, 4)) for key in commented}, f, ensure_ascii=False)
+    deepest = max(folders, key=lambda folder: (folder.count('/'), folder))
+    return upload_folder, deepest
+
+
+def _io_counters():
+    """Jarayon o'qigan baytlar: (read_bytes - diskdan, rchar - barcha read() lar)"""
+    try:
+        with open('/proc/self/io') as f:
+            values = dict(line.split(': ') for line in f.read().splitlines())
+        return int(values['read_bytes']), int(values['rchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def _peak_rss_mb():
+    """Jarayonning eng yuqori RSS hajmi (MB)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux da KB, macOS da bayt
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _percentile(values, fraction):
+    """Tartiblangan qiymatlardan eng yaqin darajadagi persentil"""
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def measure(fn, runs):
+    """fn ni runs marta ishga tushirib, kechikish persentillari va o'qilgan baytlar"""
+    timings = []
+    disk_before, chars_before = _io_counters()
+    for i in range(runs):
+        started = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - started) * 1000)
+    disk_after, chars_after = _io_counters()
+    return {
+        "runs": runs,
+        "p50_ms": round(_percentile(timings, 0.5), 2),
+        "p90_ms": round(_percentile(timings, 0.9), 2),
+        "p99_ms": round(_percentile(timings, 0.99), 2),
+        "max_ms": round(max(timings), 2),
+        "disk_read_per_run": (disk_after - disk_before) // runs,
+        "bytes_read_per_run": (chars_after - chars_before) // runs,
+    }
+
+
+def _wait_for_background(timeout):
+    """Fon indeksatori katalogga yetib olguncha kutish (o'lchovlarga aralashmasligi uchun)"""
+    conn = sqlite3.connect('baza.sqlite3')
+    deadline = time.monotonic() + timeout
+    previous = None
+    while time.monotonic() < deadline:
+        time.sleep(1)
+        try:
+            current = conn.execute("SELECT COUNT(*) FROM content_docs").fetchone()[0]
+        except sqlite3.Error:
+            continue
+        if current == previous:
+            break
+        previous = current
+    conn.close()
+
+
+def _import_app():
+    """Ilovani modul sifatida yuklash (funksiyalarni to'g'ridan-to'g'ri o'lchash uchun)"""
+    spec = importlib.util.spec_from_file_location('siteuz_app', os.path.abspath('app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _Upload(io.BytesIO):
+    """Streamlit UploadedFile o'rnini bosuvchi obyekt"""
+
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+
+def run_worker(files, runs, keep, background_timeout):
+    """Bitta hajm uchun barcha stsenariylarni o'lchash (alohida jarayonda)"""
+    from streamlit.testing.v1 import AppTest
+
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    workdir = tempfile.mkdtemp(prefix='siteuz_bench_')
+    try:
+        upload_folder, deep_folder = generate_library(workdir, files)
+        for name in APP_FILES:
+            shutil.copy(os.path.join(HERE, name), workdir)
+        os.chdir(workdir)
+        sys.path.insert(0, workdir)
+        # Benchmark port band qilmasligi uchun
+        os.environ['SITEUZ_DOWNLOAD_SERVER'] = '0'
+
+        result = {"files": files, "scenarios": {}}
+        started = time.perf_counter()
+        at = AppTest.from_file(os.path.abspath('app.py'), default_timeout=600)
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception)
+        result["cold_start_s"] = round(time.perf_counter() - started, 2)
+        _wait_for_background(background_timeout)
+        app = _import_app()
+        scenarios = result["scenarios"]
+
+        def user_root(_):
+            at.session_state.current_path = app.UPLOAD_FOLDER
+            at.run()
+
+        def user_folder(_):
+            at.session_state.current_path = os.path.join(app.UPLOAD_FOLDER, *deep_folder.split('/'))
+            at.run()
+
+        def search(i):
+            at.text_input(key="search_input").set_value(SEARCH_QUERIES[i % len(SEARCH_QUERIES)]).run()
+
+        scenarios["user_listing"] = measure(user_root, runs)
+        scenarios["user_folder"] = measure(user_folder, runs)
+        scenarios["search"] = measure(search, runs)
+        at.text_input(key="search_input").set_value("").run()
+        scenarios["top5"] = measure(lambda _: app.get_top_downloads(), runs)
+
+        at.session_state.current_view = 'admin'
+        at.session_state.admin_logged_in = True
+        at.session_state.current_path = app.UPLOAD_FOLDER
+        scenarios["admin_render"] = measure(lambda _: at.run(), runs)
+        if at.exception:
+            raise RuntimeError(at.exception)
+
+        target = os.path.join(app.UPLOAD_FOLDER, *deep_folder.split('/'))
+        payload = os.urandom(1024 * 1024)
+        scenarios["upload_1mb"] = measure(
+            lambda i: app.save_uploaded_file(_Upload(f"bench upload {i}.pdf", payload), target), runs
+        )
+        names = ["bench upload 0.pdf", "bench renamed.pdf"]
+        scenarios["rename"] = measure(
+            lambda i: app.rename_item(target, names[i % 2], names[(i + 1) % 2]), runs
+        )
+        result["peak_rss_mb"] = _peak_rss_mb()
+        return result
+    finally:
+        os.chdir(HERE)
+        if keep:
+            print(f"# {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, threshold):
+    """Asos bilan solishtirish: p50 threshold martadan sekinlashgan stsenariylar"""
+    regressions = []
+    for size, result in results.items():
+        base = baseline.get(size)
+        if not base:
+            continue
+        for name, current in result["scenarios"].items():
+            previous = base["scenarios"].get(name)
+            # 1 ms dan kichik farqlar shovqin hisoblanadi
+            if previous and current["p50_ms"] > previous["p50_ms"] * threshold and \
+                    current["p50_ms"] - previous["p50_ms"] > 1:
+                regressions.append((size, name, previous["p50_ms"], current["p50_ms"]))
+    return regressions
+
+
+def print_report(results):
+    """Natijalar jadvali"""
+    for size, result in results.items():
+        print(f"\n== {size} fayl: sovuq start {result['cold_start_s']} s, eng yuqori RSS {result['peak_rss_mb']} MB")
+        print(f"{'stsenariy':<14}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'o`qildi/run':>14}{'diskdan/run':>14}")
+        for name, stats in result["scenarios"].items():
+            print(
+                f"{name:<14}{stats['p50_ms']:>10}{stats['p90_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}"
+                f"{stats['bytes_read_per_run']:>14}{stats['disk_read_per_run']:>14}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SITEUZ sahifa chizish benchmarki")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="fayllar soni")
+    parser.add_argument('--runs', type=int, default=20, help="har bir stsenariy necha marta o'lchanadi")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="asos natijalar fayli")
+    parser.add_argument('--save-baseline', action='store_true', help="natijani asos sifatida saqlash")
+    parser.add_argument('--threshold', type=float, default=1.25, help="regressiya chegarasi (p50 nisbati)")
+    parser.add_argument('--background-timeout', type=int, default=300, help="fon indeksatorini kutish (s)")
+    parser.add_argument('--keep', action='store_true', help="vaqtinchalik papkani o'chirmaslik")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.worker, args.runs, args.keep, args.background_timeout)
+        print(json.dumps(result))
+        return
+
+    results = {}
+    for size in args.sizes:
+        command = [
+            sys.executable, os.path.abspath(__file__), '--worker', str(size), '--runs', str(args.runs),
+            '--background-timeout', str(args.background_timeout)
+        ] + (['--keep'] if args.keep else [])
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            sys.stderr.write(completed.stderr)
+            sys.exit(completed.returncode)
+        results[str(size)] = json.loads(completed.stdout.strip().splitlines()[-1])
+    print_report(results)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for size, name, previous, current in regressions:
+        print(f"REGRESSIYA: {size} fayl, {name}: p50 {previous} ms -> {current} ms")
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
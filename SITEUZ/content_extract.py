@@ -0,0 +1,192 @@
+# Hujjatlardan matn ajratib olish.
+# Bu funksiyalar app.py dan alohida modulda turadi, chunki ular fon
+# jarayonlarida (ProcessPoolExecutor) ishlaydi va pickle qilinishi kerak.
+import io
+import os
+import re
+import hashlib
+import zipfile
+import xml.etree.ElementTree as ET
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # PDF matni faqat pypdf o'rnatilgan bo'lsa olinadi
+    PdfReader = None
+
+try:
+    import fitz  # PyMuPDF: PDF ning birinchi sahifasini rasmga aylantirish
+except ImportError:
+    fitz = None
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow bo'lmasa rasmlar o'lchami o'zgartirilmaydi
+    Image = None
+
+# Bitta hujjatdan olinadigan matnning eng ko'p uzunligi (indeks ixcham bo'lishi uchun)
+MAX_CHARS = 1_000_000
+
+_W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_A_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_SLIDE_RE = re.compile(r'ppt/slides/slide(\d+)\.xml$')
+_SPACE_RE = re.compile(r'\s+')
+
+# Ko'rinish rasmi sifatida to'g'ridan-to'g'ri olinadigan fayl turlari
+_IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+# Pillow bo'lmaganda shundan katta rasmlar ko'rinishga qo'yilmaydi
+_MAX_RAW_IMAGE = 2 * 1024 * 1024
+
+
+def supported_extensions():
+    """Matni ajratib olinadigan fayl turlari"""
+    extensions = ['.docx', '.pptx', '.txt']
+    if PdfReader is not None:
+        extensions.append('.pdf')
+    return extensions
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Fayl tarkibining SHA-256 xeshi (bo'laklab o'qiladi)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _xml_text(data, text_tag, paragraph_tag):
+    """Office XML dan matn tugunlarini paragraflar bo'yicha yig'ish"""
+    parts = []
+    for _, elem in ET.iterparse(data, events=('end',)):
+        if elem.tag == text_tag and elem.text:
+            parts.append(elem.text)
+        elif elem.tag == paragraph_tag:
+            parts.append('\n')
+            elem.clear()
+    return ''.join(parts)
+
+
+def _docx_text(path):
+    """.docx hujjat matni"""
+    with zipfile.ZipFile(path) as archive:
+        with archive.open('word/document.xml') as data:
+            return _xml_text(data, _W_NS + 't', _W_NS + 'p')
+
+
+def _pptx_text(path):
+    """.pptx taqdimot slaydlari matni (tartib bo'yicha)"""
+    with zipfile.ZipFile(path) as archive:
+        slides = []
+        for name in archive.namelist():
+            match = _SLIDE_RE.match(name)
+            if match:
+                slides.append((int(match.group(1)), name))
+        texts = []
+        for _, name in sorted(slides):
+            with archive.open(name) as data:
+                texts.append(_xml_text(data, _A_NS + 't', _A_NS + 'p'))
+        return '\n'.join(texts)
+
+
+def _pdf_text(path):
+    """.pdf sahifalari matni (pypdf orqali)"""
+    reader = PdfReader(path)
+    texts = []
+    length = 0
+    for page in reader.pages:
+        text = page.extract_text() or ''
+        texts.append(text)
+        length += len(text)
+        if length >= MAX_CHARS:
+            break
+    return '\n'.join(texts)
+
+
+def _txt_text(path):
+    """Oddiy matn fayli"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read(MAX_CHARS)
+
+
+_EXTRACTORS = {
+    '.docx': _docx_text,
+    '.pptx': _pptx_text,
+    '.pdf': _pdf_text,
+    '.txt': _txt_text,
+}
+
+
+def extract_text(path):
+    """Fayl turiga qarab matnni ajratib olish (bo'lmasa bo'sh satr)"""
+    extractor = _EXTRACTORS.get(os.path.splitext(path)[1].lower())
+    if extractor is None or (extractor is _pdf_text and PdfReader is None):
+        return ''
+    try:
+        return extractor(path)[:MAX_CHARS]
+    except Exception:
+        # Buzilgan yoki shifrlangan fayl indeksni to'xtatmasligi kerak
+        return ''
+
+
+def extract_file(key, path, known_hash=None):
+    """Fon jarayonidagi vazifa: (kalit, mtime, hajm, xesh, matn) qaytaradi"""
+    stat_result = os.stat(path)
+    sha256 = file_hash(path)
+    # Tarkib o'zgarmagan bo'lsa (faqat mtime yangilangan) matn qayta olinmaydi
+    text = None if sha256 == known_hash else extract_text(path)
+    return key, stat_result.st_mtime, stat_result.st_size, sha256, text
+
+
+def _office_thumbnail(path):
+    """.docx/.pptx ichidagi docProps/thumbnail (faqat JPEG/PNG)"""
+    with zipfile.ZipFile(path) as archive:
+        for name in ('docProps/thumbnail.jpeg', 'docProps/thumbnail.jpg', 'docProps/thumbnail.png'):
+            try:
+                return archive.read(name)
+            except KeyError:
+                continue
+    return None
+
+
+def _pdf_thumbnail(path):
+    """PDF ning birinchi sahifasi PNG ko'rinishida (PyMuPDF orqali)"""
+    with fitz.open(path) as document:
+        if document.page_count == 0:
+            return None
+        return document[0].get_pixmap(matrix=fitz.Matrix(0.5, 0.5)).tobytes('png')
+
+
+def _shrink_image(data, max_width):
+    """Rasmni max_width gacha kichraytirib PNG qilish"""
+    if Image is None:
+        return data if len(data) <= _MAX_RAW_IMAGE else None
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((max_width, max_width * 2))
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+        output = io.BytesIO()
+        image.save(output, format='PNG', optimize=True)
+        return output.getvalue()
+
+
+def make_preview(key, path, max_width, excerpt_chars):
+    """Fon jarayonidagi vazifa: (kalit, mtime, hajm, xesh, rasm yoki None, parcha)"""
+    stat_result = os.stat(path)
+    sha256 = file_hash(path)
+    ext = os.path.splitext(path)[1].lower()
+    image = None
+    try:
+        if ext in ('.docx', '.pptx'):
+            image = _office_thumbnail(path)
+        elif ext == '.pdf' and fitz is not None:
+            image = _pdf_thumbnail(path)
+        elif ext in _IMAGE_EXTENSIONS:
+            with open(path, 'rb') as f:
+                image = f.read()
+        if image is not None:
+            image = _shrink_image(image, max_width)
+    except Exception:
+        # Ko'rinish bo'lmasa ham parcha ko'rsatiladi
+        image = None
+    excerpt = _SPACE_RE.sub(' ', extract_text(path)[:excerpt_chars * 2]).strip()[:excerpt_chars]
+    return key, stat_result.st_mtime, stat_result.st_size, sha256, image, excerpt
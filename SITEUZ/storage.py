@@ -0,0 +1,249 @@
+# Kutubxona fayllari saqlanadigan joy (backend).
+# LocalStorage - faqat shu serverning diski. S3Storage - S3 ga mos ombor
+# (AWS S3, MinIO): mahalliy papka ombordan o'qish keshi bo'lib qoladi,
+# shuning uchun bir nechta server bitta kutubxonani bo'lishishi mumkin.
+# Kalitlar UPLOAD_FOLDER ga nisbatan, ajratgich doim '/'.
+import os
+import shutil
+import tempfile
+import itertools
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # S3 ombori faqat boto3 o'rnatilgan bo'lsa ishlaydi
+    boto3 = None
+
+# Multipart yuklash bo'lagi (S3 da oxirgisidan boshqa bo'laklar kamida 5 MiB)
+MULTIPART_CHUNK = 8 * 1024 * 1024
+# Ombordan o'qish bo'lagi
+READ_CHUNK = 1024 * 1024
+# Bitta so'rovda o'chiriladigan obyektlar soni (S3 chegarasi)
+DELETE_BATCH = 1000
+
+
+class LocalStorage:
+    """Kutubxona faqat mahalliy diskda (standart rejim)"""
+    shared = False
+
+    def __init__(self, root, partial_suffix='.part'):
+        self.root = root
+        self.partial_suffix = partial_suffix
+
+    def path(self, key):
+        """Kalitdan diskdagi yo'l"""
+        return os.path.join(self.root, *key.split('/')) if key else self.root
+
+    def make_folder(self, key):
+        """Papka yaratish"""
+        os.makedirs(self.path(key))
+        return self.mark_folder(key)
+
+    def mark_folder(self, key):
+        """Papkani omborda belgilash (diskda papkaning o'zi yetarli)"""
+        return None
+
+    def delete(self, key):
+        """Fayl yoki papkani (ichidagilari bilan) o'chirish"""
+        path = self.path(key)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    def rename(self, old_key, new_key):
+        """Fayl yoki papka nomini o'zgartirish"""
+        os.rename(self.path(old_key), self.path(new_key))
+
+    def put(self, key, progress=None):
+        """Diskdagi faylni omborga chiqarish (bu yerda fayl allaqachon joyida)"""
+        return None
+
+    def fetch(self, key):
+        """O'qish uchun diskdagi yo'l (kerak bo'lsa ombordan olinadi)"""
+        return self.path(key)
+
+    def list(self, prefix='', token=None, page_size=1000):
+        """prefix ostidagi obyektlarning bitta sahifasi (kalit bo'yicha tartibda):
+        ([(kalit, hajm, teg)], keyingi sahifa tokeni yoki None).
+        Papkalar 'kalit/' ko'rinishida, hajmi 0 bilan qaytadi."""
+        page = list(itertools.islice(self._scan(self.root, '', prefix, token), page_size + 1))
+        if len(page) > page_size:
+            return page[:page_size], page[page_size - 1][0]
+        return page, None
+
+    def _scan(self, directory, base, prefix, token):
+        """Papkani kalit tartibida aylanib chiqish (scandir). prefix ga to'g'ri
+        kelmaydigan va token dan oldingi papkalarga kirilmaydi, shuning uchun
+        har bir sahifa butun kutubxonani emas, faqat kerakli yo'lni o'qiydi"""
+        try:
+            with os.scandir(directory) as entries:
+                # Papka kalitidagi '/' tartibni belgilaydi: 'a-b' < 'a/' < 'a0'
+                items = sorted((base + entry.name + ('/' if entry.is_dir() else ''), entry) for entry in entries)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        for key, entry in items:
+            is_dir = key.endswith('/')
+            inside = key.startswith(prefix)
+            if not inside and not (is_dir and prefix.startswith(key)):
+                continue
+            if token is not None and key <= token and not (is_dir and token.startswith(key)):
+                continue
+            if is_dir:
+                if inside and (token is None or key > token):
+                    yield key, 0, 'dir'
+                yield from self._scan(entry.path, key, prefix, token)
+            elif not (entry.name.startswith('.') and entry.name.endswith(self.partial_suffix)):
+                try:
+                    stat_result = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield key, stat_result.st_size, f"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+
+    def walk(self, prefix=''):
+        """prefix ostidagi barcha obyektlar (sahifama-sahifa o'qiladi)"""
+        token = None
+        while True:
+            page, token = self.list(prefix, token)
+            yield from page
+            if token is None:
+                return
+
+
+class S3Storage(LocalStorage):
+    """S3 ga mos ombor; mahalliy papka - o'qish keshi.
+    Yozish va o'chirish avval omborda, keyin diskda bajariladi."""
+    shared = True
+
+    def __init__(self, root, bucket, prefix='', endpoint_url=None, region=None, partial_suffix='.part'):
+        if boto3 is None:
+            raise RuntimeError("S3 ombori uchun boto3 o'rnatilishi kerak")
+        super().__init__(root, partial_suffix)
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        # Kirish kalitlari boto3 ning odatiy manbalaridan olinadi (AWS_* muhit o'zgaruvchilari va h.k.)
+        self.client = boto3.client(
+            's3', endpoint_url=endpoint_url or None, region_name=region or None,
+            config=Config(retries={'max_attempts': 5, 'mode': 'standard'}, max_pool_connections=16)
+        )
+
+    def _object(self, key):
+        return self.prefix + key
+
+    def _delete_objects(self, names):
+        for start in range(0, len(names), DELETE_BATCH):
+            batch = names[start:start + DELETE_BATCH]
+            self.client.delete_objects(
+                Bucket=self.bucket, Delete={'Objects': [{'Key': name} for name in batch], 'Quiet': True}
+            )
+
+    def _tree(self, key):
+        """Kalitning o'zi va (papka bo'lsa) ichidagi obyektlar nomlari"""
+        names = [self._object(key)]
+        names += [self._object(name) for name, _, _ in self.walk(key + '/')]
+        return names
+
+    def mark_folder(self, key):
+        # S3 da papka yo'q: bo'sh papka ham ko'rinishi uchun 'kalit/' belgisi qo'yiladi
+        return self.client.put_object(Bucket=self.bucket, Key=self._object(key) + '/', Body=b'')['ETag']
+
+    def delete(self, key):
+        self._delete_objects(self._tree(key))
+        try:
+            super().delete(key)
+        except FileNotFoundError:
+            pass
+
+    def rename(self, old_key, new_key):
+        old_name = self._object(old_key)
+        names = self._tree(old_key)
+        for name in names:
+            source = {'Bucket': self.bucket, 'Key': name}
+            try:
+                # client.copy katta obyektlarni qismlab (multipart) nusxalaydi
+                self.client.copy(source, self.bucket, self._object(new_key) + name[len(old_name):])
+            except ClientError as error:
+                # Faylning o'zi yo'q (bu papka) - ichidagilar nusxalanadi
+                if error.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey'):
+                    raise
+        self._delete_objects(names)
+        super().rename(old_key, new_key)
+
+    def put(self, key, progress=None):
+        """Faylni omborga yuklash: katta fayllar bo'laklab (multipart).
+        Qaytaradi: obyekt ETag i"""
+        path = self.path(key)
+        name = self._object(key)
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            if size <= MULTIPART_CHUNK:
+                response = self.client.put_object(Bucket=self.bucket, Key=name, Body=f)
+                if progress:
+                    progress(size, size)
+                return response['ETag']
+            upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=name)['UploadId']
+            try:
+                parts = []
+                sent = 0
+                for number in itertools.count(1):
+                    chunk = f.read(MULTIPART_CHUNK)
+                    if not chunk:
+                        break
+                    response = self.client.upload_part(
+                        Bucket=self.bucket, Key=name, PartNumber=number, UploadId=upload_id, Body=chunk
+                    )
+                    parts.append({'PartNumber': number, 'ETag': response['ETag']})
+                    sent += len(chunk)
+                    if progress:
+                        progress(sent, size)
+                response = self.client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=name, UploadId=upload_id, MultipartUpload={'Parts': parts}
+                )
+                return response['ETag']
+            except Exception:
+                # Tugallanmagan bo'laklar omborda joy egallab qolmasin
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=name, UploadId=upload_id)
+                raise
+
+    def pull(self, key):
+        """Obyektni ombordan diskka oqim bilan yuklab olish (vaqtinchalik fayl + rename).
+        Qaytaradi: ETag"""
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object(key))
+        except ClientError as error:
+            if error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(key)
+            raise
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix=self.partial_suffix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response['Body'].iter_chunks(READ_CHUNK):
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return response['ETag']
+
+    def fetch(self, key):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            self.pull(key)
+        return path
+
+    def list(self, prefix='', token=None, page_size=1000):
+        params = {'Bucket': self.bucket, 'Prefix': self._object(prefix), 'MaxKeys': page_size}
+        if token:
+            params['ContinuationToken'] = token
+        response = self.client.list_objects_v2(**params)
+        page = [
+            (item['Key'][len(self.prefix):], item['Size'], item['ETag'])
+            for item in response.get('Contents', [])
+            if len(item['Key']) > len(self.prefix)
+        ]
+        return page, (response.get('NextContinuationToken') if response.get('IsTruncated') else None)
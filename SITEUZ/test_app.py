@@ -0,0 +1,418 @@
+# app.py uchun testlar (SITEUZ papkasida: python -m pytest -q).
+# Ilova har bir test moduli uchun vaqtinchalik papkada yuklanadi, shuning
+# uchun haqiqiy yuklangan_fayllar va baza.sqlite3 ga tegilmaydi.
+import email.message
+import importlib.util
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    """Ilova moduli (yuklab olish serveri tasodifiy portda)"""
+    previous = os.getcwd()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp('siteuz'))
+        patch.syspath_prepend(HERE)
+        patch.setenv('SITEUZ_DOWNLOAD_URL', 'http://127.0.0.1')
+        patch.setenv('SITEUZ_DOWNLOAD_PORT', '0')
+        patch.setenv('SITEUZ_METRICS_TOKEN', 'maxfiy')
+        spec = importlib.util.spec_from_file_location('siteuz_app', os.path.join(HERE, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        yield module
+    os.chdir(previous)
+
+
+def _put_file(app, key, data):
+    """Diskka fayl yozib katalogga qo'shish"""
+    path = os.path.join(app.UPLOAD_FOLDER, *key.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    app.catalog_update(os.path.dirname(path))
+    return path
+
+
+def _request(app, path, method='GET', headers=None):
+    """Yuklab olish serveriga so'rov: (status, tana)"""
+    port = app._download_server().server_address[1]
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+
+
+def _downloads(app, key, expected):
+    """Yuklashlar soni (server hisobni javobdan keyin yozadi - biroz kutiladi)"""
+    deadline = time.monotonic() + 2
+    while app.load_stats().get(key, 0) != expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return app.load_stats().get(key, 0)
+
+
+def test_download_server_counts_full_get_once(app):
+    data = os.urandom(100_000)
+    _put_file(app, 'http/toliq.bin', data)
+    assert _request(app, '/f/http/toliq.bin') == (200, data)
+    assert _downloads(app, 'http/toliq.bin', 1) == 1
+
+
+def test_download_server_does_not_count_suffix_range(app):
+    data = os.urandom(10_000)
+    _put_file(app, 'http/oxiri.bin', data)
+    assert _request(app, '/f/http/oxiri.bin', headers={'Range': 'bytes=-100'}) == (206, data[-100:])
+    assert _downloads(app, 'http/oxiri.bin', 0) == 0
+    # Qolgan qismi davom ettirib olinsa - bitta yuklash
+    assert _request(app, '/f/http/oxiri.bin', headers={'Range': 'bytes=0-9899'}) == (206, data[:9900])
+    assert _downloads(app, 'http/oxiri.bin', 1) == 1
+
+
+def test_download_server_does_not_count_head(app):
+    _put_file(app, 'http/bosh.bin', b'x' * 1000)
+    status, body = _request(app, '/f/http/bosh.bin', method='HEAD')
+    assert (status, body) == (200, b'')
+    assert _downloads(app, 'http/bosh.bin', 0) == 0
+
+
+def test_download_server_counts_empty_file(app):
+    _put_file(app, 'http/bosh_fayl.txt', b'')
+    assert _request(app, '/f/http/bosh_fayl.txt') == (200, b'')
+    assert _downloads(app, 'http/bosh_fayl.txt', 1) == 1
+
+
+def test_download_client_ignores_spoofed_forwarded_for(app, monkeypatch):
+    handler = app._DownloadHandler.__new__(app._DownloadHandler)
+    handler.client_address = ('127.0.0.1', 5000)
+    handler.headers = email.message.Message()
+    handler.headers['X-Forwarded-For'] = '6.6.6.6, 10.0.0.7'
+    assert handler._client() == '127.0.0.1'
+    monkeypatch.setattr(app, 'DOWNLOAD_TRUST_PROXY', True)
+    assert handler._client() == '10.0.0.7'
+
+
+def test_metrics_require_token(app):
+    assert _request(app, '/metrics')[0] == 404
+    assert _request(app, '/metrics', headers={'Authorization': 'Bearer notogri'})[0] == 404
+    status, body = _request(app, '/metrics', headers={'Authorization': 'Bearer maxfiy'})
+    assert status == 200 and b'siteuz_' in body
+
+
+class _DoneExecutor:
+    """Vazifani darhol bajarib, tugagan Future qaytaradigan hovuz"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_schedule_previews_with_finished_future(app, monkeypatch):
+    path = _put_file(app, 'korinish/tayyor.txt', b'yurak anatomiyasi ' * 20)
+    worker = app._preview_worker()
+    monkeypatch.setitem(worker, 'executor', _DoneExecutor())
+    thread = threading.Thread(target=app.schedule_previews, args=([path],), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), "schedule_previews qulfda qotib qoldi"
+    assert not worker['pending']
+    assert app.get_preview(path)['excerpt'].startswith('yurak anatomiyasi')
+
+
+def test_preview_and_zip_reads_skip_hot_cache(app):
+    path = _put_file(app, 'arxiv/bir.txt', b'jigar ' * 50)
+    app.schedule_previews([path])
+    deadline = time.monotonic() + 60
+    while app.get_preview(path) is None and time.monotonic() < deadline:
+        time.sleep(0.1)
+    before = app.hot_cache_stats()
+    assert app.get_preview(path) is not None
+    assert app.read_folder_zip(os.path.dirname(path))[:2] == b'PK'
+    assert app.hot_cache_stats() == before
+
+
+def _forget_hashes(app, key):
+    """Fayl hech qachon indekslanmagandek: saqlangan xeshlarini o'chirish"""
+    with app._transaction() as conn:
+        for table in ('content_docs', 'preview_index', 'file_blobs'):
+            conn.execute(f"DELETE FROM {table} WHERE path = ?", (key,))
+
+
+def _move(app, old_key, new_key):
+    """Faylni ilovadan tashqarida ko'chirish (mv) va katalogni yangilash"""
+    target = os.path.join(app.UPLOAD_FOLDER, *new_key.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(os.path.join(app.UPLOAD_FOLDER, *old_key.split('/')), target)
+    app.reconcile_catalog()
+
+
+def test_compaction_rehomes_moved_unindexed_file(app):
+    path = _put_file(app, 'anatomiya/anat 200.docx', b'docx ' * 400)
+    app.save_comment(path, 'yaxshi qo\'llanma')
+    for _ in range(17):
+        app.register_download(path)
+    app.flush_download_stats()
+    _move(app, 'anatomiya/anat 200.docx', 'anatomiya/2-kurs/anat 200.docx')
+    _forget_hashes(app, 'anatomiya/anat 200.docx')
+
+    report = app.compact_stores()
+    assert report['rehomed'] == 1
+    new_path = os.path.join(app.UPLOAD_FOLDER, 'anatomiya', '2-kurs', 'anat 200.docx')
+    assert app.get_comment(new_path) == 'yaxshi qo\'llanma'
+    assert app.load_stats().get('anatomiya/2-kurs/anat 200.docx') == 17
+    assert 'anatomiya/anat 200.docx' not in app.load_stats()
+
+
+def _rows(app, key):
+    """Kalitga tegishli izoh va statistika jadvallari"""
+    return {
+        table for table in ('comments', 'downloads', 'views', 'downloads_daily', 'stats_buckets')
+        if app._db().execute(f"SELECT 1 FROM {table} WHERE path = ?", (key,)).fetchone()
+    }
+
+
+def test_compaction_keeps_rows_with_ambiguous_candidates(app):
+    path = _put_file(app, 'fiziologiya/test.pdf', b'birinchi')
+    app.save_comment(path, 'izoh')
+    other = _put_file(app, 'fiziologiya/b/test.pdf', b'ikkinchi')
+    # Nomi, hajmi va mtime i bir xil, tarkibi boshqa
+    os.utime(other, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns))
+    app.catalog_update(other)
+    _move(app, 'fiziologiya/test.pdf', 'fiziologiya/a/test.pdf')
+    _forget_hashes(app, 'fiziologiya/test.pdf')
+
+    assert app.compact_stores()['rehomed'] == 0
+    # Qaysi biri ko'chirilgani noma'lum - izoh hozircha o'chirilmaydi
+    assert app.get_comment(path) == 'izoh'
+
+    # Ushlab turish muddati o'tgach o'chiriladi
+    app._db().execute(
+        "UPDATE removed_files SET removed = removed - ? WHERE path = 'fiziologiya/test.pdf'",
+        ((app.ORPHAN_HOLD_DAYS + 1) * 86400,)
+    )
+    assert app.compact_stores()['pruned'].get('comments') == 1
+    assert app.get_comment(path) == ''
+    assert not app._db().execute("SELECT 1 FROM removed_files").fetchone()
+
+
+def test_deleted_file_stats_are_not_moved_to_same_name_file(app):
+    path = _put_file(app, 'anatomiya/1-mavzu.docx', b'anatomiya darsi')
+    other = _put_file(app, 'fiziologiya/1-mavzu.docx', b'fiziologiya...')
+    os.utime(other, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns))
+    app.catalog_update(other)
+    app.save_comment(path, 'izoh')
+    for _ in range(40):
+        app.register_download(path)
+    app.flush_download_stats()
+    app.record_view(path)
+    app.rollup_events()
+    # Buferda qolgan yuklash ham o'chirilgan kalit ostida yozilmasligi kerak
+    app.register_download(path)
+
+    assert app.delete_item(os.path.dirname(path), '1-mavzu.docx')
+    assert _rows(app, 'anatomiya/1-mavzu.docx') == set()
+    assert app.compact_stores()['rehomed'] == 0
+    assert app.get_comment(other) == ''
+    assert 'fiziologiya/1-mavzu.docx' not in app.load_stats()
+    assert _rows(app, 'anatomiya/1-mavzu.docx') == set()
+
+
+def test_bulk_delete_removes_comments_and_stats(app):
+    path = _put_file(app, 'ochirish/papka/x.pdf', b'x')
+    _put_file(app, 'ochirish/y.pdf', b'y')
+    for key in ('ochirish/papka/x.pdf', 'ochirish/y.pdf'):
+        app.save_comment(os.path.join(app.UPLOAD_FOLDER, *key.split('/')), 'izoh')
+        app.register_download(os.path.join(app.UPLOAD_FOLDER, *key.split('/')))
+    app.flush_download_stats()
+
+    folder = os.path.dirname(os.path.dirname(path))
+    assert app.bulk_apply(folder, ['papka', 'y.pdf'], 'delete') == (2, [])
+    assert _rows(app, 'ochirish/papka/x.pdf') == set()
+    assert _rows(app, 'ochirish/y.pdf') == set()
+    assert app.compact_stores()['rehomed'] == 0
+
+
+class _Upload:
+    """Streamlit UploadedFile o'rnini bosuvchi obyekt"""
+
+    def __init__(self, name, data):
+        self.name, self.data, self.size, self.position = name, data, len(data), 0
+
+    def seek(self, position):
+        self.position = position
+
+    def read(self, size=-1):
+        end = len(self.data) if size < 0 else self.position + size
+        chunk = self.data[self.position:end]
+        self.position += len(chunk)
+        return chunk
+
+
+def _upload(app, folder, name, data):
+    """Ilova orqali yuklash (dedup ombori bilan)"""
+    path = os.path.join(app.UPLOAD_FOLDER, *folder.split('/'))
+    if not os.path.isdir(path):
+        os.makedirs(path)
+        app.reconcile_catalog()
+    app.save_uploaded_file(_Upload(name, data), path)
+    return os.path.join(path, name)
+
+
+def _blob_sha(app, key):
+    row = app._db().execute("SELECT sha256 FROM file_blobs WHERE path = ?", (key,)).fetchone()
+    return row and row[0]
+
+
+def test_in_place_overwrite_of_deduplicated_file_is_detected(app):
+    original = b'asl tarkib ' * 100
+    first = _upload(app, 'blob/a', 'kitob.pdf', original)
+    _upload(app, 'blob/b', 'kitob.pdf', original)
+    old_sha = _blob_sha(app, 'blob/a/kitob.pdf')
+    assert old_sha == _blob_sha(app, 'blob/b/kitob.pdf')
+    if os.name == 'posix':
+        assert not os.stat(first).st_mode & 0o222
+
+    # cp/scp bilan joyida qayta yozish (root faqat o'qish belgisiga qaramaydi)
+    os.chmod(first, 0o644)
+    with open(first, 'r+b') as f:
+        f.write(b'BUZILGAN')
+    app._sync_folder('blob/a')
+
+    new_sha = _blob_sha(app, 'blob/a/kitob.pdf')
+    assert new_sha != old_sha and new_sha == _blob_sha(app, 'blob/b/kitob.pdf')
+    assert not app._db().execute("SELECT 1 FROM blobs WHERE sha256 = ?", (old_sha,)).fetchone()
+    # Asl tarkib qayta yuklansa buzilgan nusxaga bog'lanmaydi
+    again = _upload(app, 'blob/c', 'kitob.pdf', original)
+    with open(again, 'rb') as f:
+        assert f.read() == original
+    assert _blob_sha(app, 'blob/c/kitob.pdf') == old_sha
+
+
+def test_replaced_file_is_detached_from_blob(app):
+    path = _upload(app, 'blob/d', 'daftar.pdf', b'daftar ' * 50)
+    os.remove(path)
+    with open(path, 'wb') as f:
+        f.write(b'yangi fayl')
+    app._sync_folder('blob/d')
+    assert _blob_sha(app, 'blob/d/daftar.pdf') is None
+
+
+def _logged_views(app, key):
+    """Voqealar jurnalidagi (hali yig'ilmagan) ko'rishlar soni"""
+    total = 0
+    for name in os.listdir(app.EVENT_LOG_FOLDER):
+        if name.endswith('.log'):
+            with open(os.path.join(app.EVENT_LOG_FOLDER, name), encoding='utf-8') as f:
+                total += sum(line.rstrip('\n').split('\t')[1:] == ['v', key] for line in f)
+    return total
+
+
+def test_view_is_recorded_when_preview_is_opened(app):
+    path = _put_file(app, 'korish/mavzu.txt', b'nerv tizimi')
+    assert _logged_views(app, 'korish/mavzu.txt') == 0
+    app._toggle_preview(path)
+    app._toggle_preview(path)
+    app._toggle_preview(path)
+    # Sessiyada bir marta hisoblanadi, yopish ko'rish emas
+    assert _logged_views(app, 'korish/mavzu.txt') == 1
+
+
+def test_in_memory_folder_zip_is_size_capped(app, monkeypatch):
+    path = _put_file(app, 'katta/fayl.bin', b'0' * 5000)
+    monkeypatch.setattr(app, 'ZIP_INLINE_MAX_BYTES', 4096)
+    with pytest.raises(ValueError):
+        app.read_folder_zip(os.path.dirname(path))
+    monkeypatch.setattr(app, 'ZIP_INLINE_MAX_BYTES', 10_000)
+    assert app.read_folder_zip(os.path.dirname(path))[:2] == b'PK'
+
+
+@pytest.fixture
+def s3_app(app, tmp_path, monkeypatch):
+    """Ilova S3 rejimida (moto); ikkinchi server o'rnida alohida S3Storage"""
+    pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+    for name, value in (('AWS_ACCESS_KEY_ID', 'test'), ('AWS_SECRET_ACCESS_KEY', 'test'), ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(name, value)
+    for name, value in (('STORAGE_BACKEND', 's3'), ('STORAGE_S3_BUCKET', 'kutubxona'), ('STORAGE_S3_PREFIX', 'lib'), ('STORAGE_S3_REGION', 'us-east-1')):
+        monkeypatch.setattr(app, name, value)
+    # Fon sinxronlash oqimi test natijalariga aralashmasin
+    monkeypatch.setattr(app, '_storage_sync_loop', lambda: None)
+    with moto.mock_aws():
+        app._storage.clear()
+        backend = app._storage()
+        backend.client.create_bucket(Bucket='kutubxona')
+        other = app.storage.S3Storage(str(tmp_path / 'boshqa_server'), 'kutubxona', prefix='lib', region='us-east-1')
+        yield app, backend, other
+        app._storage.clear()
+
+
+def test_sync_storage_pull_push_delete(s3_app):
+    app, backend, other = s3_app
+    assert app.create_folder(app.UPLOAD_FOLDER, 'sinx')
+    app.reconcile_catalog()
+    _upload(app, 'sinx', 'kitob.pdf', b'kitob ' * 100)
+    assert {'sinx/', 'sinx/kitob.pdf'} <= {key for key, _, _ in backend.walk('sinx')}
+    app.sync_storage()
+
+    # Boshqa server: yangi fayl qo'shadi va kitob.pdf ni o'chiradi
+    folder = os.path.join(other.root, 'sinx')
+    os.makedirs(folder)
+    with open(os.path.join(folder, 'yangi.txt'), 'wb') as f:
+        f.write(b'salom')
+    other.put('sinx/yangi.txt')
+    other.delete('sinx/kitob.pdf')
+    pulled, _, deleted = app.sync_storage()
+    assert pulled >= 1 and deleted >= 1
+    local = os.path.join(app.UPLOAD_FOLDER, 'sinx')
+    assert sorted(os.listdir(local)) == ['yangi.txt']
+    catalog = {key for (key,) in app._db().execute("SELECT path FROM catalog WHERE path LIKE 'sinx/%'")}
+    assert catalog == {'sinx/yangi.txt'}
+
+    # Faqat shu serverda paydo bo'lgan fayl omborga yuboriladi
+    _put_file(app, 'sinx/mahalliy.txt', b'mahalliy')
+    _, pushed, _ = app.sync_storage()
+    assert pushed >= 1
+    assert {key for key, _, _ in backend.walk('sinx')} == {'sinx/', 'sinx/yangi.txt', 'sinx/mahalliy.txt'}
+    assert app.sync_storage() == (0, 0, 0)
+
+    # O'qishda diskda yo'q fayl ombordan olinadi
+    os.remove(os.path.join(local, 'yangi.txt'))
+    assert app.read_file_bytes(os.path.join(local, 'yangi.txt')) == b'salom'
+
+
+def test_bulk_apply_reports_skipped_items(app):
+    folder = os.path.dirname(_put_file(app, 'ommaviy/a.txt', b'a'))
+    _put_file(app, 'ommaviy/b.txt', b'b')
+    _put_file(app, 'ommaviy/c.txt', b'c')
+    done, skipped = app.bulk_apply(folder, ['a.txt', 'b.txt', 'yoq.txt'], 'rename', value='c{ext}')
+    assert done == 0
+    assert skipped == [('a.txt', 'bulk_err_exists'), ('b.txt', 'bulk_err_exists'), ('yoq.txt', 'bulk_err_missing')]
+    done, skipped = app.bulk_apply(folder, ['a.txt', 'b.txt'], 'rename', value='{n}_{name}')
+    assert (done, skipped) == (2, [])
+    assert sorted(os.listdir(folder)) == ['1_a.txt', '2_b.txt', 'c.txt']
+
+
+def test_bulk_apply_raises_when_metadata_update_fails(app, monkeypatch):
+    path = _put_file(app, 'ommaviy2/d.txt', b'd')
+    app.save_comment(path, 'izoh')
+
+    def broken(*args, **kwargs):
+        raise app.sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(app, '_rekey_paths', broken)
+    with pytest.raises(RuntimeError, match='database is locked'):
+        app.bulk_apply(os.path.dirname(path), ['d.txt'], 'rename', value='e.txt')
+    # Fayl ko'chgan, katalog diskka moslashtirilgan
+    catalog = {key for (key,) in app._db().execute("SELECT path FROM catalog WHERE path LIKE 'ommaviy2/%'")}
+    assert catalog == {'ommaviy2/e.txt'}
@@ -0,0 +1,98 @@
+# storage.py uchun testlar (SITEUZ papkasida: python -m pytest -q).
+# S3Storage testlari moto ning xotiradagi S3 i bilan ishlaydi va boto3/moto
+# o'rnatilmagan bo'lsa o'tkazib yuboriladi.
+import os
+
+import pytest
+
+import storage
+
+
+def _write(root, key, data=b'x'):
+    path = os.path.join(root, *key.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _all_pages(backend, prefix='', page_size=2):
+    """Barcha sahifalar ketma-ket (token bilan)"""
+    keys, token = [], None
+    while True:
+        page, token = backend.list(prefix, token, page_size)
+        keys += [key for key, _, _ in page]
+        if token is None:
+            return keys
+
+
+def test_local_list_pages_in_key_order(tmp_path):
+    root = str(tmp_path)
+    for key in ('a-b.txt', 'a/x.txt', 'a/y/z.txt', 'a0.txt', 'b/c.txt', 'b/.c.txt.part'):
+        _write(root, key)
+    os.makedirs(os.path.join(root, 'bosh'))
+    backend = storage.LocalStorage(root)
+    expected = ['a-b.txt', 'a/', 'a/x.txt', 'a/y/', 'a/y/z.txt', 'a0.txt', 'b/', 'b/c.txt', 'bosh/']
+    assert sorted(expected) == expected
+    assert [key for key, _, _ in backend.walk()] == expected
+    for page_size in (1, 2, 3, 100):
+        assert _all_pages(backend, page_size=page_size) == expected
+    assert _all_pages(backend, 'a/') == ['a/', 'a/x.txt', 'a/y/', 'a/y/z.txt']
+    assert _all_pages(backend, 'a/y') == ['a/y/', 'a/y/z.txt']
+    assert _all_pages(backend, 'yoq/') == []
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    """Bo'sh bucket li S3Storage (moto)"""
+    pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+    for name, value in (('AWS_ACCESS_KEY_ID', 'test'), ('AWS_SECRET_ACCESS_KEY', 'test'), ('AWS_DEFAULT_REGION', 'us-east-1')):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        backend = storage.S3Storage(str(tmp_path / 'kesh'), 'kutubxona', prefix='lib', region='us-east-1')
+        backend.client.create_bucket(Bucket='kutubxona')
+        yield backend
+
+
+def _remote(backend, prefix=''):
+    return [key for key, _, _ in backend.walk(prefix)]
+
+
+def test_s3_multipart_put_and_pull(s3):
+    data = os.urandom(storage.MULTIPART_CHUNK + 1024 * 1024)
+    _write(s3.root, 'katta/kitob.pdf', data)
+    progress = []
+    etag = s3.put('katta/kitob.pdf', progress=lambda sent, total: progress.append(sent))
+    # Ikki bo'lakli multipart yuklash ETag i '-2' bilan tugaydi
+    assert etag.strip('"').endswith('-2')
+    assert progress == [storage.MULTIPART_CHUNK, len(data)]
+    os.remove(s3.path('katta/kitob.pdf'))
+    assert s3.pull('katta/kitob.pdf') == etag
+    with open(s3.path('katta/kitob.pdf'), 'rb') as f:
+        assert f.read() == data
+    with pytest.raises(FileNotFoundError):
+        s3.pull('yoq.pdf')
+
+
+def test_s3_rename_and_delete_folder(s3):
+    s3.make_folder('eski')
+    for name in ('a.txt', 'b.txt'):
+        _write(s3.root, f'eski/{name}', name.encode())
+        s3.put(f'eski/{name}')
+    s3.rename('eski', 'yangi')
+    assert _remote(s3) == ['yangi/', 'yangi/a.txt', 'yangi/b.txt']
+    assert os.path.isfile(s3.path('yangi/a.txt')) and not os.path.exists(s3.path('eski'))
+    s3.delete('yangi')
+    assert _remote(s3) == []
+    assert not os.path.exists(s3.path('yangi'))
+
+
+def test_s3_list_pagination(s3):
+    keys = [f'p/{i:02}.txt' for i in range(5)]
+    for key in keys:
+        _write(s3.root, key)
+        s3.put(key)
+    page, token = s3.list('p/', page_size=2)
+    assert [key for key, _, _ in page] == keys[:2] and token
+    assert _all_pages(s3, 'p/') == keys
+    assert _remote(s3, 'p/') == keys